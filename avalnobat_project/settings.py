@@ -61,12 +61,15 @@ SITE_ID = 1
 AUTH_USER_MODEL = 'booking.CustomUser'
 
 MIDDLEWARE = [
+    "booking.middleware.RequestIdMiddleware",
     "django.middleware.security.SecurityMiddleware",
-    "whitenoise.middleware.WhiteNoiseMiddleware",
+    "booking.middleware.WhiteNoiseMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "booking.middleware.ClinicContextMiddleware",
+    "booking.profiling.ProfilerMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -89,19 +92,45 @@ TEMPLATES = [
     },
 ]
 
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    }
+}
+
+# Public pages (doctor list and profiles) are the same for every visitor; they are
+# cached for this many seconds here and by any reverse proxy in front of the site.
+PUBLIC_PAGE_CACHE_SECONDS = 60
+
 WSGI_APPLICATION = "avalnobat_project.wsgi.application"
+# Set by asgi.py: every worker runs one long-lived event loop, so async
+# clients can be pooled across requests (see booking.gateways).
+ASGI_SERVER = os.getenv('ASGI_SERVER') == '1'
 
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# SQLITE_PATH points a run (e.g. a load test) at a throwaway SQLite file instead of db.sqlite3.
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+        "NAME": os.getenv('SQLITE_PATH') or BASE_DIR / "db.sqlite3",
     }
 }
 
+# Set POSTGRES_DB (and optionally the other POSTGRES_* variables) to run on PostgreSQL,
+# e.g. for load-testing the booking flow against the production database engine.
+if os.getenv('POSTGRES_DB'):
+    DATABASES["default"] = {
+        "ENGINE": "django.db.backends.postgresql",
+        "NAME": os.getenv('POSTGRES_DB'),
+        "USER": os.getenv('POSTGRES_USER', 'postgres'),
+        "PASSWORD": os.getenv('POSTGRES_PASSWORD', ''),
+        "HOST": os.getenv('POSTGRES_HOST', 'localhost'),
+        "PORT": os.getenv('POSTGRES_PORT', '5432'),
+    }
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -123,10 +152,7 @@ AUTH_PASSWORD_VALIDATORS = [
 
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
-import jdatetime
-import locale
-
-jdatetime.set_locale('fa_IR')
+# The jdatetime locale is set in BookingConfig.ready.
 
 LANGUAGE_CODE = "fa-ir"
 
@@ -141,7 +167,21 @@ STATIC_ROOT = BASE_DIR / "staticfiles"
 STATICFILES_DIRS = [
     BASE_DIR / "static",
 ]
-STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
+
+# collectstatic writes content-hashed copies of every file (base.css ->
+# base.<hash>.css) plus gzip and brotli variants; WhiteNoise serves the hashed
+# names with a far-future, immutable Cache-Control. With DEBUG on, templates
+# keep using the plain names, so collectstatic is only needed for production.
+STORAGES = {
+    "default": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+    },
+    "staticfiles": {
+        "BACKEND": "whitenoise.storage.CompressedManifestStaticFilesStorage",
+    },
+}
+# Every reference goes through {% static %}, so the unhashed copies are not needed.
+WHITENOISE_KEEP_ONLY_HASHED_FILES = True
 
 
 # Media files (User-uploaded content)
@@ -170,12 +210,75 @@ SERVER_EMAIL = 'info@avalnobat.ir'  # این خط را هم اضافه
 #AMOOT_SMS
 AMOOT_SMS_API_TOKEN = os.getenv('AMOOT_SMS_API_TOKEN', '4BC33DCDDBF33395ABF6C9956E28943F61F2718B')
 AMOOT_SMS_API_URL='https://portal.amootsms.com/rest/SendWithPattern'
+# Pattern of the day-before reminders of `manage.py send_reminders`; while unset no reminder is sent.
+AMOOT_REMINDER_PATTERN_ID = os.getenv('AMOOT_REMINDER_PATTERN_ID')
+# Pattern of the waitlist offers (patient, doctor, time, minutes to pay, link); while unset no freed slot is offered.
+AMOOT_WAITLIST_PATTERN_ID = os.getenv('AMOOT_WAITLIST_PATTERN_ID')
 
 # Beh Pardakht Credentials
 BEH_PARDAKHT_TERMINAL_ID =  '8847660'
 BEH_PARDAKHT_USERNAME =  '8847660'
 BEH_PARDAKHT_PASSWORD = '98536755'
+BEH_PARDAKHT_WSDL_URL = 'https://bpm.shaparak.ir/pgwchannel/services/pgw?wsdl'
+BEH_PARDAKHT_START_PAY_URL = 'https://bpm.shaparak.ir/pgwchannel/startpay.mellat'
+BEH_PARDAKHT_FORCE_HTTPS_CALLBACK = True
+
+# Offline gateways: point SMS and payment at `manage.py run_fake_gateways`,
+# e.g. FAKE_GATEWAYS_URL=http://127.0.0.1:8765
+FAKE_GATEWAYS_URL = os.getenv('FAKE_GATEWAYS_URL')
+if FAKE_GATEWAYS_URL:
+    AMOOT_SMS_API_URL = f'{FAKE_GATEWAYS_URL}/rest/SendWithPattern'
+    BEH_PARDAKHT_WSDL_URL = f'{FAKE_GATEWAYS_URL}/pgwchannel/services/pgw?wsdl'
+    BEH_PARDAKHT_START_PAY_URL = f'{FAKE_GATEWAYS_URL}/pgwchannel/startpay.mellat'
+    BEH_PARDAKHT_FORCE_HTTPS_CALLBACK = False
+
+
+# JSON log lines, written off the request thread (see booking.telemetry).
+# LOG_FILE=logs/app.jsonl writes to a rotated file instead of stderr.
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'request_id': {'()': 'booking.telemetry.RequestIdFilter'},
+    },
+    'handlers': {
+        'queue': {
+            'class': 'booking.telemetry.QueuedHandler',
+            'filename': os.getenv('LOG_FILE') or None,
+            'filters': ['request_id'],
+        },
+    },
+    'root': {'handlers': ['queue'], 'level': 'WARNING'},
+    'loggers': {
+        'django': {'handlers': ['queue'], 'level': 'INFO', 'propagate': False},
+        'booking': {'handlers': ['queue'], 'level': LOG_LEVEL, 'propagate': False},
+    },
+}
 
+# Who may read /metrics (Prometheus text format).
+METRICS_ALLOWED_IPS = ('127.0.0.1', '::1')
+
+# Staff can profile a request with ?_profile=sample or ?_profile=cprofile (see booking.profiling).
+PROFILER_DIR = BASE_DIR / 'profiles'
+PROFILER_RATE_LIMIT = 20  # profiles per staff user per hour
+
+# Queries slower than this are logged with their caller and plan (see booking.slow_queries);
+# None turns the log off. Report them with `manage.py slow_queries`.
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', 200))
+SLOW_QUERY_LOG = BASE_DIR / 'logs' / 'slow_queries.jsonl'
+SLOW_QUERY_EXPLAIN_INTERVAL = 600  # seconds between plans of the same query
+
+# Generated sitemaps are kept here (see booking.sitemaps); safe to delete at any time.
+SITEMAP_CACHE_DIR = BASE_DIR / 'cache' / 'sitemaps'
+# Versions no longer current are deleted once they have not been written to for this many seconds.
+SITEMAP_CACHE_TTL = 3600
+
+# Appointments awaiting payment are cancelled after this long by `manage.py expire_holds`,
+# which should run every minute; longer than a session at the bank.
+PAYMENT_HOLD_MINUTES = 20
+# A slot freed for the waitlist is held this long for the patient it is offered to (see booking.waitlist).
+WAITLIST_OFFER_MINUTES = 30
 
 # Robots
 ROBOTS_USE_SITEMAP = True
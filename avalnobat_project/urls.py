@@ -1,20 +1,17 @@
+import re
+
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib.auth import views as auth_views
 from booking import views as booking_views
-from django.contrib.sitemaps.views import sitemap
-from booking.sitemaps import StaticViewSitemap, DoctorProfileSitemap
-
-sitemaps = {
-    'static': StaticViewSitemap,
-    'doctors': DoctorProfileSitemap,
-}
+from booking import sitemaps
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path('sitemap.xml', sitemap, {'sitemaps': sitemaps}, name='django.contrib.sitemaps.views.sitemap'),
+    path('sitemap.xml', sitemaps.index, name='sitemap_index'),
+    path('sitemap-<str:section>.xml', sitemaps.section, name=sitemaps.SECTION_URL_NAME),
     path('robots.txt', include('robots.urls')),
 
     # App URLs
@@ -33,5 +30,7 @@ urlpatterns = [
 
 # Serve media and static files during development
 if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    urlpatterns += [
+        re_path(r'^%s(?P<path>.*)$' % re.escape(settings.MEDIA_URL.lstrip('/')), booking_views.serve_media),
+    ]
     urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
\ No newline at end of file
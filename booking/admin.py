@@ -1,6 +1,106 @@
-from django.contrib import admin
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.widgets import AutocompleteSelect
 from django.contrib.auth.admin import UserAdmin
-from .models import CustomUser, Specialty, DoctorProfile, DoctorAvailability, Appointment, Review
+from django.core.paginator import Paginator
+from django.db import connection, transaction
+from django.http import HttpResponse
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.functional import cached_property
+from . import jalali
+from .models import CustomUser, Specialty, DoctorProfile, DoctorAvailability, Appointment, Review, ScheduleClosure, ScheduleOverride, ClinicEvent, ReminderLog, WaitlistEntry
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Pages an unfiltered changelist of a large table using the database's
+    estimate of its size instead of a COUNT(*) over every row. Filtered lists,
+    and tables estimated below EXACT_COUNT_LIMIT rows, are counted exactly.
+    """
+    EXACT_COUNT_LIMIT = 10000
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is not None and not query.where:
+            estimate = estimated_rows(self.object_list.model)
+            if estimate > self.EXACT_COUNT_LIMIT:
+                return estimate
+        return super().count
+
+
+def estimated_rows(model):
+    """The planner's row estimate on PostgreSQL, the largest rowid on SQLite; 0 elsewhere."""
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", [table])
+        elif connection.vendor == 'sqlite':
+            cursor.execute("SELECT MAX(rowid) FROM %s" % connection.ops.quote_name(table))
+        else:
+            return 0
+        row = cursor.fetchone()
+    return max(row[0] or 0, 0) if row else 0
+
+
+class AutocompleteFilter(admin.SimpleListFilter):
+    """
+    Filters a changelist by a foreign key through a search box that queries
+    the admin autocomplete view, instead of listing every related object in
+    the sidebar. Only the selected object is loaded. The related model admin
+    needs ``search_fields``.
+    """
+    template = 'admin/booking/autocomplete_filter.html'
+    field_name = None
+
+    def __init__(self, request, params, model, model_admin):
+        self.parameter_name = f'{self.field_name}__id__exact'
+        self.app_label = model._meta.app_label
+        self.model_name = model._meta.model_name
+        self.autocomplete_url = reverse('admin:autocomplete')
+        super().__init__(request, params, model, model_admin)
+
+    def has_output(self):
+        return True
+
+    def lookups(self, request, model_admin):
+        value = self.value()
+        if not value or not value.isdigit():
+            return ()
+        related_model = model_admin.model._meta.get_field(self.field_name).remote_field.model
+        selected = related_model._default_manager.filter(pk=value).first()
+        return ((value, str(selected)),) if selected else ()
+
+    def queryset(self, request, queryset):
+        value = self.value()
+        if not value:
+            return queryset
+        if not value.isdigit():
+            raise IncorrectLookupParameters(value)
+        return queryset.filter(**{self.parameter_name: value})
+
+
+class DoctorFilter(AutocompleteFilter):
+    title = 'پزشک'
+    field_name = 'doctor'
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+    Changelist settings for the tables that grow with every booking: no
+    COUNT(*) of the whole table, and the doctor filter as a search box.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    @property
+    def media(self):
+        autocomplete = AutocompleteSelect(DoctorAvailability._meta.get_field('doctor'), self.admin_site)
+        return super().media + autocomplete.media + forms.Media(
+            js=['admin/js/jquery.init.js', 'booking/js/admin_autocomplete_filter.js'],
+        )
 
 class CustomUserAdmin(UserAdmin):
     model = CustomUser
@@ -22,28 +122,122 @@ class DoctorProfileAdmin(admin.ModelAdmin):
     list_display = ('user', 'specialty', 'phone_number')
     search_fields = ('user__username', 'user__first_name', 'user__last_name', 'specialty__name')
     list_filter = ('specialty',)
+    list_select_related = ('user', 'specialty')
+    ordering = ('pk',)
+
+    def get_queryset(self, request):
+        # The doctor filters search here and show each result by its user's name.
+        return super().get_queryset(request).select_related('user')
 
 @admin.register(DoctorAvailability)
-class DoctorAvailabilityAdmin(admin.ModelAdmin):
+class DoctorAvailabilityAdmin(LargeTableAdmin):
     list_display = ('doctor', 'get_day_of_week_display', 'shift', 'start_time', 'end_time', 'is_active')
-    list_filter = ('doctor', 'day_of_week', 'shift', 'is_active')
+    list_filter = (DoctorFilter, 'day_of_week', 'shift', 'is_active')
     search_fields = ('doctor__user__username',)
+    list_select_related = ('doctor__user',)
+    autocomplete_fields = ('doctor',)
 
     def get_day_of_week_display(self, obj):
         return obj.get_day_of_week_display()
     get_day_of_week_display.short_description = 'روز هفته'
 
 @admin.register(Appointment)
-class AppointmentAdmin(admin.ModelAdmin):
+class AppointmentAdmin(LargeTableAdmin):
     list_display = ('patient_name', 'doctor', 'appointment_datetime', 'status')
-    list_filter = ('status', 'doctor', 'appointment_datetime')
-    search_fields = ('patient_name', 'doctor__user__username', 'patient__username')
-    date_hierarchy = 'appointment_datetime'
+    list_filter = ('status', DoctorFilter, 'appointment_datetime')
+    list_select_related = ('doctor__user',)
+    # Exact and prefix matches, which the indexes on these columns can answer.
+    search_fields = ('=patient_phone', '=patient_national_id', '^patient_name')
+    autocomplete_fields = ('doctor', 'patient')
+    actions = ('cancel_appointments', 'mark_visited', 'export_xlsx')
+
+    def _set_status(self, queryset, status):
+        # Saved one by one so the signals refresh the slot index and publish clinic events.
+        count = 0
+        with transaction.atomic():
+            for appointment in queryset.select_for_update():
+                appointment.status = status
+                appointment.save(update_fields=['status'])
+                count += 1
+        return count
+
+    @admin.action(description='لغو نوبت‌های انتخاب‌شده', permissions=['change'])
+    def cancel_appointments(self, request, queryset):
+        count = self._set_status(queryset.filter(status__in=(1, 4)), 3)
+        self.message_user(request, f'{count} نوبت لغو شد.', messages.SUCCESS)
+
+    @admin.action(description='ثبت ویزیت نوبت‌های انتخاب‌شده', permissions=['change'])
+    def mark_visited(self, request, queryset):
+        count = self._set_status(queryset.filter(status=1), 2)
+        self.message_user(request, f'{count} نوبت به عنوان ویزیت‌شده ثبت شد.', messages.SUCCESS)
+
+    @admin.action(description='خروجی اکسل نوبت‌های انتخاب‌شده', permissions=['view'])
+    def export_xlsx(self, request, queryset):
+        import openpyxl
+
+        workbook = openpyxl.Workbook(write_only=True)
+        worksheet = workbook.create_sheet('Appointments')
+        worksheet.append(['شناسه', 'پزشک', 'نام بیمار', 'کد ملی', 'شماره همراه', 'نوع بیمه', 'زمان نوبت', 'وضعیت'])
+        for appointment in queryset.select_related('doctor__user').order_by('appointment_datetime').iterator(chunk_size=2000):
+            worksheet.append([
+                appointment.pk,
+                appointment.doctor.user.get_full_name(),
+                appointment.patient_name,
+                appointment.patient_national_id,
+                appointment.patient_phone,
+                appointment.get_insurance_type_display(),
+                jalali.format_date(timezone.localtime(appointment.appointment_datetime), '%Y/%m/%d %H:%M'),
+                appointment.get_status_display(),
+            ])
+        response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+        response['Content-Disposition'] = 'attachment; filename=appointments.xlsx'
+        workbook.save(response)
+        return response
 
 @admin.register(Review)
-class ReviewAdmin(admin.ModelAdmin):
+class ReviewAdmin(LargeTableAdmin):
     list_display = ('appointment', 'rating')
     list_filter = ('rating',)
-    search_fields = ('appointment__patient_name',)
+    list_select_related = ('appointment__doctor__user',)
+    search_fields = ('^appointment__patient_name',)
+    raw_id_fields = ('appointment',)
+
+@admin.register(ScheduleClosure)
+class ScheduleClosureAdmin(LargeTableAdmin):
+    list_display = ('doctor', 'start', 'end', 'reason')
+    list_filter = (DoctorFilter,)
+    list_select_related = ('doctor__user',)
+    autocomplete_fields = ('doctor',)
+    date_hierarchy = 'start'
+
+@admin.register(ScheduleOverride)
+class ScheduleOverrideAdmin(LargeTableAdmin):
+    list_display = ('doctor', 'date', 'shift', 'start_time', 'end_time', 'visit_count')
+    list_filter = (DoctorFilter, 'shift')
+    list_select_related = ('doctor__user',)
+    autocomplete_fields = ('doctor',)
+    date_hierarchy = 'date'
+
+@admin.register(ClinicEvent)
+class ClinicEventAdmin(LargeTableAdmin):
+    list_display = ('doctor', 'kind', 'appointment_id', 'created_at')
+    list_filter = ('kind', DoctorFilter, 'created_at')
+    list_select_related = ('doctor__user',)
+    raw_id_fields = ('doctor',)
+
+@admin.register(ReminderLog)
+class ReminderLogAdmin(LargeTableAdmin):
+    list_display = ('appointment', 'kind', 'status', 'sent_at', 'error')
+    list_filter = ('status', 'kind', 'created_at')
+    list_select_related = ('appointment__doctor__user',)
+    raw_id_fields = ('appointment',)
+
+@admin.register(WaitlistEntry)
+class WaitlistEntryAdmin(LargeTableAdmin):
+    list_display = ('patient_name', 'doctor', 'date_from', 'date_to', 'shift', 'status', 'created_at')
+    list_filter = ('status', DoctorFilter, 'shift')
+    list_select_related = ('doctor__user',)
+    search_fields = ('=patient_phone', '^patient_name')
+    raw_id_fields = ('doctor', 'patient', 'appointment')
 
 admin.site.register(CustomUser, CustomUserAdmin)
\ No newline at end of file
@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class BookingConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "booking"
+
+    def ready(self):
+        import jdatetime
+
+        from . import signals, slow_queries
+
+        # Per thread in jdatetime: this covers the main thread of the process.
+        jdatetime.set_locale('fa_IR')
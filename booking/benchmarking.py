@@ -0,0 +1,304 @@
+"""
+Synthetic clinic data and view timing helpers.
+
+Used by the ``benchmark`` management command (and the test-suite) to build a
+realistically sized clinic and time the booking hot paths through the Django
+test client.
+"""
+import datetime
+import random
+import statistics
+import time
+
+import jdatetime
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import (
+    Specialty, DoctorProfile, DoctorAvailability, Appointment, Review,
+    DailyExpense, TimeSlotException,
+)
+from .schedule import rebuild_next_slots
+
+User = get_user_model()
+
+BENCH_PREFIX = 'bench_'
+BENCH_PASSWORD = 'bench-password'
+
+FIRST_NAMES = ["علی", "مریم", "رضا", "زهرا", "حسین", "فاطمه", "محمد", "سارا", "مهدی", "نرگس"]
+LAST_NAMES = ["رضایی", "محمدی", "حسینی", "احمدی", "کریمی", "موسوی", "جعفری", "صادقی", "رحیمی", "کاظمی"]
+SPECIALTIES = ["قلب و عروق", "داخلی", "اطفال", "پوست و مو", "ارتوپدی"]
+EXPENSE_DESCRIPTIONS = ["هزینه آب و برق", "خرید لوازم مصرفی", "حقوق منشی", "اجاره مطب", "پذیرایی"]
+PAYMENT_DESCRIPTIONS = ["دریافت از پزشک", "واریز به صندوق"]
+INSURANCE_TYPES = [choice for choice, _ in Appointment.INSURANCE_CHOICES]
+WEEKLY_SHIFTS = [
+    (day, shift)
+    for day, _ in DoctorAvailability.DAY_CHOICES
+    for shift, _ in DoctorAvailability.SHIFT_CHOICES
+]
+SHIFT_HOURS = {
+    'MORNING': (datetime.time(9, 0), datetime.time(13, 0)),
+    'AFTERNOON': (datetime.time(16, 0), datetime.time(20, 0)),
+}
+
+
+def _random_phone(rng):
+    return '09' + ''.join(rng.choice('0123456789') for _ in range(9))
+
+
+def _random_national_id(rng):
+    return ''.join(rng.choice('0123456789') for _ in range(10))
+
+
+def _slot_times(target_date, availability):
+    """Yields the naive slot datetimes of one availability on one date."""
+    start = datetime.datetime.combine(target_date, availability.start_time)
+    duration = datetime.datetime.combine(target_date, availability.end_time) - start
+    if availability.visit_count <= 0:
+        return
+    interval = duration / availability.visit_count
+    for i in range(availability.visit_count):
+        yield start + interval * i
+
+
+def generate_clinic_data(doctors=5, availabilities=6, years=1, visit_count=16,
+                         fill_ratio=0.7, expenses_per_day=2, reviews=50,
+                         exceptions=20, seed=0, log=None):
+    """
+    Creates a synthetic clinic population and returns the created doctor profiles.
+
+    Every doctor gets a secretary, ``availabilities`` weekly shifts, ``years``
+    of past appointments plus ``booking_days`` of future ones, daily expenses,
+    reviews on completed visits and blocked slots in the coming weeks.
+    """
+    rng = random.Random(seed)
+    log = log or (lambda message: None)
+    today = datetime.date.today()
+    password_hash = make_password(BENCH_PASSWORD)
+    availabilities = min(availabilities, len(WEEKLY_SHIFTS))
+
+    specialties = [Specialty.objects.get_or_create(name=name)[0] for name in SPECIALTIES]
+
+    existing = User.objects.filter(username__startswith=f'{BENCH_PREFIX}doctor_').count()
+    doctor_users = User.objects.bulk_create([
+        User(
+            username=f'{BENCH_PREFIX}doctor_{existing + i}',
+            password=password_hash,
+            first_name=rng.choice(FIRST_NAMES),
+            last_name=rng.choice(LAST_NAMES),
+            user_type='DOCTOR',
+        )
+        for i in range(doctors)
+    ])
+    # bulk_create does not return primary keys on every backend.
+    doctor_users = list(User.objects.filter(username__in=[u.username for u in doctor_users]).order_by('id'))
+
+    DoctorProfile.objects.bulk_create([
+        DoctorProfile(
+            user=user,
+            specialty=rng.choice(specialties),
+            address=f'مشهد - خیابان {rng.choice(LAST_NAMES)} - پلاک {rng.randint(1, 200)}',
+            phone_number='0513' + ''.join(rng.choice('0123456789') for _ in range(7)),
+            mobile_number=_random_phone(rng),
+            biography='پزشک متخصص با سابقه طولانی.',
+            visit_fee=100000,
+            booking_days=30,
+            financial_settings_completed=True,
+        )
+        for user in doctor_users
+    ])
+    profiles = list(DoctorProfile.objects.filter(user__in=doctor_users).select_related('user').order_by('id'))
+
+    User.objects.bulk_create([
+        User(
+            username=f'{BENCH_PREFIX}secretary_{existing + i}',
+            password=password_hash,
+            user_type='SECRETARY',
+            doctor=profile,
+        )
+        for i, profile in enumerate(profiles)
+    ])
+    log(f'Created {len(profiles)} doctors with secretaries.')
+
+    availability_objs = []
+    for profile in profiles:
+        for day_of_week, shift in rng.sample(WEEKLY_SHIFTS, availabilities):
+            start_time, end_time = SHIFT_HOURS[shift]
+            availability_objs.append(DoctorAvailability(
+                doctor=profile, day_of_week=day_of_week, shift=shift,
+                start_time=start_time, end_time=end_time, visit_count=visit_count,
+            ))
+    DoctorAvailability.objects.bulk_create(availability_objs)
+    log(f'Created {len(availability_objs)} weekly availabilities.')
+
+    first_day = today - datetime.timedelta(days=int(365 * years))
+    total_appointments = 0
+    for profile in profiles:
+        weekly = {}
+        for availability in profile.availabilities.all():
+            weekly.setdefault(availability.day_of_week, []).append(availability)
+
+        appointments = []
+        expenses = []
+        day = first_day
+        last_day = today + datetime.timedelta(days=profile.booking_days)
+        while day <= last_day:
+            is_past = day < today
+            for availability in weekly.get(day.weekday(), []):
+                for slot in _slot_times(day, availability):
+                    if rng.random() > (fill_ratio if is_past else fill_ratio / 2):
+                        continue
+                    appointment = Appointment(
+                        doctor=profile,
+                        appointment_datetime=timezone.make_aware(slot),
+                        patient_name=f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+                        patient_phone=_random_phone(rng),
+                        patient_national_id=_random_national_id(rng),
+                        insurance_type=rng.choice(INSURANCE_TYPES),
+                        problem_description='شرح حال تستی',
+                    )
+                    if is_past:
+                        appointment.status = rng.choice([2, 2, 2, 2, 3])
+                        if appointment.status == 2:
+                            appointment.payment_method = rng.choice([1, 2, 2, 3, 4])
+                            appointment.visit_fee_paid = rng.choice([150000, 250000, 400000])
+                    else:
+                        appointment.status = rng.choice([1, 1, 1, 4])
+                    appointments.append(appointment)
+            if is_past or day == today:
+                for _ in range(expenses_per_day):
+                    if rng.random() < 0.2:
+                        expenses.append(DailyExpense(
+                            doctor=profile, date=day,
+                            description=rng.choice(PAYMENT_DESCRIPTIONS),
+                            amount=-rng.randint(1, 20) * 100000,
+                        ))
+                    else:
+                        expenses.append(DailyExpense(
+                            doctor=profile, date=day,
+                            description=rng.choice(EXPENSE_DESCRIPTIONS),
+                            amount=rng.randint(1, 50) * 10000,
+                        ))
+            day += datetime.timedelta(days=1)
+
+        Appointment.objects.bulk_create(appointments, batch_size=2000)
+        DailyExpense.objects.bulk_create(expenses, batch_size=2000)
+        total_appointments += len(appointments)
+
+        completed_ids = list(
+            Appointment.objects.filter(doctor=profile, status=2).values_list('id', flat=True)
+        )
+        Review.objects.bulk_create([
+            Review(appointment_id=appointment_id, rating=rng.randint(1, 5), comment='نظر تستی')
+            for appointment_id in rng.sample(completed_ids, min(reviews, len(completed_ids)))
+        ])
+
+        future_slots = [
+            timezone.make_aware(slot)
+            for offset in range(1, profile.booking_days)
+            for availability in weekly.get((today + datetime.timedelta(days=offset)).weekday(), [])
+            for slot in _slot_times(today + datetime.timedelta(days=offset), availability)
+        ]
+        TimeSlotException.objects.bulk_create([
+            TimeSlotException(doctor=profile, datetime_slot=slot)
+            for slot in rng.sample(future_slots, min(exceptions, len(future_slots)))
+        ], ignore_conflicts=True)
+
+    log(f'Created {total_appointments} appointments over {years} year(s).')
+    # bulk_create skips the signals that maintain the next-available-slot index.
+    rebuild_next_slots(profiles)
+    return profiles
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    rank = max(int(round(pct / 100 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def summarize(timings, query_counts, status_codes):
+    return {
+        'iterations': len(timings),
+        'min_ms': round(min(timings), 3),
+        'p50_ms': round(percentile(timings, 50), 3),
+        'p90_ms': round(percentile(timings, 90), 3),
+        'p95_ms': round(percentile(timings, 95), 3),
+        'p99_ms': round(percentile(timings, 99), 3),
+        'max_ms': round(max(timings), 3),
+        'mean_ms': round(statistics.fmean(timings), 3),
+        'queries': max(query_counts),
+        'status_codes': sorted(set(status_codes)),
+    }
+
+
+def next_working_day(doctor):
+    """The first date from today on which the doctor has an active shift."""
+    weekdays = set(doctor.availabilities.filter(is_active=True).values_list('day_of_week', flat=True))
+    today = datetime.date.today()
+    for offset in range(7):
+        day = today + datetime.timedelta(days=offset)
+        if day.weekday() in weekdays:
+            return day
+    return today
+
+
+def build_scenarios(doctor):
+    """
+    Returns ``(name, user, url)`` tuples for the benchmarked views.
+
+    ``user`` is the account the request is made with, or None for anonymous.
+    """
+    secretary = doctor.secretaries.first()
+    work_day = next_working_day(doctor)
+    jalali_work_day = jdatetime.date.fromgregorian(date=work_day).strftime('%Y-%m-%d')
+    busy_day = (
+        Appointment.objects.filter(doctor=doctor, status=2)
+        .values_list('appointment_datetime', flat=True).first()
+    )
+    busy_day = timezone.localtime(busy_day).date() if busy_day else datetime.date.today()
+    return [
+        ('doctor_list', None, reverse('booking:doctor_list')),
+        ('doctor_detail', None, reverse('booking:doctor_detail', kwargs={'pk': doctor.pk})),
+        ('earliest_slots', None, reverse('booking:earliest_slots') + f'?specialty={doctor.specialty_id}'),
+        ('book_appointment', None, reverse('booking:book_appointment', kwargs={'pk': doctor.pk, 'date': jalali_work_day})),
+        ('manage_day', secretary, reverse('booking:manage_day', kwargs={'date': jalali_work_day})),
+        ('secretary_panel', secretary, reverse('booking:secretary_panel')),
+        ('daily_patients', doctor.user, reverse('booking:daily_patients', kwargs={'date': busy_day.strftime('%Y-%m-%d')})),
+        ('secretary_payments', secretary, reverse('booking:secretary_payments', kwargs={'date': busy_day.strftime('%Y-%m-%d')})),
+        ('financial_report_daily', doctor.user, reverse('booking:financial_report', kwargs={'period': 'daily', 'date': busy_day.strftime('%Y-%m-%d')})),
+        ('financial_report_yearly', doctor.user, reverse('booking:financial_report', kwargs={'period': 'yearly', 'date': busy_day.strftime('%Y-%m-%d')})),
+        ('export_patients_to_excel', doctor.user, reverse('booking:export_patients_to_excel')),
+        ('export_expenses_to_excel', doctor.user, reverse('booking:export_expenses_to_excel')),
+    ]
+
+
+def run_scenarios(scenarios, iterations=20, warmup=2, only=None):
+    """
+    Times each scenario through the test client and returns a summary per scenario.
+    """
+    results = {}
+    for name, user, url in scenarios:
+        if only and name not in only:
+            continue
+        client = Client(SERVER_NAME='localhost')
+        if user is not None:
+            client.force_login(user)
+        for _ in range(warmup):
+            client.get(url)
+
+        timings, query_counts, status_codes = [], [], []
+        for _ in range(iterations):
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = client.get(url)
+                timings.append((time.perf_counter() - started) * 1000)
+            query_counts.append(len(queries))
+            status_codes.append(response.status_code)
+        results[name] = dict(url=url, **summarize(timings, query_counts, status_codes))
+    return results
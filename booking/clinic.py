@@ -0,0 +1,97 @@
+"""
+Request-scoped clinic context.
+
+``ClinicContextMiddleware`` gives every request a lazy ``request.clinic``:
+the user's role and the doctor they work for (their own profile, or the
+doctor of a secretary), loaded with its user and specialty in one query and
+kept in the cache for ``CACHE_TIMEOUT`` seconds per user. Saving the doctor
+or one of their users drops the cached contexts in the process that saved
+it; other processes pick up the change when their copy expires. The cached
+doctor is for reading: views that write load it with ``fresh_doctor``.
+"""
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+from . import fees
+from .models import DoctorProfile
+
+CACHE_TIMEOUT = 30
+
+
+def _cache_key(user_id):
+    return f'clinic-context:{user_id}'
+
+
+class ClinicContext:
+    """Who the user of a request is to the clinic."""
+
+    def __init__(self, user, role, doctor):
+        self.user = user
+        self.role = role
+        self.doctor = doctor
+
+    @property
+    def is_doctor(self):
+        return self.role == 'DOCTOR'
+
+    @property
+    def is_secretary(self):
+        return self.role == 'SECRETARY'
+
+    def fresh_doctor(self):
+        """
+        The doctor read from the database, for views that write: the cached
+        copy may be ``CACHE_TIMEOUT`` seconds old, and saving it would write
+        its stale fields back.
+        """
+        if self.doctor is None:
+            return None
+        return DoctorProfile.objects.select_related('user', 'specialty').filter(pk=self.doctor.pk).first()
+
+    @cached_property
+    def schedule_version(self):
+        # Read fresh rather than from the cached profile: calendar ETags depend on it.
+        if self.doctor is None:
+            return None
+        return DoctorProfile.objects.filter(pk=self.doctor.pk).values_list('schedule_version', flat=True).first()
+
+    @cached_property
+    def insurance_fees(self):
+        """The visit fee of the doctor per insurance type."""
+        if self.doctor is None:
+            return {}
+        return fees.fee_table(self.doctor.pk)
+
+    @classmethod
+    def for_user(cls, user):
+        if not user.is_authenticated:
+            return cls(user, None, None)
+        key = _cache_key(user.pk)
+        cached = cache.get(key)
+        if cached is None:
+            cached = {'doctor': cls._load_doctor(user)}
+            cache.set(key, cached, CACHE_TIMEOUT)
+        return cls(user, user.user_type, cached['doctor'])
+
+    @staticmethod
+    def _load_doctor(user):
+        doctors = DoctorProfile.objects.select_related('user', 'specialty')
+        if user.user_type == 'DOCTOR':
+            return doctors.filter(user=user).first()
+        if user.user_type == 'SECRETARY' and user.doctor_id:
+            return doctors.filter(pk=user.doctor_id).first()
+        return None
+
+
+def invalidate_user(user_id):
+    cache.delete(_cache_key(user_id))
+
+
+def invalidate_doctor(doctor_id):
+    """Drops the cached contexts of a doctor and their secretaries."""
+    user_ids = get_user_model().objects.filter(
+        Q(doctor_profile__pk=doctor_id) | Q(doctor_id=doctor_id),
+    ).values_list('pk', flat=True)
+    cache.delete_many([_cache_key(user_id) for user_id in user_ids])
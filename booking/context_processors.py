@@ -1,10 +1,13 @@
 def patient_session_processor(request):
-    patient_phone = request.session.get('patient_phone')
-    if patient_phone:
-        return {
-            'is_patient_logged_in': True,
-            'patient_phone': patient_phone
-        }
+    """
+    The values are callables, which templates call only when they use them, so
+    rendering a page that doesn't use them never loads the session (and the
+    response is not marked ``Vary: Cookie``).
+    """
+    def patient_phone():
+        return request.session.get('patient_phone')
+
     return {
-        'is_patient_logged_in': False
+        'is_patient_logged_in': lambda: bool(patient_phone()),
+        'patient_phone': patient_phone,
     }
@@ -1,7 +1,45 @@
+import logging
+import time
+from functools import wraps
+
+from django.conf import settings
 from django.contrib.auth.decorators import user_passes_test
+from django.views.decorators.cache import cache_control, cache_page
+
+from . import telemetry
 
 def doctor_required(function):
     return user_passes_test(lambda u: u.is_authenticated and u.user_type == 'DOCTOR')(function)
 
 def secretary_required(function):
     return user_passes_test(lambda u: u.is_authenticated and u.user_type == 'SECRETARY')(function)
+
+def public_page(function):
+    """
+    For pages that look the same to every visitor: the response is cached for
+    PUBLIC_PAGE_CACHE_SECONDS and marked public so a reverse proxy can cache it
+    too. The view must pass ``public_page`` to its template and not read
+    ``request.user`` or the session; the logged-in nav comes from session_status.
+    """
+    return cache_page(settings.PUBLIC_PAGE_CACHE_SECONDS)(cache_control(public=True)(function))
+
+def report(name):
+    """
+    Times a report or export view: the duration goes to the
+    ``avalnobat_report_seconds`` histogram and the ``booking.reports`` log.
+    """
+    logger = logging.getLogger('booking.reports')
+
+    def decorator(function):
+        @wraps(function)
+        def wrapper(request, *args, **kwargs):
+            start = time.perf_counter()
+            response = function(request, *args, **kwargs)
+            duration = time.perf_counter() - start
+            telemetry.report_seconds.observe(duration, report=name)
+            logger.info('%s built in %.0f ms', name, duration * 1000, extra={
+                'report': name, 'duration_ms': round(duration * 1000, 1), 'user_id': request.user.pk,
+            })
+            return response
+        return wrapper
+    return decorator
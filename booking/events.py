@@ -0,0 +1,149 @@
+"""
+Clinic event bus.
+
+Appointment changes are written as ``ClinicEvent`` rows once their transaction
+commits, so every process serving the site can stream them; ``stream`` turns
+them into server-sent events for one doctor. Streams in the same process are
+woken as soon as an event is published, and otherwise look at the table every
+``POLL_INTERVAL`` seconds to pick up events from other processes. Without
+ASGI a stream would hold a worker thread for its whole lifetime, so
+``pending`` answers at once and the browser polls instead.
+"""
+import asyncio
+import datetime
+import json
+import threading
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import ClinicEvent
+
+POLL_INTERVAL = 1.0
+KEEPALIVE_INTERVAL = 15.0
+STREAM_LIFETIME = 300.0
+WSGI_POLL_INTERVAL = 5.0
+BATCH_SIZE = 100
+RETENTION = datetime.timedelta(days=2)
+
+_listeners = set()
+_listeners_lock = threading.Lock()
+
+
+class _Listener:
+    """A stream waiting for events, woken from whichever thread publishes."""
+
+    def __init__(self):
+        self.loop = asyncio.get_running_loop()
+        self.event = asyncio.Event()
+
+    def wake(self):
+        self.loop.call_soon_threadsafe(self.event.set)
+
+    def __enter__(self):
+        with _listeners_lock:
+            _listeners.add(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        with _listeners_lock:
+            _listeners.discard(self)
+
+
+def _wake_listeners():
+    with _listeners_lock:
+        listeners = list(_listeners)
+    for listener in listeners:
+        try:
+            listener.wake()
+        except RuntimeError:
+            # The loop of the listener has been closed.
+            pass
+
+
+def appointment_data(appointment):
+    """What the clinic screens need to know about an appointment."""
+    moment = timezone.localtime(appointment.appointment_datetime)
+    return {
+        'date': moment.date().isoformat(),
+        'time': moment.strftime('%H:%M'),
+        'patient_name': appointment.patient_name,
+        'status': appointment.status,
+    }
+
+
+def publish(doctor_id, kind, appointment_id=None, data=None):
+    """Records an event for a doctor once the current transaction commits."""
+    def record():
+        try:
+            ClinicEvent.objects.create(doctor_id=doctor_id, kind=kind, appointment_id=appointment_id, data=data or {})
+        except IntegrityError:
+            # The doctor was deleted along with the appointment.
+            return
+        _wake_listeners()
+
+    transaction.on_commit(record)
+
+
+def latest_id(doctor_id):
+    return ClinicEvent.objects.filter(doctor_id=doctor_id).order_by('-id').values_list('id', flat=True).first() or 0
+
+
+def _preamble(retry, last_id):
+    # The id line hands the browser the position even when no event follows,
+    # so its reconnect resumes from there instead of starting at the latest event again.
+    return f"retry: {int(retry * 1000)}\nid: {last_id}\n\n"
+
+
+def format_event(event):
+    payload = dict(event.data, kind=event.kind, appointment_id=event.appointment_id)
+    return f"id: {event.pk}\nevent: {event.kind}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+async def stream(doctor_id, last_id, lifetime=STREAM_LIFETIME):
+    """
+    Yields the events of a doctor after ``last_id`` as server-sent events,
+    for ``lifetime`` seconds; the browser then reconnects with the id of the
+    last event it got, so no event is lost in between.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + lifetime
+    last_write = loop.time()
+    with _Listener() as listener:
+        yield _preamble(POLL_INTERVAL, last_id)
+        while loop.time() < deadline:
+            # Cleared before the query, so an event published while it runs still wakes the wait below.
+            listener.event.clear()
+            batch = [
+                event async for event in
+                ClinicEvent.objects.filter(doctor_id=doctor_id, id__gt=last_id).order_by('id')[:BATCH_SIZE]
+            ]
+            if batch:
+                for event in batch:
+                    yield format_event(event)
+                last_id = batch[-1].pk
+                last_write = loop.time()
+                continue
+            if loop.time() - last_write >= KEEPALIVE_INTERVAL:
+                yield ": keepalive\n\n"
+                last_write = loop.time()
+            try:
+                await asyncio.wait_for(listener.event.wait(), min(POLL_INTERVAL, max(deadline - loop.time(), 0)))
+            except asyncio.TimeoutError:
+                pass
+
+
+def pending(doctor_id, last_id):
+    """
+    The events of a doctor after ``last_id`` as one finished server-sent
+    events response; the browser reconnects, i.e. polls, after
+    ``WSGI_POLL_INTERVAL`` seconds with the id of the last event it got.
+    """
+    batch = ClinicEvent.objects.filter(doctor_id=doctor_id, id__gt=last_id).order_by('id')[:BATCH_SIZE]
+    return _preamble(WSGI_POLL_INTERVAL, last_id) + ''.join(format_event(event) for event in batch)
+
+
+def prune(older_than=RETENTION):
+    """Deletes the events older than ``older_than``; returns how many were deleted."""
+    deleted, _ = ClinicEvent.objects.filter(created_at__lt=timezone.now() - older_than).delete()
+    return deleted
@@ -0,0 +1,305 @@
+"""
+Local stand-ins for the Beh Pardakht (Mellat) SOAP gateway and the Amoot SMS API.
+
+The server speaks real HTTP, serves a WSDL that ``zeep`` parses like the
+production one, and answers bpPayRequest, bpVerifyRequest, bpSettleRequest and
+bpReversalRequest as well as Amoot's ``SendWithPattern``. It also hosts a fake
+``startpay.mellat`` page that posts the bank callback straight back to the
+site, so the whole payment flow can be exercised offline. Latency and failures
+can be injected to profile and load-test the payment and SMS paths.
+
+Run it with ``python manage.py run_fake_gateways`` and point the site at it
+with the ``FAKE_GATEWAYS_URL`` environment variable.
+"""
+import html
+import itertools
+import json
+import random
+import threading
+import time
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs
+from wsgiref.simple_server import WSGIServer, WSGIRequestHandler, make_server
+from xml.etree import ElementTree
+
+WSDL_PATH = '/pgwchannel/services/pgw'
+START_PAY_PATH = '/pgwchannel/startpay.mellat'
+SMS_PATH = '/rest/SendWithPattern'
+STATS_PATH = '/__stats__'
+
+NAMESPACE = 'http://interfaces.core.sw.bps.com/'
+SOAP_ENV = 'http://schemas.xmlsoap.org/soap/envelope/'
+
+VERIFY_FIELDS = ['terminalId', 'userName', 'userPassword', 'orderId', 'saleOrderId', 'saleReferenceId']
+OPERATIONS = {
+    'bpPayRequest': [
+        'terminalId', 'userName', 'userPassword', 'orderId', 'amount', 'localDate',
+        'localTime', 'additionalData', 'callBackUrl', 'payerId',
+    ],
+    'bpVerifyRequest': VERIFY_FIELDS,
+    'bpSettleRequest': VERIFY_FIELDS,
+    'bpReversalRequest': VERIFY_FIELDS,
+}
+LONG_FIELDS = {'terminalId', 'orderId', 'amount', 'payerId', 'saleOrderId', 'saleReferenceId'}
+
+
+def build_wsdl(location):
+    """A document/literal WSDL with the same operations and fields as the Mellat gateway."""
+    elements = []
+    messages = []
+    port_ops = []
+    binding_ops = []
+    for operation, fields in OPERATIONS.items():
+        field_xml = ''.join(
+            f'<xsd:element name="{field}" type="xsd:{"long" if field in LONG_FIELDS else "string"}"/>'
+            for field in fields
+        )
+        elements.append(
+            f'<xsd:element name="{operation}"><xsd:complexType><xsd:sequence>{field_xml}'
+            f'</xsd:sequence></xsd:complexType></xsd:element>'
+            f'<xsd:element name="{operation}Response"><xsd:complexType><xsd:sequence>'
+            f'<xsd:element name="return" type="xsd:string" minOccurs="0"/>'
+            f'</xsd:sequence></xsd:complexType></xsd:element>'
+        )
+        messages.append(
+            f'<message name="{operation}"><part name="parameters" element="tns:{operation}"/></message>'
+            f'<message name="{operation}Response"><part name="parameters" element="tns:{operation}Response"/></message>'
+        )
+        port_ops.append(
+            f'<operation name="{operation}"><input message="tns:{operation}"/>'
+            f'<output message="tns:{operation}Response"/></operation>'
+        )
+        binding_ops.append(
+            f'<operation name="{operation}"><soap:operation soapAction=""/>'
+            f'<input><soap:body use="literal"/></input><output><soap:body use="literal"/></output></operation>'
+        )
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<definitions xmlns="http://schemas.xmlsoap.org/wsdl/" '
+        'xmlns:soap="http://schemas.xmlsoap.org/wsdl/soap/" '
+        'xmlns:xsd="http://www.w3.org/2001/XMLSchema" '
+        f'xmlns:tns="{NAMESPACE}" targetNamespace="{NAMESPACE}" name="PaymentGatewayImplService">'
+        f'<types><xsd:schema targetNamespace="{NAMESPACE}">{"".join(elements)}</xsd:schema></types>'
+        f'{"".join(messages)}'
+        f'<portType name="IPaymentGateway">{"".join(port_ops)}</portType>'
+        '<binding name="PaymentGatewayImplServiceSoapBinding" type="tns:IPaymentGateway">'
+        '<soap:binding style="document" transport="http://schemas.xmlsoap.org/soap/http"/>'
+        f'{"".join(binding_ops)}</binding>'
+        '<service name="PaymentGatewayImplService">'
+        '<port name="PaymentGatewayImplPort" binding="tns:PaymentGatewayImplServiceSoapBinding">'
+        f'<soap:address location="{location}"/></port></service>'
+        '</definitions>'
+    )
+
+
+def _soap_response(operation, value):
+    return (
+        f'<?xml version="1.0" encoding="UTF-8"?><soap:Envelope xmlns:soap="{SOAP_ENV}"><soap:Body>'
+        f'<ns2:{operation}Response xmlns:ns2="{NAMESPACE}"><return>{html.escape(value)}</return>'
+        f'</ns2:{operation}Response></soap:Body></soap:Envelope>'
+    )
+
+
+def _soap_fault(message):
+    return (
+        f'<?xml version="1.0" encoding="UTF-8"?><soap:Envelope xmlns:soap="{SOAP_ENV}"><soap:Body>'
+        f'<soap:Fault><faultcode>soap:Server</faultcode><faultstring>{html.escape(message)}</faultstring>'
+        '</soap:Fault></soap:Body></soap:Envelope>'
+    )
+
+
+def _local_name(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+class FakeGatewayApp:
+    """
+    WSGI application implementing the fake gateways.
+
+    ``latency`` (seconds) is added to every SOAP and SMS call.
+    ``failure_rate`` is the probability that a SOAP call answers with the bank
+    error ``failure_code`` (or an SMS send with an Amoot error), and
+    ``fault_rate`` the probability of an HTTP 500 SOAP fault instead.
+    """
+
+    def __init__(self, latency=0.0, failure_rate=0.0, fault_rate=0.0, failure_code='34', seed=None):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.fault_rate = fault_rate
+        self.failure_code = failure_code
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._ref_ids = itertools.count(1)
+        self._reference_ids = itertools.count(100000001)
+        self.payments = {}
+        self.stats = {name: 0 for name in [*OPERATIONS, 'wsdl', 'startpay', 'sms', 'failures', 'faults']}
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def _roll(self):
+        """Returns 'fault', 'failure' or None for the current call."""
+        with self._lock:
+            roll = self._random.random()
+        if roll < self.fault_rate:
+            self._count('faults')
+            return 'fault'
+        if roll < self.fault_rate + self.failure_rate:
+            self._count('failures')
+            return 'failure'
+        return None
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        method = environ['REQUEST_METHOD']
+        if path == WSDL_PATH and method == 'GET':
+            return self.wsdl(environ, start_response)
+        if path == WSDL_PATH and method == 'POST':
+            return self.soap(environ, start_response)
+        if path == START_PAY_PATH and method == 'POST':
+            return self.start_pay(environ, start_response)
+        if path == SMS_PATH and method == 'POST':
+            return self.sms(environ, start_response)
+        if path == STATS_PATH:
+            return self._respond(start_response, '200 OK', 'application/json', json.dumps(self.stats))
+        return self._respond(start_response, '404 Not Found', 'text/plain', 'not found')
+
+    @staticmethod
+    def _respond(start_response, status, content_type, body):
+        payload = body.encode('utf-8')
+        start_response(status, [
+            ('Content-Type', f'{content_type}; charset=utf-8'),
+            ('Content-Length', str(len(payload))),
+        ])
+        return [payload]
+
+    @staticmethod
+    def _read_body(environ):
+        length = int(environ.get('CONTENT_LENGTH') or 0)
+        return environ['wsgi.input'].read(length) if length else b''
+
+    @staticmethod
+    def _base_url(environ):
+        return f"{environ.get('wsgi.url_scheme', 'http')}://{environ.get('HTTP_HOST') or environ['SERVER_NAME']}"
+
+    def wsdl(self, environ, start_response):
+        self._count('wsdl')
+        return self._respond(start_response, '200 OK', 'text/xml', build_wsdl(self._base_url(environ) + WSDL_PATH))
+
+    def soap(self, environ, start_response):
+        try:
+            envelope = ElementTree.fromstring(self._read_body(environ))
+            body = next(el for el in envelope if _local_name(el.tag) == 'Body')
+            request = next(iter(body))
+        except (ElementTree.ParseError, StopIteration):
+            return self._respond(start_response, '500 Internal Server Error', 'text/xml', _soap_fault('Malformed request'))
+
+        operation = _local_name(request.tag)
+        if operation not in OPERATIONS:
+            return self._respond(start_response, '500 Internal Server Error', 'text/xml', _soap_fault(f'Unknown operation {operation}'))
+        params = {_local_name(child.tag): (child.text or '') for child in request}
+        self._count(operation)
+        if self.latency:
+            time.sleep(self.latency)
+
+        outcome = self._roll()
+        if outcome == 'fault':
+            return self._respond(start_response, '500 Internal Server Error', 'text/xml', _soap_fault('Injected fault'))
+        if outcome == 'failure':
+            return self._respond(start_response, '200 OK', 'text/xml', _soap_response(operation, self.failure_code))
+
+        if operation == 'bpPayRequest':
+            with self._lock:
+                ref_id = f'FAKE{next(self._ref_ids):08d}'
+                self.payments[ref_id] = {
+                    'order_id': params.get('orderId'),
+                    'amount': params.get('amount'),
+                    'callback': params.get('callBackUrl'),
+                }
+            result = f'0,{ref_id}'
+        else:
+            result = '0'
+        return self._respond(start_response, '200 OK', 'text/xml', _soap_response(operation, result))
+
+    def start_pay(self, environ, start_response):
+        """Imitates the bank's payment page by posting a successful callback back to the site."""
+        self._count('startpay')
+        form = parse_qs(self._read_body(environ).decode('utf-8'))
+        ref_id = form.get('RefId', [''])[0]
+        payment = self.payments.get(ref_id)
+        if payment is None:
+            return self._respond(start_response, '404 Not Found', 'text/plain', 'unknown RefId')
+        fields = {
+            'RefId': ref_id,
+            'ResCode': '0',
+            'SaleOrderId': payment['order_id'],
+            'SaleReferenceId': str(next(self._reference_ids)),
+        }
+        inputs = ''.join(
+            f'<input type="hidden" name="{name}" value="{html.escape(value)}">' for name, value in fields.items()
+        )
+        page = (
+            '<!DOCTYPE html><html><body onload="document.forms[0].submit()">'
+            f'<p>Fake bank: paying {html.escape(payment["amount"] or "")} Rial</p>'
+            f'<form method="post" action="{html.escape(payment["callback"] or "")}">{inputs}'
+            '<button type="submit">Pay</button></form></body></html>'
+        )
+        return self._respond(start_response, '200 OK', 'text/html', page)
+
+    def sms(self, environ, start_response):
+        self._count('sms')
+        form = parse_qs(self._read_body(environ).decode('utf-8'))
+        if self.latency:
+            time.sleep(self.latency)
+        outcome = self._roll()
+        if outcome == 'fault':
+            return self._respond(start_response, '500 Internal Server Error', 'application/json', '{"Status":"Error"}')
+        if outcome == 'failure':
+            body = {'Status': 'Error', 'Code': -1, 'Message': 'Injected failure', 'Data': None}
+        else:
+            body = {
+                'Status': 'Success', 'Code': 1, 'Message': 'Sent',
+                'Data': {'Mobile': form.get('Mobile', [''])[0], 'MessageID': self.stats['sms']},
+            }
+        return self._respond(start_response, '200 OK', 'application/json', json.dumps(body))
+
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def create_server(host='127.0.0.1', port=0, quiet=True, **options):
+    """Creates (without starting) a threaded server; ``port=0`` picks a free port."""
+    return make_server(
+        host, port, FakeGatewayApp(**options),
+        server_class=ThreadingWSGIServer,
+        handler_class=_QuietHandler if quiet else WSGIRequestHandler,
+    )
+
+
+def server_url(server):
+    host, port = server.server_address[:2]
+    return f'http://{host}:{port}'
+
+
+def gateway_settings(base_url):
+    """The settings that point the site at fake gateways served from ``base_url``."""
+    return {
+        'AMOOT_SMS_API_URL': base_url + SMS_PATH,
+        'BEH_PARDAKHT_WSDL_URL': base_url + WSDL_PATH + '?wsdl',
+        'BEH_PARDAKHT_START_PAY_URL': base_url + START_PAY_PATH,
+        'BEH_PARDAKHT_FORCE_HTTPS_CALLBACK': False,
+    }
+
+
+def start_in_thread(**options):
+    """Starts a fake gateway server on a background thread and returns it."""
+    server = create_server(**options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,122 @@
+"""
+Insurance fee tables.
+
+The visit fee each doctor charges at the clinic per insurance type is read by
+every daily list but changes rarely. Tables are kept in a process-local cache
+for ``LOCAL_TIMEOUT`` seconds in front of the shared Django cache; ``set_fees``
+writes changed fees through to both and skips the ones that are unchanged.
+The online booking fee is the doctor's ``visit_fee`` and is not learned here.
+"""
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import InsuranceFee
+
+LOCAL_TIMEOUT = 30
+SHARED_TIMEOUT = 24 * 60 * 60
+# A paid fee this many times above or below the stored one is taken for a one-off, e.g. a discount.
+MAX_CHANGE_RATIO = 2
+
+_local = {}
+_local_lock = threading.Lock()
+
+
+def _cache_key(doctor_id):
+    return f'insurance-fees:{doctor_id}'
+
+
+def _local_table(doctor_id):
+    entry = _local.get(doctor_id)
+    if entry is not None and entry[0] > time.monotonic():
+        return entry[1]
+    return None
+
+
+def _remember(doctor_id, table):
+    with _local_lock:
+        _local[doctor_id] = (time.monotonic() + LOCAL_TIMEOUT, table)
+
+
+def _load(doctor_id):
+    return dict(InsuranceFee.objects.filter(doctor_id=doctor_id).values_list('insurance_type', 'fee'))
+
+
+def fee_table(doctor_id):
+    """``{insurance_type: fee}`` of a doctor; insurance types without a fee are left out."""
+    table = _local_table(doctor_id)
+    if table is None:
+        table = cache.get(_cache_key(doctor_id))
+        if table is None:
+            table = _load(doctor_id)
+            cache.set(_cache_key(doctor_id), table, SHARED_TIMEOUT)
+        _remember(doctor_id, table)
+    return table
+
+
+async def afee_table(doctor_id):
+    table = _local_table(doctor_id)
+    if table is None:
+        table = await cache.aget(_cache_key(doctor_id))
+        if table is None:
+            table = await sync_to_async(_load)(doctor_id)
+            await cache.aset(_cache_key(doctor_id), table, SHARED_TIMEOUT)
+        _remember(doctor_id, table)
+    return table
+
+
+def fee_for(doctor, insurance_type):
+    """The fee a patient with ``insurance_type`` pays the doctor; the doctor's ``visit_fee`` by default."""
+    return fee_table(doctor.pk).get(insurance_type, doctor.visit_fee)
+
+
+async def afee_for(doctor, insurance_type):
+    return (await afee_table(doctor.pk)).get(insurance_type, doctor.visit_fee)
+
+
+def _plausible(fee, stored):
+    if fee is None or fee <= 0:
+        return False
+    return stored is None or stored / MAX_CHANGE_RATIO <= fee <= stored * MAX_CHANGE_RATIO
+
+
+def set_fees(doctor_id, fees):
+    """
+    Saves ``{insurance_type: fee}`` for a doctor, writing only the fees that
+    differ from the stored ones. Free visits and fees far off the stored
+    one are left out. Returns the updated table.
+    """
+    # Compared against the shared table, which every process writes through.
+    table = cache.get(_cache_key(doctor_id))
+    if table is None:
+        table = _load(doctor_id)
+    changed = {
+        insurance_type: fee for insurance_type, fee in fees.items()
+        if _plausible(fee, table.get(insurance_type)) and table.get(insurance_type) != fee
+    }
+    if not changed:
+        return table
+
+    table = dict(table, **changed)
+    with transaction.atomic():
+        for insurance_type, fee in changed.items():
+            InsuranceFee.objects.update_or_create(doctor_id=doctor_id, insurance_type=insurance_type, defaults={'fee': fee})
+
+        def store():
+            cache.set(_cache_key(doctor_id), table, SHARED_TIMEOUT)
+            _remember(doctor_id, table)
+
+        # Until the change commits, readers fall back to the database.
+        invalidate(doctor_id)
+        transaction.on_commit(store)
+    return table
+
+
+def invalidate(doctor_id):
+    """Drops the cached table of a doctor, e.g. after it was edited in the admin."""
+    cache.delete(_cache_key(doctor_id))
+    with _local_lock:
+        _local.pop(doctor_id, None)
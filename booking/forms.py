@@ -1,7 +1,9 @@
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth import get_user_model
 from django import forms
-from .models import DoctorAvailability, Appointment, Specialty, DoctorProfile, Review
+from django.utils import timezone
+from . import jalali
+from .models import DoctorAvailability, Appointment, Specialty, DoctorProfile, Review, ScheduleOverride, WaitlistEntry
 
 User = get_user_model()
 
@@ -64,6 +66,28 @@ class DoctorAvailabilityForm(forms.ModelForm):
             'is_active': 'فعال باشد',
         }
 
+class ScheduleOverrideForm(forms.ModelForm):
+    class Meta:
+        model = ScheduleOverride
+        fields = ['shift', 'start_time', 'end_time', 'visit_count']
+        widgets = {
+            'start_time': forms.TimeInput(format='%H:%M', attrs={'placeholder': 'HH:MM'}),
+            'end_time': forms.TimeInput(format='%H:%M', attrs={'placeholder': 'HH:MM'}),
+        }
+        labels = {
+            'shift': 'شیفت کاری',
+            'start_time': 'ساعت شروع',
+            'end_time': 'ساعت پایان',
+            'visit_count': 'تعداد ویزیت (۰ برای لغو شیفت)',
+        }
+
+    def clean(self):
+        cleaned_data = super().clean()
+        start_time, end_time = cleaned_data.get('start_time'), cleaned_data.get('end_time')
+        if start_time and end_time and end_time <= start_time:
+            raise forms.ValidationError("ساعت پایان باید بعد از ساعت شروع باشد.")
+        return cleaned_data
+
 from .models import DailyExpense
 
 class AppointmentBookingForm(forms.ModelForm):
@@ -208,4 +232,56 @@ class PasswordResetVerifyForm(forms.Form):
 
         if new_password1 and new_password2 and new_password1 != new_password2:
             raise forms.ValidationError("رمزهای عبور با یکدیگر مطابقت ندارند.")
-        return cleaned_data
\ No newline at end of file
+        return cleaned_data
+
+
+class WaitlistForm(forms.ModelForm):
+    date_from = forms.CharField(label='از تاریخ', widget=forms.TextInput(attrs={'placeholder': '1404/08/01'}))
+    date_to = forms.CharField(label='تا تاریخ', widget=forms.TextInput(attrs={'placeholder': '1404/08/15'}))
+
+    class Meta:
+        model = WaitlistEntry
+        fields = ['date_from', 'date_to', 'shift', 'insurance_type']
+        labels = {
+            'shift': 'شیفت (خالی: فرقی ندارد)',
+            'insurance_type': 'نوع بیمه',
+        }
+
+    def _clean_jalali(self, name):
+        try:
+            return jalali.parse(self.cleaned_data[name])
+        except ValueError:
+            raise forms.ValidationError("تاریخ را به صورت ۱۴۰۴/۰۸/۰۱ وارد کنید.")
+
+    def clean_date_from(self):
+        return self._clean_jalali('date_from')
+
+    def clean_date_to(self):
+        return self._clean_jalali('date_to')
+
+    def clean(self):
+        cleaned_data = super().clean()
+        date_from, date_to = cleaned_data.get('date_from'), cleaned_data.get('date_to')
+        if date_from and date_to:
+            if date_to < date_from:
+                raise forms.ValidationError("تاریخ پایان باید بعد از تاریخ شروع باشد.")
+            if date_to < timezone.localdate():
+                raise forms.ValidationError("بازه‌ی انتخاب‌شده گذشته است.")
+        return cleaned_data
+
+
+class ImportForm(forms.Form):
+    KIND_CHOICES = (
+        ('appointments', 'نوبت‌ها و بیماران'),
+        ('expenses', 'هزینه‌ها و پرداخت‌ها'),
+    )
+
+    kind = forms.ChoiceField(choices=KIND_CHOICES, label='نوع اطلاعات')
+    file = forms.FileField(label='فایل (xlsx یا csv)')
+    dry_run = forms.BooleanField(required=False, label='فقط بررسی، بدون ذخیره')
+
+    def clean_file(self):
+        upload = self.cleaned_data['file']
+        if not upload.name.lower().endswith(('.xlsx', '.csv')):
+            raise forms.ValidationError("فقط فایل‌های xlsx و csv پشتیبانی می‌شوند.")
+        return upload
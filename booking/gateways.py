@@ -0,0 +1,227 @@
+"""
+Async clients for the external services of the booking flow: the Amoot SMS API
+and the Beh Pardakht (Mellat) SOAP gateway.
+
+Under ASGI (``settings.ASGI_SERVER``) all calls share one pooled
+``httpx.AsyncClient`` per worker event loop. Under WSGI every async view runs
+on an event loop of its own, so ``http_client`` opens a client for the view
+and closes it with the loop's work instead of leaving one behind per request.
+The gateway WSDL is fetched and parsed once per process instead of on every
+payment request. SMS sends are counted and logged to ``booking.sms``
+(see booking.telemetry).
+
+httpx, requests and zeep are imported on first use: most processes, and
+most requests, never talk to a gateway.
+"""
+import asyncio
+import logging
+import threading
+import time
+import weakref
+from contextlib import asynccontextmanager
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from . import telemetry
+
+HTTP_TIMEOUT = 15.0
+HTTP_CONNECT_TIMEOUT = 5.0
+HTTP_MAX_CONNECTIONS = 100
+HTTP_MAX_KEEPALIVE_CONNECTIONS = 20
+
+_http_clients = weakref.WeakKeyDictionary()
+_wsdl_documents = {}
+_wsdl_lock = threading.Lock()
+_wsdl_http_client = None
+
+sms_logger = logging.getLogger('booking.sms')
+
+
+class SMSError(Exception):
+    """The SMS API could not be reached; the error of the HTTP client is the cause."""
+
+
+def _http_timeout():
+    import httpx
+
+    return httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT)
+
+
+def _new_http_client():
+    import httpx
+
+    return httpx.AsyncClient(timeout=_http_timeout(), limits=httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+    ))
+
+
+def get_http_client():
+    """
+    The pooled async HTTP client of the running event loop, for ASGI workers
+    whose loop lives as long as the process; see ``http_client``.
+    """
+    loop = asyncio.get_running_loop()
+    client = _http_clients.get(loop)
+    if client is None:
+        client = _http_clients[loop] = _new_http_client()
+    return client
+
+
+@asynccontextmanager
+async def http_client():
+    """
+    The async HTTP client to use inside the block.
+
+    Under ASGI this is the pooled client of the worker loop. Anywhere else
+    (async views under WSGI, ``async_to_sync`` in management commands) the
+    loop is thrown away after one call, so a client is opened for the block
+    and closed, with its connections, when the block ends.
+    """
+    if settings.ASGI_SERVER:
+        yield get_http_client()
+        return
+    async with _new_http_client() as client:
+        yield client
+
+
+def mask_mobile(mobile):
+    """The mobile number with all but its last four digits hidden, for logs."""
+    mobile = str(mobile)
+    return '*' * max(len(mobile) - 4, 0) + mobile[-4:]
+
+
+def _sms_payload(mobile, pattern_code, pattern_values):
+    return {
+        'token': settings.AMOOT_SMS_API_TOKEN,
+        'Mobile': mobile,
+        'PatternCodeID': pattern_code,
+        'PatternValues': pattern_values,
+    }
+
+
+def sms_outcome(response):
+    """``'sent'``, or ``'rejected'`` if Amoot answered with an error."""
+    if not 200 <= response.status_code < 300:
+        return 'rejected'
+    try:
+        status = response.json().get('Status')
+    except (ValueError, AttributeError):
+        status = None
+    return 'sent' if status in (None, 'Success') else 'rejected'
+
+
+def _record_sms(mobile, pattern_code, started, response=None, error=None):
+    """Counts and logs an SMS send; ``error`` if the API could not be reached."""
+    telemetry.sms_seconds.observe(time.perf_counter() - started, pattern=pattern_code)
+    details = {'pattern': pattern_code, 'mobile': mask_mobile(mobile)}
+    if error is not None:
+        telemetry.sms.inc(pattern=pattern_code, outcome='error')
+        sms_logger.warning('SMS send failed', extra={**details, 'error': repr(error)})
+        return
+    outcome = sms_outcome(response)
+    telemetry.sms.inc(pattern=pattern_code, outcome=outcome)
+    sms_logger.log(logging.INFO if outcome == 'sent' else logging.WARNING, 'SMS %s', outcome, extra={
+        **details, 'status_code': response.status_code,
+    })
+
+
+async def asend_sms(mobile, pattern_code, pattern_values, client=None):
+    """
+    Sends a pattern SMS through Amoot and returns the HTTP response. Several
+    sends in a row share one ``client`` from ``http_client``.
+
+    Raises ``SMSError`` when the API cannot be reached.
+    """
+    import httpx
+
+    if client is None:
+        async with http_client() as client:
+            return await asend_sms(mobile, pattern_code, pattern_values, client)
+
+    started = time.perf_counter()
+    try:
+        response = await client.post(
+            settings.AMOOT_SMS_API_URL, data=_sms_payload(mobile, pattern_code, pattern_values),
+        )
+    except httpx.HTTPError as error:
+        _record_sms(mobile, pattern_code, started, error=error)
+        raise SMSError(str(error)) from error
+    _record_sms(mobile, pattern_code, started, response=response)
+    return response
+
+
+async def asend_sms_batch(messages, pattern_code, concurrency=50):
+    """
+    Sends ``(mobile, pattern_values)`` pairs with one pattern, ``concurrency``
+    at a time over the pooled client. Returns one ``(outcome, detail)`` per
+    message, in order: ``('sent', None)``, ``('rejected', status_code)`` or
+    ``('error', message)``.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def send(client, mobile, pattern_values):
+        async with semaphore:
+            try:
+                response = await asend_sms(mobile, pattern_code, pattern_values, client=client)
+            except SMSError as error:
+                return 'error', str(error)
+        outcome = sms_outcome(response)
+        return outcome, None if outcome == 'sent' else response.status_code
+
+    async with http_client() as client:
+        return await asyncio.gather(*(send(client, mobile, pattern_values) for mobile, pattern_values in messages))
+
+
+def send_sms(mobile, pattern_code, pattern_values):
+    """
+    ``asend_sms`` for sync views, with the same timeouts.
+
+    Raises ``SMSError`` when the API cannot be reached or does not answer in time.
+    """
+    import requests
+
+    started = time.perf_counter()
+    try:
+        response = requests.post(
+            settings.AMOOT_SMS_API_URL, data=_sms_payload(mobile, pattern_code, pattern_values),
+            timeout=(HTTP_CONNECT_TIMEOUT, HTTP_TIMEOUT),
+        )
+    except requests.RequestException as error:
+        # Timeouts included: counted as errors, with the time waited.
+        _record_sms(mobile, pattern_code, started, error=error)
+        raise SMSError(str(error)) from error
+    _record_sms(mobile, pattern_code, started, response=response)
+    return response
+
+
+def _load_wsdl(url):
+    """Fetches and parses the gateway WSDL once per process."""
+    import httpx
+    from zeep.transports import Transport
+    from zeep.wsdl import Document
+
+    global _wsdl_http_client
+    with _wsdl_lock:
+        document = _wsdl_documents.get(url)
+        if document is None:
+            document = Document(url, Transport(timeout=15))
+            _wsdl_documents[url] = document
+        if _wsdl_http_client is None:
+            _wsdl_http_client = httpx.Client(timeout=_http_timeout())
+    return document
+
+
+async def get_payment_client(client):
+    """
+    A zeep ``AsyncClient`` for the Beh Pardakht gateway over ``client``, an
+    HTTP client from ``http_client``.
+
+    Its operations are coroutines, e.g. ``await client.service.bpPayRequest(...)``.
+    """
+    from zeep import AsyncClient
+    from zeep.transports import AsyncTransport
+
+    document = await sync_to_async(_load_wsdl, thread_sensitive=False)(settings.BEH_PARDAKHT_WSDL_URL)
+    transport = AsyncTransport(client=client, wsdl_client=_wsdl_http_client)
+    return AsyncClient(document, transport=transport)
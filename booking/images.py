@@ -0,0 +1,80 @@
+"""
+Doctor photo processing.
+
+Uploads are re-encoded once when they are saved: turned upright, scaled down
+to ``MAX_SIZE``, stripped of EXIF and other metadata, and cut into the square
+``VARIANTS`` in WebP and JPEG that the avatars list in their ``srcset``.
+Pillow is imported on first use, so importing this module (as the models and
+the photo template tags do) does not load it at boot.
+"""
+import io
+import logging
+import os
+
+from django.core.files.base import ContentFile
+
+logger = logging.getLogger(__name__)
+
+MAX_SIZE = 1200
+VARIANTS = {'thumb': 100, 'card': 300}
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 6}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+VARIANT_DIR = 'doctor_photos/variants'
+
+
+def load(file):
+    """Opens an uploaded image upright and in RGB, with transparency flattened onto white."""
+    from PIL import Image, ImageOps
+
+    file.seek(0)
+    image = ImageOps.exif_transpose(Image.open(file))
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def encode(image, fmt):
+    """The bytes of ``image`` in one of ``FORMATS``, without any metadata."""
+    pil_format, options = FORMATS[fmt]
+    buffer = io.BytesIO()
+    image.save(buffer, pil_format, **options)
+    return buffer.getvalue()
+
+
+def prepare_photo(profile):
+    """
+    Replaces the newly uploaded ``profile.photo`` with its processed JPEG and
+    stores its variants, recording them in ``profile.photo_variants`` as
+    ``{variant: {'width', 'height', 'webp', 'jpeg'}}``. A file Pillow cannot
+    read is kept as uploaded, without variants.
+    """
+    from PIL import Image, ImageOps
+
+    photo = profile.photo
+    try:
+        image = load(photo)
+        image.thumbnail((MAX_SIZE, MAX_SIZE), Image.LANCZOS)
+    except (OSError, ValueError) as e:
+        logger.warning("Could not process doctor photo %s: %s", photo.name, e)
+        profile.photo_variants = {}
+        return
+
+    stem = os.path.splitext(os.path.basename(photo.name))[0]
+    variants = {}
+    for variant, size in VARIANTS.items():
+        square = ImageOps.fit(image, (size, size), Image.LANCZOS)
+        entry = {'width': size, 'height': size}
+        for fmt in FORMATS:
+            extension = 'jpg' if fmt == 'jpeg' else fmt
+            entry[fmt] = photo.storage.save(
+                f'{VARIANT_DIR}/{stem}_{variant}.{extension}', ContentFile(encode(square, fmt)),
+            )
+        variants[variant] = entry
+
+    photo.save(f'{stem}.jpg', ContentFile(encode(image, 'jpeg')), save=False)
+    profile.photo_variants = variants
@@ -0,0 +1,335 @@
+"""
+Bulk import of historical appointments and expenses.
+
+Reads an XLSX sheet (openpyxl in read-only mode, which streams the rows) or
+a CSV file whose first row names the columns: the headers of the Excel
+exports are understood, as are the field names. Persian and Arabic digits,
+thousands separators and Jalali dates (``1402/05/10``, with an optional
+``14:30``) are normalised. Rows are validated and written ``CHUNK_SIZE`` at
+a time with ``bulk_create``, one transaction per chunk, so memory stays flat
+however long the file is. Rows already in the database (same time and
+phone, or same date, description and amount) are skipped, so a file can be
+imported again after fixing the rows that failed.
+
+Used by ``manage.py import_records`` and the import page of the doctor panel.
+"""
+import csv
+import datetime
+import io
+import time
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import jalali
+from .models import Appointment, DailyExpense
+from .signals import bump_schedule_version, queue_refresh
+
+CHUNK_SIZE = 2000
+MAX_ERRORS = 200
+
+_DIGITS = str.maketrans('۰۱۲۳۴۵۶۷۸۹٠١٢٣٤٥٦٧٨٩', '01234567890123456789')
+_SEPARATORS = str.maketrans('', '', ',٬،  ')
+
+
+class ImportFileError(ValueError):
+    """The file cannot be imported at all (bad format or missing columns)."""
+
+
+def normalize_digits(value):
+    """``value`` as a stripped string with Persian and Arabic digits made ASCII."""
+    if value is None:
+        return ''
+    return str(value).translate(_DIGITS).strip()
+
+
+def _integer_text(value):
+    """Digits typed into Excel come back as floats: 150000.0."""
+    text = normalize_digits(value)
+    return text[:-2] if text.endswith('.0') else text
+
+
+def parse_amount(value):
+    try:
+        amount = Decimal(value) if isinstance(value, (int, float)) else Decimal(normalize_digits(value).translate(_SEPARATORS))
+    except InvalidOperation:
+        raise ValueError(f'مبلغ نامعتبر: {value}')
+    if not amount.is_finite():
+        raise ValueError(f'مبلغ نامعتبر: {value}')
+    return amount.to_integral_value() if amount == amount.to_integral_value() else amount
+
+
+@lru_cache(maxsize=4096)
+def _parse_date_text(text):
+    parts = text.replace('/', '-').split('-')
+    if len(parts) != 3 or not all(part.isdigit() for part in parts):
+        raise ValueError(f'تاریخ نامعتبر: {text}')
+    if int(parts[0]) < 1700:
+        return jalali.parse(text)
+    return datetime.date(*(int(part) for part in parts))
+
+
+@lru_cache(maxsize=2048)
+def _parse_time_text(text):
+    try:
+        return datetime.time(*(int(part) for part in text.split(':')))
+    except (TypeError, ValueError):
+        raise ValueError(f'ساعت نامعتبر: {text}')
+
+
+def parse_date(value):
+    """A Gregorian date from a date cell or a Jalali or Gregorian ``YYYY/MM/DD`` string."""
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    return _parse_date_text(normalize_digits(value))
+
+
+def parse_datetime(value):
+    """An aware datetime from a cell or a date string with an optional ``HH:MM``, in local time."""
+    if isinstance(value, datetime.datetime):
+        moment = value
+    else:
+        text = normalize_digits(value).replace('ساعت', ' ').replace('T', ' ')
+        date_text, _, time_text = text.partition(' ')
+        moment = datetime.datetime.combine(parse_date(date_text), datetime.time.min)
+        time_text = time_text.strip()
+        if time_text:
+            moment = datetime.datetime.combine(moment.date(), _parse_time_text(time_text))
+    return moment if timezone.is_aware(moment) else timezone.make_aware(moment)
+
+
+def _choice(choices, label):
+    """Parses a choice given by its value or its display name."""
+    mapping = {str(key).lower(): key for key, _ in choices}
+    mapping.update({str(name): key for key, name in choices})
+
+    def parse(value):
+        text = _integer_text(value)
+        key = mapping.get(text, mapping.get(text.lower()))
+        if key is None:
+            raise ValueError(f'{label} نامعتبر: {value}')
+        return key
+    return parse
+
+
+def _phone(value):
+    text = _integer_text(value).replace(' ', '').replace('-', '')
+    # Excel drops the leading zero of numbers stored as numbers.
+    if len(text) == 10 and text.startswith('9'):
+        text = '0' + text
+    return text
+
+
+def _national_id(value):
+    text = _integer_text(value)
+    return text.zfill(10) if text.isdigit() else text or None
+
+
+def _text(value):
+    return '' if value is None else str(value).strip()
+
+
+class Kind:
+    """What one kind of record is read from: its columns, their parsers and its duplicate key."""
+
+    def __init__(self, model, columns, required, key, defaults):
+        self.model = model
+        self.columns = columns
+        self.required = required
+        self.key = key
+        self.defaults = defaults
+        # The parsers check types and choices; what is left of the field
+        # validation is the lengths, checked here without building forms.
+        self.limits = []
+        for name in columns:
+            field = model._meta.get_field(name)
+            limit = field.max_length or getattr(field, 'max_digits', None)
+            if limit:
+                self.limits.append((name, field.verbose_name, limit, field.max_length is None))
+
+
+# field: (headers it may appear under, parser)
+KINDS = {
+    'appointments': Kind(
+        Appointment,
+        {
+            'patient_name': (('نام بیمار', 'نام و نام خانوادگی', 'patient_name'), _text),
+            'patient_phone': (('شماره همراه', 'موبایل', 'patient_phone'), _phone),
+            'patient_national_id': (('کد ملی', 'patient_national_id'), _national_id),
+            'insurance_type': (('نوع بیمه', 'بیمه', 'insurance_type'), _choice(Appointment.INSURANCE_CHOICES, 'نوع بیمه')),
+            'appointment_datetime': (('زمان نوبت', 'تاریخ نوبت', 'appointment_datetime'), parse_datetime),
+            'service_description': (('شرح خدمات', 'service_description'), _text),
+            'problem_description': (('شرح حال بیمار', 'شرح مشکل', 'problem_description'), _text),
+            'visit_fee_paid': (('مبلغ ویزیت دریافتی', 'مبلغ دریافتی', 'visit_fee_paid'), parse_amount),
+            'payment_method': (('نوع پرداخت', 'نحوه پرداخت', 'payment_method'), _choice(Appointment.PAYMENT_METHOD_CHOICES, 'نوع پرداخت')),
+            'status': (('وضعیت', 'status'), _choice(Appointment.STATUS_CHOICES, 'وضعیت')),
+        },
+        required=('patient_name', 'patient_phone', 'appointment_datetime'),
+        key=('appointment_datetime', 'patient_phone'),
+        # History: visited unless the file says otherwise.
+        defaults={'status': 2},
+    ),
+    'expenses': Kind(
+        DailyExpense,
+        {
+            'date': (('تاریخ', 'date'), parse_date),
+            'description': (('شرح', 'شرح هزینه/پرداخت', 'شرح هزینه', 'description'), _text),
+            'amount': (('مبلغ', 'مجموع', 'amount'), parse_amount),
+        },
+        required=('date', 'description', 'amount'),
+        key=('date', 'description', 'amount'),
+        defaults={},
+    ),
+}
+
+
+def read_rows(file, name):
+    """
+    The rows of a file opened in binary mode, or an upload, as lists of cell
+    values, header first. ``name`` tells XLSX (the first sheet) from CSV,
+    which must be UTF-8.
+    """
+    if name.lower().endswith('.xlsx'):
+        import openpyxl
+
+        try:
+            workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
+        except Exception as error:
+            raise ImportFileError(f'فایل اکسل قابل خواندن نیست: {error}')
+        try:
+            yield from workbook.worksheets[0].iter_rows(values_only=True)
+        finally:
+            workbook.close()
+    elif name.lower().endswith('.csv'):
+        try:
+            yield from csv.reader(io.TextIOWrapper(file, encoding='utf-8-sig', newline=''))
+        except UnicodeDecodeError:
+            raise ImportFileError('فایل CSV باید با کدگذاری UTF-8 ذخیره شده باشد.')
+    else:
+        raise ImportFileError('فقط فایل‌های xlsx و csv پشتیبانی می‌شوند.')
+
+
+def _header_map(kind, header):
+    names = {normalize_digits(cell): index for index, cell in enumerate(header) if cell is not None}
+    columns = {}
+    for field, (headers, _) in kind.columns.items():
+        for title in headers:
+            if title in names:
+                columns[field] = names[title]
+                break
+    missing = [kind.columns[field][0][0] for field in kind.required if field not in columns]
+    if missing:
+        raise ImportFileError(f"ستون‌های لازم پیدا نشد: {'، '.join(missing)}")
+    return columns
+
+
+class ImportResult:
+    def __init__(self):
+        self.rows = 0
+        self.created = 0
+        self.duplicates = 0
+        self.invalid = 0
+        self.errors = []
+        self.seconds = 0.0
+
+    def error(self, line, message):
+        self.invalid += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append((line, message))
+
+    @property
+    def per_second(self):
+        return round(self.rows / self.seconds) if self.seconds else 0
+
+
+def _build(kind, doctor, columns, line, values, result):
+    fields = dict(kind.defaults)
+    for field, index in columns.items():
+        value = values[index] if index < len(values) else None
+        if value is None or (isinstance(value, str) and not value.strip()):
+            continue
+        try:
+            fields[field] = kind.columns[field][1](value)
+        except ValueError as error:
+            result.error(line, str(error))
+            return None
+    missing = [kind.columns[field][0][0] for field in kind.required if fields.get(field) in (None, '')]
+    if missing:
+        result.error(line, f"خالی: {'، '.join(missing)}")
+        return None
+    for name, verbose_name, limit, is_decimal in kind.limits:
+        value = fields.get(name)
+        if value is not None and (len(value.as_tuple().digits) if is_decimal else len(value)) > limit:
+            result.error(line, f'{verbose_name}: بیش از {limit} {"رقم" if is_decimal else "نویسه"}')
+            return None
+    return kind.model(doctor=doctor, **fields)
+
+
+def _existing_keys(kind, doctor, instances):
+    first = kind.key[0]
+    values = {getattr(instance, first) for instance in instances}
+    return set(kind.model.objects.filter(doctor=doctor, **{f'{first}__in': values}).values_list(*kind.key))
+
+
+def _save_chunk(kind, doctor, chunk, result, dry_run):
+    existing = _existing_keys(kind, doctor, [instance for _, instance in chunk])
+    new = []
+    for line, instance in chunk:
+        key = tuple(getattr(instance, field) for field in kind.key)
+        if key in existing:
+            result.duplicates += 1
+            continue
+        existing.add(key)
+        new.append(instance)
+    if not dry_run and new:
+        with transaction.atomic():
+            kind.model.objects.bulk_create(new, batch_size=CHUNK_SIZE)
+    result.created += len(new)
+
+
+def import_rows(kind_name, doctor, rows, chunk_size=CHUNK_SIZE, dry_run=False, progress=None):
+    """
+    Imports ``rows`` (header first, as ``read_rows`` yields them) as records
+    of ``kind_name`` of ``doctor``. With ``dry_run`` everything is checked but
+    nothing is written. ``progress`` is called with the result after every
+    chunk. Returns an ``ImportResult``; raises ``ImportFileError`` if the header
+    lacks a required column.
+    """
+    kind = KINDS[kind_name]
+    result = ImportResult()
+    started = time.perf_counter()
+    rows = iter(rows)
+    try:
+        columns = _header_map(kind, next(rows))
+    except StopIteration:
+        raise ImportFileError('فایل خالی است.')
+
+    chunk = []
+    for line, values in enumerate(rows, start=2):
+        if not any(value is not None and str(value).strip() for value in values):
+            continue
+        result.rows += 1
+        instance = _build(kind, doctor, columns, line, values, result)
+        if instance is not None:
+            chunk.append((line, instance))
+        if len(chunk) >= chunk_size:
+            _save_chunk(kind, doctor, chunk, result, dry_run)
+            chunk = []
+            result.seconds = time.perf_counter() - started
+            if progress:
+                progress(result)
+    if chunk:
+        _save_chunk(kind, doctor, chunk, result, dry_run)
+
+    if kind.model is Appointment and result.created and not dry_run:
+        # bulk_create sends no signals; refresh the calendar of the doctor once.
+        bump_schedule_version(doctor.pk)
+        queue_refresh(doctor.pk)
+    result.seconds = time.perf_counter() - started
+    if progress:
+        progress(result)
+    return result
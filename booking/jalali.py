@@ -0,0 +1,164 @@
+"""
+Precomputed Jalali (Persian) calendar.
+
+Templates and reports convert Gregorian dates to Jalali for every row they
+show. Instead of running the jdatetime algorithm each time, the calendar for
+``FIRST_YEAR``..``LAST_YEAR`` is laid out once in flat arrays indexed by the
+Gregorian ordinal, so a conversion is a single index lookup. Dates outside the
+table fall back to jdatetime.
+"""
+import datetime
+from array import array
+from collections import namedtuple
+from functools import lru_cache
+
+import jdatetime
+import pytz
+
+FIRST_YEAR = 1380
+LAST_YEAR = 1450
+
+DAY_NAMES = ["شنبه", "یکشنبه", "دوشنبه", "سه‌شنبه", "چهارشنبه", "پنجشنبه", "جمعه"]
+MONTH_NAMES = [
+    "فروردین", "اردیبهشت", "خرداد", "تیر", "مرداد", "شهریور",
+    "مهر", "آبان", "آذر", "دی", "بهمن", "اسفند"
+]
+
+TEHRAN_TZ = pytz.timezone('Asia/Tehran')
+
+JalaliDate = namedtuple('JalaliDate', 'year month day weekday')
+"""A Jalali date; ``weekday`` counts from Saturday (0) to Friday (6)."""
+
+
+class _Table:
+    """
+    The calendar arrays. ``year``/``month``/``day``/``weekday`` are indexed by
+    ``ordinal - first_ordinal``; ``month_starts`` holds the Gregorian ordinal
+    of the 1st of every month (plus one past the end), indexed by
+    ``(year - FIRST_YEAR) * 12 + month - 1``.
+    """
+
+    def __init__(self):
+        self.first_ordinal = jdatetime.date(FIRST_YEAR, 1, 1).togregorian().toordinal()
+        self.year = array('H')
+        self.month = array('B')
+        self.day = array('B')
+        self.weekday = array('B')
+        self.month_starts = array('l')
+
+        ordinal = self.first_ordinal
+        weekday = (datetime.date.fromordinal(ordinal).weekday() + 2) % 7
+        for year in range(FIRST_YEAR, LAST_YEAR + 1):
+            leap = jdatetime.date(year, 1, 1).isleap()
+            for month in range(1, 13):
+                self.month_starts.append(ordinal)
+                length = 31 if month <= 6 else 30 if month <= 11 or leap else 29
+                self.year.extend([year] * length)
+                self.month.extend([month] * length)
+                self.day.extend(range(1, length + 1))
+                for _ in range(length):
+                    self.weekday.append(weekday)
+                    weekday = (weekday + 1) % 7
+                ordinal += length
+        self.month_starts.append(ordinal)
+        self.last_ordinal = ordinal - 1
+
+
+@lru_cache(maxsize=None)
+def _table():
+    return _Table()
+
+
+def from_gregorian(gregorian_date):
+    """
+    The Jalali date of a Gregorian ``date``. A ``datetime`` is taken at its
+    own wall-clock date, without any timezone conversion.
+    """
+    table = _table()
+    index = gregorian_date.toordinal() - table.first_ordinal
+    if 0 <= index <= table.last_ordinal - table.first_ordinal:
+        return JalaliDate(table.year[index], table.month[index], table.day[index], table.weekday[index])
+    j_date = jdatetime.date.fromgregorian(year=gregorian_date.year, month=gregorian_date.month, day=gregorian_date.day)
+    return JalaliDate(j_date.year, j_date.month, j_date.day, j_date.weekday())
+
+
+def to_gregorian(year, month, day):
+    """
+    The Gregorian ``date`` of a Jalali date. Raises ``ValueError`` for
+    dates that do not exist.
+    """
+    if FIRST_YEAR <= year <= LAST_YEAR and 1 <= month <= 12:
+        table = _table()
+        index = (year - FIRST_YEAR) * 12 + month - 1
+        start = table.month_starts[index]
+        if not 1 <= day <= table.month_starts[index + 1] - start:
+            raise ValueError(f"Invalid Jalali date: {year}/{month}/{day}")
+        return datetime.date.fromordinal(start + day - 1)
+    return jdatetime.date(year, month, day).togregorian()
+
+
+def parse(value):
+    """
+    Parses a 'YYYY-MM-DD' (or 'YYYY/MM/DD') Jalali string into a Gregorian
+    ``date``. Raises ``ValueError`` if it is malformed.
+    """
+    try:
+        year, month, day = (int(part) for part in value.replace('/', '-').split('-'))
+    except (AttributeError, TypeError, ValueError):
+        raise ValueError(f"Invalid Jalali date: {value!r}")
+    return to_gregorian(year, month, day)
+
+
+@lru_cache(maxsize=2048)
+def month_bounds(year, month):
+    """First and last Gregorian dates of a Jalali month."""
+    first = to_gregorian(year, month, 1)
+    if month == 12:
+        next_first = to_gregorian(year + 1, 1, 1)
+    else:
+        next_first = to_gregorian(year, month + 1, 1)
+    return first, next_first - datetime.timedelta(days=1)
+
+
+@lru_cache(maxsize=256)
+def year_bounds(year):
+    """First and last Gregorian dates of a Jalali year."""
+    return to_gregorian(year, 1, 1), to_gregorian(year + 1, 1, 1) - datetime.timedelta(days=1)
+
+
+def month_start(gregorian_date):
+    """The Gregorian date of the 1st of the Jalali month ``gregorian_date`` falls in."""
+    j_date = from_gregorian(gregorian_date)
+    return month_bounds(j_date.year, j_date.month)[0]
+
+
+def year_start(gregorian_date):
+    """The Gregorian date of 1 Farvardin of the Jalali year ``gregorian_date`` falls in."""
+    return year_bounds(from_gregorian(gregorian_date).year)[0]
+
+
+def localtime(value):
+    """A datetime in Tehran time; naive values are taken as UTC."""
+    if value.tzinfo is None:
+        value = pytz.utc.localize(value)
+    return value.astimezone(TEHRAN_TZ)
+
+
+def format_date(gregorian_date, format_str="%Y/%m/%d"):
+    """
+    Formats a Gregorian date or datetime in Jalali. Supports %Y, %m, %d, %A
+    (weekday name) and %B (month name), plus %H and %M for datetimes.
+    """
+    j_date = from_gregorian(gregorian_date)
+    result = format_str
+    result = result.replace('%Y', str(j_date.year))
+    result = result.replace('%m', f'{j_date.month:02d}')
+    result = result.replace('%d', f'{j_date.day:02d}')
+    if isinstance(gregorian_date, datetime.datetime):
+        result = result.replace('%H', f'{gregorian_date.hour:02d}')
+        result = result.replace('%M', f'{gregorian_date.minute:02d}')
+    if '%A' in result:
+        result = result.replace('%A', DAY_NAMES[j_date.weekday])
+    if '%B' in result:
+        result = result.replace('%B', MONTH_NAMES[j_date.month - 1])
+    return result
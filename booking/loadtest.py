@@ -0,0 +1,280 @@
+"""
+Concurrent load-test harness for the booking and payment flow.
+
+Each virtual patient drives ``book_appointment`` -> ``verify_appointment`` ->
+``payment_page`` -> ``verify_payment`` with its own test client on its own
+thread (and therefore its own database connection), so the run reproduces the
+contention of a booking rush against the configured database.
+"""
+import asyncio
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from unittest import mock
+
+import jdatetime
+from django.contrib.auth import get_user_model
+from django.db import connection, OperationalError
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from . import fake_gateways
+from .benchmarking import percentile, next_working_day
+from .models import Appointment
+
+SLOT_RE = re.compile(r'name="selected_slot" value="([^"]+)"')
+SLOT_TAKEN_MESSAGE = "این نوبت لحظاتی پیش رزرو شد."
+SYSTEM_ERROR_TITLE = "خطای سیستمی"
+LOCK_ERROR_MARKERS = ('locked', 'lock timeout', 'deadlock', 'could not obtain lock')
+
+OUTCOMES = ('paid', 'slot_taken', 'no_slot', 'lock_timeout', 'error')
+
+
+class _StandInSmsResponse:
+    status_code = 200
+    text = '{"Status":"Success"}'
+
+
+class StandInGateways:
+    """
+    In-process stand-ins for the Amoot SMS endpoint and the Beh Pardakht SOAP service.
+
+    They replace ``booking.gateways.asend_sms`` and ``get_payment_client`` for
+    the duration of the run, optionally sleeping ``latency`` seconds per call
+    to imitate the network round-trip, and count the calls made.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = {'sms': 0, 'bpPayRequest': 0, 'bpVerifyRequest': 0, 'bpSettleRequest': 0, 'bpReversalRequest': 0}
+        self._lock = threading.Lock()
+        self._ref_id = 0
+
+    async def _record(self, name):
+        with self._lock:
+            self.calls[name] += 1
+            self._ref_id += 1
+            ref_id = self._ref_id
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return ref_id
+
+    async def send_sms(self, mobile, pattern_code, pattern_values, client=None):
+        await self._record('sms')
+        return _StandInSmsResponse()
+
+    async def payment_client(self, client):
+        gateways = self
+
+        class Service:
+            async def bpPayRequest(self, **params):
+                return f'0,LT{await gateways._record("bpPayRequest")}'
+
+            async def bpVerifyRequest(self, **params):
+                await gateways._record('bpVerifyRequest')
+                return '0'
+
+            async def bpSettleRequest(self, **params):
+                await gateways._record('bpSettleRequest')
+                return '0'
+
+            async def bpReversalRequest(self, **params):
+                await gateways._record('bpReversalRequest')
+                return '0'
+
+        return mock.Mock(service=Service())
+
+    @contextmanager
+    def installed(self):
+        with mock.patch('booking.gateways.asend_sms', side_effect=self.send_sms), \
+                mock.patch('booking.gateways.get_payment_client', side_effect=self.payment_client):
+            yield self
+
+
+class ServerGateways:
+    """
+    Runs the fake gateway HTTP server (see ``booking.fake_gateways``) and points
+    the site at it, so payments go through real WSDL parsing, SOAP calls and
+    HTTP round-trips.
+    """
+
+    def __init__(self, latency=0.0, failure_rate=0.0):
+        self.options = {'latency': latency, 'failure_rate': failure_rate}
+        self.server = None
+
+    @property
+    def calls(self):
+        return dict(self.server.get_app().stats) if self.server else {}
+
+    @contextmanager
+    def installed(self):
+        self.server = fake_gateways.start_in_thread(**self.options)
+        try:
+            with override_settings(**fake_gateways.gateway_settings(fake_gateways.server_url(self.server))):
+                yield self
+        finally:
+            self.server.shutdown()
+            self.server.server_close()
+
+
+def patient_phone(index):
+    """The mobile number, and so the username, of virtual patient ``index``."""
+    return f'09{index:09d}'
+
+
+def existing_patients(patients):
+    """Usernames of the virtual patients that already exist before a run."""
+    phones = [patient_phone(index) for index in range(patients)]
+    return set(get_user_model().objects.filter(username__in=phones).values_list('username', flat=True))
+
+
+def delete_patients(patients, keep=()):
+    """
+    Deletes the patient users ``verify_appointment`` created for a run of
+    ``patients`` virtual patients, except the usernames in ``keep``.
+    """
+    phones = [patient_phone(index) for index in range(patients)]
+    get_user_model().objects.filter(username__in=phones, user_type='PATIENT').exclude(username__in=keep).delete()
+
+
+def _is_lock_error(error):
+    message = str(error).lower()
+    return any(marker in message for marker in LOCK_ERROR_MARKERS)
+
+
+def run_virtual_patient(index, doctor, jalali_date, hot_slots, rng):
+    """
+    Runs one patient through the whole booking and payment flow.
+
+    Returns ``(outcome, step_timings)`` where ``step_timings`` maps each
+    completed step to its latency in milliseconds.
+    """
+    client = Client(SERVER_NAME='localhost')
+    timings = {}
+    book_url = reverse('booking:book_appointment', kwargs={'pk': doctor.pk, 'date': jalali_date})
+
+    def timed(step, method, url, data=None):
+        started = time.perf_counter()
+        response = getattr(client, method)(url, data) if data is not None else getattr(client, method)(url)
+        timings[step] = (time.perf_counter() - started) * 1000
+        return response
+
+    try:
+        response = timed('book_page', 'get', book_url)
+        slots = SLOT_RE.findall(response.content.decode())
+        if not slots:
+            return 'no_slot', timings
+
+        response = timed('book_submit', 'post', book_url, {
+            'patient_name': f'بیمار {index}',
+            'patient_phone': patient_phone(index),
+            'patient_national_id': f'{index:010d}',
+            'insurance_type': 'AZAD',
+            'problem_description': 'تست بار',
+            'selected_slot': rng.choice(slots[:hot_slots]),
+        })
+        if response.status_code != 302:
+            content = response.content.decode()
+            if SLOT_TAKEN_MESSAGE in content:
+                return 'slot_taken', timings
+            if SYSTEM_ERROR_TITLE in content:
+                return 'lock_timeout', timings
+            return 'error', timings
+
+        session = client.session
+        response = timed('verify_otp', 'post', reverse('booking:verify_appointment'), {'otp': session['otp_code']})
+        if response.status_code != 302:
+            return 'error', timings
+
+        response = timed('payment_page', 'get', reverse('booking:payment_page'))
+        if response.status_code != 200 or b'RefId' not in response.content:
+            return 'error', timings
+
+        order_id = Appointment.objects.filter(pk=session['pending_appointment_id']).values_list('payment_order_id', flat=True).first()
+        response = timed('verify_payment', 'post', reverse('booking:verify_payment'), {
+            'ResCode': '0',
+            'SaleOrderId': str(order_id),
+            'SaleReferenceId': str(900000 + index),
+        })
+        if response.status_code != 302:
+            return 'error', timings
+        return 'paid', timings
+    except OperationalError as e:
+        return ('lock_timeout' if _is_lock_error(e) else 'error'), timings
+    except Exception:
+        return 'error', timings
+    finally:
+        connection.close()
+
+
+def find_double_bookings(doctor):
+    """Slots holding more than one active (reserved, completed or pending) appointment."""
+    return list(
+        Appointment.objects.filter(doctor=doctor, status__in=[1, 2, 4])
+        .values('appointment_datetime')
+        .annotate(count=Count('id'))
+        .filter(count__gt=1)
+    )
+
+
+def run_load_test(doctor, patients=100, concurrency=10, hot_slots=5, seed=0):
+    """
+    Sends ``patients`` virtual patients at ``doctor``'s next working day,
+    ``concurrency`` at a time, and returns the aggregated report.
+
+    Every patient picks among the first ``hot_slots`` free slots it sees, so
+    lower values mean fiercer contention for the same appointment times.
+    """
+    work_day = next_working_day(doctor)
+    jalali_date = jdatetime.date.fromgregorian(date=work_day).strftime('%Y-%m-%d')
+    rngs = [random.Random(seed * 100003 + i) for i in range(patients)]
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(
+            lambda i: run_virtual_patient(i, doctor, jalali_date, hot_slots, rngs[i]),
+            range(patients),
+        ))
+    elapsed = time.perf_counter() - started
+
+    outcomes = {name: 0 for name in OUTCOMES}
+    step_timings = {}
+    for outcome, timings in results:
+        outcomes[outcome] += 1
+        for step, value in timings.items():
+            step_timings.setdefault(step, []).append(value)
+    requests_made = sum(len(timings) for _, timings in results)
+    double_bookings = find_double_bookings(doctor)
+
+    return {
+        'date': work_day.isoformat(),
+        'patients': patients,
+        'concurrency': concurrency,
+        'duration_s': round(elapsed, 3),
+        'throughput': {
+            'completed_flows_per_s': round(outcomes['paid'] / elapsed, 3) if elapsed else 0,
+            'requests_per_s': round(requests_made / elapsed, 3) if elapsed else 0,
+        },
+        'outcomes': outcomes,
+        'error_rate': round(outcomes['error'] / patients, 4) if patients else 0,
+        'lock_timeouts': outcomes['lock_timeout'],
+        'double_booking_violations': len(double_bookings),
+        'double_booked_slots': [
+            {'appointment_datetime': item['appointment_datetime'].isoformat(), 'count': item['count']}
+            for item in double_bookings
+        ],
+        'latency_ms': {
+            step: {
+                'p50': round(percentile(values, 50), 3),
+                'p95': round(percentile(values, 95), 3),
+                'p99': round(percentile(values, 99), 3),
+                'max': round(max(values), 3),
+            }
+            for step, values in step_timings.items()
+        },
+    }
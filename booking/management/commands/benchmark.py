@@ -0,0 +1,73 @@
+import datetime
+import json
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from booking.benchmarking import generate_clinic_data, build_scenarios, run_scenarios
+
+
+class Command(BaseCommand):
+    help = 'Generates synthetic clinic data and reports latency percentiles and query counts of the booking views as JSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--doctors', type=int, default=5, help='Number of doctors to create.')
+        parser.add_argument('--availabilities', type=int, default=6, help='Weekly shifts per doctor (max 14).')
+        parser.add_argument('--visit-count', type=int, default=16, help='Visits per shift.')
+        parser.add_argument('--years', type=float, default=1, help='Years of appointment history per doctor.')
+        parser.add_argument('--fill-ratio', type=float, default=0.7, help='Share of past slots that are booked.')
+        parser.add_argument('--expenses-per-day', type=int, default=2, help='Expense rows per doctor per day.')
+        parser.add_argument('--reviews', type=int, default=50, help='Reviews per doctor.')
+        parser.add_argument('--exceptions', type=int, default=20, help='Blocked future slots per doctor.')
+        parser.add_argument('--iterations', type=int, default=20, help='Timed requests per view.')
+        parser.add_argument('--warmup', type=int, default=2, help='Untimed requests per view before timing.')
+        parser.add_argument('--only', nargs='*', help='Only run the named scenarios.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout.')
+        parser.add_argument('--keep-data', action='store_true',
+                            help='Commit the generated data instead of rolling it back at the end.')
+
+    def handle(self, *args, **options):
+        log = lambda message: self.stderr.write(message)
+        scale = {
+            'doctors': options['doctors'],
+            'availabilities': options['availabilities'],
+            'visit_count': options['visit_count'],
+            'years': options['years'],
+            'fill_ratio': options['fill_ratio'],
+            'expenses_per_day': options['expenses_per_day'],
+            'reviews': options['reviews'],
+            'exceptions': options['exceptions'],
+            'seed': options['seed'],
+        }
+
+        with transaction.atomic():
+            profiles = generate_clinic_data(log=log, **scale)
+            log('Timing views...')
+            results = run_scenarios(
+                build_scenarios(profiles[0]),
+                iterations=options['iterations'],
+                warmup=options['warmup'],
+                only=options['only'],
+            )
+            if not options['keep_data']:
+                transaction.set_rollback(True)
+
+        report = {
+            'meta': {
+                'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'iterations': options['iterations'],
+                'scale': scale,
+            },
+            'results': results,
+        }
+        output = json.dumps(report, indent=2, ensure_ascii=False)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.write(output)
+            log(f"Report written to {options['output']}")
+        else:
+            self.stdout.write(output)
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from booking import waitlist
+
+
+class Command(BaseCommand):
+    help = (
+        'Cancels the appointments left unpaid for PAYMENT_HOLD_MINUTES and the waitlist offers that have run out, '
+        'offering their slots to the waitlist, expires the waitlist entries whose dates have passed '
+        'and texts the new waitlist offers. Run it from cron every minute.'
+    )
+
+    def handle(self, *args, **options):
+        counts = waitlist.expire_holds()
+        sent, failed = waitlist.send_offers()
+        self.stdout.write(
+            f"{counts['holds']} holds cancelled, {counts['offers']} waitlist offers and "
+            f"{counts['stale']} waitlist entries expired; {sent} offers texted, {failed} failed."
+        )
@@ -0,0 +1,59 @@
+import datetime
+import posixpath
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from booking.models import DoctorProfile
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp'}
+
+
+class Command(BaseCommand):
+    help = (
+        'Deletes doctor photos and photo variants that no doctor profile references. '
+        'Files newer than the grace period are kept, since an upload is stored before its profile is saved.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only list the files that would be deleted.')
+        parser.add_argument('--grace-hours', type=float, default=24, help='Keep unreferenced files younger than this.')
+
+    def walk(self, storage, directory):
+        directories, files = storage.listdir(directory)
+        for name in files:
+            yield posixpath.join(directory, name)
+        for name in directories:
+            yield from self.walk(storage, posixpath.join(directory, name))
+
+    def handle(self, *args, **options):
+        storage = DoctorProfile._meta.get_field('photo').storage
+        directory = DoctorProfile._meta.get_field('photo').upload_to.rstrip('/')
+        if not storage.exists(directory):
+            self.stdout.write(self.style.SUCCESS('No photos stored.'))
+            return
+
+        referenced = set()
+        for photo, variants in DoctorProfile.objects.exclude(photo='').values_list('photo', 'photo_variants'):
+            if photo:
+                referenced.add(photo)
+            for entry in (variants or {}).values():
+                referenced.update(value for key, value in entry.items() if key not in ('width', 'height'))
+
+        cutoff = timezone.now() - datetime.timedelta(hours=options['grace_hours'])
+        deleted = freed = 0
+        for name in self.walk(storage, directory):
+            if posixpath.splitext(name)[1].lower() not in IMAGE_EXTENSIONS or name in referenced:
+                continue
+            if storage.get_modified_time(name) > cutoff:
+                continue
+            size = storage.size(name)
+            if options['dry_run']:
+                self.stdout.write(f'Would delete {name} ({size} bytes)')
+            else:
+                storage.delete(name)
+            deleted += 1
+            freed += size
+
+        verb = 'Would delete' if options['dry_run'] else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {deleted} unreferenced files ({freed} bytes).'))
@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+
+from booking import importer
+from booking.models import DoctorProfile
+
+
+class Command(BaseCommand):
+    help = (
+        "Imports a doctor's historical appointments or expenses from an XLSX or CSV file whose first row "
+        'names the columns (see booking.importer). Rows already imported are skipped.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=importer.KINDS)
+        parser.add_argument('path', help='The .xlsx or .csv file.')
+        parser.add_argument('--doctor', required=True, help='Doctor profile ID or username of the doctor.')
+        parser.add_argument('--chunk-size', type=int, default=importer.CHUNK_SIZE, help='Rows validated and written per transaction.')
+        parser.add_argument('--dry-run', action='store_true', help='Validate the file without writing anything.')
+
+    def handle(self, *args, **options):
+        lookup = Q(user__username=options['doctor'])
+        if options['doctor'].isdigit():
+            lookup |= Q(pk=int(options['doctor']))
+        doctor = DoctorProfile.objects.filter(lookup).first()
+        if doctor is None:
+            raise CommandError(f"No doctor {options['doctor']}")
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be positive.')
+
+        def progress(result):
+            self.stdout.write(
+                f'{result.rows} rows read, {result.created} new, {result.duplicates} already imported, '
+                f'{result.invalid} invalid ({result.per_second} rows/s)'
+            )
+
+        try:
+            with open(options['path'], 'rb') as file:
+                result = importer.import_rows(
+                    options['kind'], doctor, importer.read_rows(file, options['path']),
+                    chunk_size=options['chunk_size'], dry_run=options['dry_run'], progress=progress,
+                )
+        except OSError as error:
+            raise CommandError(error)
+        except importer.ImportFileError as error:
+            raise CommandError(str(error))
+
+        for line, message in result.errors:
+            self.stderr.write(f'Row {line}: {message}')
+        if result.invalid > len(result.errors):
+            self.stderr.write(f'... and {result.invalid - len(result.errors)} more invalid rows.')
+        verb = 'would be imported (dry run)' if options['dry_run'] else 'imported'
+        self.stdout.write(self.style.SUCCESS(f'{result.created} rows {verb} in {result.seconds:.1f} s.'))
@@ -0,0 +1,70 @@
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Imported on first use by the views and the admin; loading one of them at boot is a regression.
+DEFERRED_IMPORTS = ('openpyxl', 'httpx', 'requests', 'zeep', 'PIL')
+BUDGET_MS = 450
+
+_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$')
+
+
+def measure():
+    """
+    Imports what a worker imports before its first request in a fresh
+    interpreter under ``-X importtime``; returns ``{module: (self_us, cumulative_us)}``.
+    """
+    wsgi_module = settings.WSGI_APPLICATION.rsplit('.', 1)[0]
+    script = f'import django; django.setup(); import {wsgi_module}, {settings.ROOT_URLCONF}'
+    env = {**os.environ, 'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'avalnobat_project.settings')}
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', script],
+        cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise CommandError(f'The import failed:\n{result.stderr[-2000:]}')
+    modules = {}
+    for line in result.stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            modules[match.group(4)] = (int(match.group(1)), int(match.group(2)))
+    return modules
+
+
+class Command(BaseCommand):
+    help = (
+        'Measures the imports of a worker boot (django.setup, the WSGI app and the URLconf) with '
+        'python -X importtime. Fails if they take longer than the budget or load a library the '
+        'views import on first use.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--budget-ms', type=float, default=BUDGET_MS, help='Fail above this median total import time.')
+        parser.add_argument('--runs', type=int, default=3, help='Fresh interpreters to measure; the median counts.')
+        parser.add_argument('--top', type=int, default=15, help='Number of top-level packages to list.')
+
+    def handle(self, *args, **options):
+        runs = [measure() for _ in range(max(options['runs'], 1))]
+        totals = [sum(self_us for self_us, _ in modules.values()) / 1000 for modules in runs]
+        total = statistics.median(totals)
+        modules = runs[totals.index(total)] if total in totals else runs[0]
+
+        packages = {}
+        for name, (self_us, _) in modules.items():
+            package = name.split('.')[0]
+            packages[package] = packages.get(package, 0) + self_us
+        for package, self_us in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:options['top']]:
+            self.stdout.write(f'{self_us / 1000:8.1f} ms  {package}')
+        self.stdout.write(f"Total: {total:.1f} ms (median of {len(totals)}: {', '.join(f'{t:.0f}' for t in totals)} ms)")
+
+        loaded = [name for name in DEFERRED_IMPORTS if name in modules]
+        if loaded:
+            raise CommandError(f"Imported at boot but meant to load on first use: {', '.join(loaded)}")
+        if total > options['budget_ms']:
+            raise CommandError(f"Boot imports take {total:.1f} ms, over the budget of {options['budget_ms']:.0f} ms.")
+        self.stdout.write(self.style.SUCCESS(f"Within the budget of {options['budget_ms']:.0f} ms."))
@@ -0,0 +1,70 @@
+import json
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from booking.benchmarking import generate_clinic_data
+from booking.loadtest import StandInGateways, ServerGateways, delete_patients, existing_patients, run_load_test
+
+
+class Command(BaseCommand):
+    help = 'Drives many concurrent virtual patients through booking, OTP verification and payment and reports the results as JSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patients', type=int, default=100, help='Number of virtual patients.')
+        parser.add_argument('--concurrency', type=int, default=10, help='Patients running at the same time.')
+        parser.add_argument('--hot-slots', type=int, default=5,
+                            help='Each patient picks among this many earliest free slots; lower means more contention.')
+        parser.add_argument('--visit-count', type=int, default=40, help='Visits per shift of the load-test doctor.')
+        parser.add_argument('--gateway-latency', type=float, default=0.05,
+                            help='Seconds each stand-in SMS/bank call takes.')
+        parser.add_argument('--gateways', choices=['stand-in', 'server'], default='stand-in',
+                            help='In-process stand-ins, or the fake gateway HTTP server with real SOAP/HTTP round-trips.')
+        parser.add_argument('--gateway-failure-rate', type=float, default=0,
+                            help='Probability of an injected bank/SMS failure (server gateways only).')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout.')
+        parser.add_argument('--keep-data', action='store_true', help='Do not delete the load-test doctor and patients afterwards.')
+
+    def handle(self, *args, **options):
+        log = lambda message: self.stderr.write(message)
+        doctor = generate_clinic_data(
+            doctors=1, availabilities=14, years=0, visit_count=options['visit_count'],
+            fill_ratio=0, expenses_per_day=0, reviews=0, exceptions=0,
+            seed=options['seed'], log=log,
+        )[0]
+
+        if options['gateways'] == 'server':
+            gateways = ServerGateways(
+                latency=options['gateway_latency'], failure_rate=options['gateway_failure_rate'],
+            )
+        else:
+            gateways = StandInGateways(latency=options['gateway_latency'])
+        # Patients who already had an account keep it; the ones the run creates go.
+        existing = existing_patients(options['patients'])
+        try:
+            log(f"Running {options['patients']} virtual patients, {options['concurrency']} at a time...")
+            with gateways.installed():
+                report = run_load_test(
+                    doctor,
+                    patients=options['patients'],
+                    concurrency=options['concurrency'],
+                    hot_slots=options['hot_slots'],
+                    seed=options['seed'],
+                )
+        finally:
+            if not options['keep_data']:
+                doctor.secretaries.all().delete()
+                doctor.user.delete()
+                delete_patients(options['patients'], keep=existing)
+
+        report['database'] = connection.vendor
+        report['gateways'] = options['gateways']
+        report['gateway_calls'] = gateways.calls
+        output = json.dumps(report, indent=2, ensure_ascii=False)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.write(output)
+            log(f"Report written to {options['output']}")
+        else:
+            self.stdout.write(output)
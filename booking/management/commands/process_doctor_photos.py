@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from booking import images
+from booking.models import DoctorProfile
+
+
+class Command(BaseCommand):
+    help = 'Processes the doctor photos uploaded before the image pipeline: strips their metadata and creates their resized variants.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Reprocess photos that already have variants as well.')
+
+    def handle(self, *args, **options):
+        profiles = DoctorProfile.objects.exclude(photo='').exclude(photo__isnull=True)
+        if not options['all']:
+            profiles = profiles.filter(photo_variants={})
+        count = 0
+        for profile in profiles:
+            original = profile.photo.name
+            storage = profile.photo.storage
+            if not storage.exists(original):
+                self.stderr.write(f'Missing photo file for doctor profile {profile.pk}: {original}')
+                continue
+            with profile.photo.open('rb'):
+                images.prepare_photo(profile)
+            if not profile.photo_variants:
+                continue
+            profile.save(update_fields=['photo', 'photo_width', 'photo_height', 'photo_variants'])
+            # The original still carries its EXIF data; drop it unless another profile uses the same file.
+            if not DoctorProfile.objects.filter(photo=original).exists():
+                storage.delete(original)
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f'{count} doctor photos processed.'))
@@ -0,0 +1,16 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+
+from booking.events import RETENTION, prune
+
+
+class Command(BaseCommand):
+    help = 'Deletes old clinic events. Streams only replay recent events, so run it daily from cron.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=RETENTION.days, help='Keep the events of this many days.')
+
+    def handle(self, *args, **options):
+        count = prune(datetime.timedelta(days=options['days']))
+        self.stdout.write(self.style.SUCCESS(f'{count} clinic events deleted.'))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from booking.models import DoctorProfile
+from booking.schedule import rebuild_next_slots
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the next-available-slot index. Run it periodically (e.g. every 15 minutes from cron) so slots that have passed are replaced.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--doctor', type=int, action='append', help='Only rebuild these doctor profile ids.')
+
+    def handle(self, *args, **options):
+        doctors = DoctorProfile.objects.all()
+        if options['doctor']:
+            doctors = doctors.filter(pk__in=options['doctor'])
+        count = rebuild_next_slots(doctors)
+        self.stdout.write(self.style.SUCCESS(f'Next available slots rebuilt for {count} doctors.'))
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+
+from booking.fake_gateways import create_server, server_url
+
+
+class Command(BaseCommand):
+    help = 'Serves local stand-ins for the Beh Pardakht SOAP gateway and the Amoot SMS API.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--latency-ms', type=float, default=0, help='Delay added to every SOAP and SMS call.')
+        parser.add_argument('--failure-rate', type=float, default=0,
+                            help='Probability of answering with a bank/SMS error code.')
+        parser.add_argument('--fault-rate', type=float, default=0,
+                            help='Probability of answering with an HTTP 500 fault.')
+        parser.add_argument('--failure-code', default='34', help='Bank result code used for injected failures.')
+        parser.add_argument('--seed', type=int, default=None)
+        parser.add_argument('--verbose-requests', action='store_true', help='Log every request.')
+
+    def handle(self, *args, **options):
+        server = create_server(
+            host=options['host'],
+            port=options['port'],
+            quiet=not options['verbose_requests'],
+            latency=options['latency_ms'] / 1000,
+            failure_rate=options['failure_rate'],
+            fault_rate=options['fault_rate'],
+            failure_code=options['failure_code'],
+            seed=options['seed'],
+        )
+        url = server_url(server)
+        self.stdout.write(self.style.SUCCESS(f'Fake gateways listening on {url}'))
+        self.stdout.write(f'Start the site with FAKE_GATEWAYS_URL={url} to use them.')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,46 @@
+import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from booking import reminders
+
+
+class Command(BaseCommand):
+    help = (
+        'Texts a reminder to every patient with a reserved appointment tomorrow (or on --date). '
+        'Safe to rerun: reminders already sent are skipped and failed ones are retried.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Day of the appointments, YYYY-MM-DD (Gregorian). Defaults to tomorrow.')
+        parser.add_argument('--concurrency', type=int, default=reminders.CONCURRENCY, help='SMS requests in flight at once.')
+        parser.add_argument('--chunk-size', type=int, default=reminders.CHUNK_SIZE, help='Reminders claimed and sent per batch.')
+        parser.add_argument('--dry-run', action='store_true', help='Count the due reminders without sending them.')
+
+    def handle(self, *args, **options):
+        if options['date']:
+            try:
+                day = datetime.date.fromisoformat(options['date'])
+            except ValueError:
+                raise CommandError(f"Invalid date: {options['date']}")
+        else:
+            day = timezone.localdate() + datetime.timedelta(days=1)
+        if options['concurrency'] < 1 or options['chunk_size'] < 1:
+            raise CommandError('--concurrency and --chunk-size must be positive.')
+
+        stats = reminders.send_reminders(
+            day, concurrency=options['concurrency'], chunk_size=options['chunk_size'], dry_run=options['dry_run'],
+        )
+        if options['dry_run']:
+            self.stdout.write(f"{stats['due']} reminders due for {stats['day']}.")
+            return
+        if not settings.AMOOT_REMINDER_PATTERN_ID:
+            self.stderr.write(self.style.WARNING('AMOOT_REMINDER_PATTERN_ID is not set; no reminder was sent.'))
+        self.stdout.write(
+            f"{stats['day']}: {stats['due']} due, {stats['sent']} sent, {stats['failed']} failed, "
+            f"{stats['skipped']} taken by another run in {stats['seconds']:.1f} s ({stats['per_second']:.0f}/s)."
+        )
+        if stats['failed']:
+            self.stderr.write(self.style.WARNING(f"{stats['failed']} reminders failed; the next run retries them."))
@@ -0,0 +1,45 @@
+import datetime
+import json
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from booking.slow_queries import read_log, summarize
+
+ORDERINGS = {'total': 'total_ms', 'max': 'max_ms', 'mean': 'mean_ms', 'count': 'count'}
+
+
+class Command(BaseCommand):
+    help = 'Reports the queries of the slow-query log (see booking.slow_queries) that cost the most, with their plans.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=10, help='Number of fingerprints to report.')
+        parser.add_argument('--sort', choices=ORDERINGS, default='total', help='Rank by total, max or mean time, or by count.')
+        parser.add_argument('--hours', type=float, help='Only count the queries of the last N hours.')
+        parser.add_argument('--log', help='Read this log instead of SLOW_QUERY_LOG.')
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON.')
+
+    def handle(self, *args, **options):
+        since = None
+        if options['hours'] is not None:
+            since = (timezone.now() - datetime.timedelta(hours=options['hours'])).isoformat()
+        entries = summarize(read_log(options['log']), since=since)
+        entries.sort(key=lambda entry: entry[ORDERINGS[options['sort']]], reverse=True)
+        entries = entries[:options['top']]
+
+        if options['json']:
+            self.stdout.write(json.dumps(entries, ensure_ascii=False, indent=2))
+            return
+        if not entries:
+            self.stdout.write(self.style.SUCCESS('No slow queries logged.'))
+            return
+        for rank, entry in enumerate(entries, 1):
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f"{rank}. {entry['fingerprint']}: {entry['count']} queries, "
+                f"{entry['total_ms']:.0f} ms total, {entry['mean_ms']:.0f} ms mean, {entry['max_ms']:.0f} ms max"
+            ))
+            self.stdout.write(f"   {entry['sql'][:500]}")
+            for caller, count in sorted(entry['callers'].items(), key=lambda item: item[1], reverse=True)[:3]:
+                self.stdout.write(f'   called {count}x from {caller}')
+            for line in entry['plan'] or ['(no plan captured)']:
+                self.stdout.write(f'   | {line}')
@@ -0,0 +1,120 @@
+import re
+import uuid
+from functools import partial
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.utils.functional import SimpleLazyObject
+from whitenoise.middleware import WhiteNoiseMiddleware as BaseWhiteNoiseMiddleware
+
+from . import telemetry
+from .clinic import ClinicContext
+
+_REQUEST_ID = re.compile(r'[A-Za-z0-9._-]{1,64}')
+
+
+async def _aiter_file(iterator):
+    """Reads the chunks of a file response off the event loop."""
+    read = sync_to_async(next, thread_sensitive=False)
+    while (chunk := await read(iterator, None)) is not None:
+        yield chunk
+
+
+class WhiteNoiseMiddleware(BaseWhiteNoiseMiddleware):
+    """
+    WhiteNoise that can also run in async mode.
+
+    The stock middleware is sync-only, which makes Django run every request
+    under it, async views included, on a worker thread under ASGI.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, settings=settings):
+        super().__init__(get_response, settings)
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            response = self.serve(static_file, request)
+            if response.streaming and not response.is_async:
+                response.streaming_content = _aiter_file(iter(response.streaming_content))
+            return response
+        return await self.get_response(request)
+
+
+def _clinic_context(request):
+    return ClinicContext.for_user(request.user)
+
+
+class ClinicContextMiddleware:
+    """
+    Sets ``request.clinic``, the ``ClinicContext`` of the user. It is resolved
+    the first time a view uses it, so pages that don't never touch the session.
+    Async views resolve it with ``sync_to_async``.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        request.clinic = SimpleLazyObject(partial(_clinic_context, request))
+        # In async mode this returns the coroutine of the next handler.
+        return self.get_response(request)
+
+
+class RequestIdMiddleware:
+    """
+    Gives every request an ID, taken from a sane ``X-Request-ID`` header (set by
+    the proxy in front) or made up, that every log record of the request
+    carries and the response returns in ``X-Request-ID``.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def _start(self, request):
+        incoming = request.headers.get('X-Request-ID', '')
+        request.id = incoming if _REQUEST_ID.fullmatch(incoming) else uuid.uuid4().hex
+        return telemetry.request_id.set(request.id)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        token = self._start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            telemetry.request_id.reset(token)
+        response['X-Request-ID'] = request.id
+        return response
+
+    async def __acall__(self, request):
+        token = self._start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            telemetry.request_id.reset(token)
+        response['X-Request-ID'] = request.id
+        return response
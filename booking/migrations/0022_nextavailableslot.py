@@ -0,0 +1,30 @@
+# Generated by Django 5.2.8 on 2026-10-19 13:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0021_customuser_email'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NextAvailableSlot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('slot_datetime', models.DateTimeField(verbose_name='زمان نوبت')),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='next_slots', to='booking.doctorprofile', verbose_name='پزشک')),
+                ('specialty', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='next_slots', to='booking.specialty', verbose_name='تخصص')),
+            ],
+            options={
+                'verbose_name': 'نوبت آزاد بعدی',
+                'verbose_name_plural': 'نوبت\u200cهای آزاد بعدی',
+                'ordering': ['slot_datetime'],
+                'indexes': [models.Index(fields=['specialty', 'slot_datetime'], name='booking_nex_special_f0cad8_idx')],
+                'unique_together': {('doctor', 'slot_datetime')},
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.8 on 2026-10-19 13:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0022_nextavailableslot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScheduleClosure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start', models.DateTimeField(verbose_name='شروع')),
+                ('end', models.DateTimeField(verbose_name='پایان')),
+                ('reason', models.CharField(blank=True, max_length=255, verbose_name='علت')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='closures', to='booking.doctorprofile', verbose_name='پزشک')),
+            ],
+            options={
+                'verbose_name': 'تعطیلی',
+                'verbose_name_plural': 'تعطیلی\u200cها',
+                'ordering': ['start'],
+                'indexes': [models.Index(fields=['doctor', 'end'], name='booking_sch_doctor__32fed9_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.8 on 2026-10-19 13:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0023_scheduleclosure'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScheduleOverride',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='تاریخ')),
+                ('shift', models.CharField(choices=[('MORNING', 'صبح'), ('AFTERNOON', 'بعدازظهر')], max_length=10, verbose_name='شیفت کاری')),
+                ('start_time', models.TimeField(verbose_name='ساعت شروع')),
+                ('end_time', models.TimeField(verbose_name='ساعت پایان')),
+                ('visit_count', models.PositiveIntegerField(verbose_name='تعداد ویزیت')),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='overrides', to='booking.doctorprofile', verbose_name='پزشک')),
+            ],
+            options={
+                'verbose_name': 'برنامه کاری روز خاص',
+                'verbose_name_plural': 'برنامه\u200cهای کاری روز خاص',
+                'unique_together': {('doctor', 'date', 'shift')},
+            },
+        ),
+    ]
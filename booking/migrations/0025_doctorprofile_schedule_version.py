@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-19 13:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0024_scheduleoverride'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='doctorprofile',
+            name='schedule_version',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='نسخه برنامه نوبت\u200cدهی'),
+        ),
+    ]
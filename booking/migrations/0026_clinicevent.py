@@ -0,0 +1,30 @@
+# Generated by Django 5.2.8 on 2026-10-19 13:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0025_doctorprofile_schedule_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClinicEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('booked', 'نوبت جدید'), ('paid', 'پرداخت شده'), ('canceled', 'لغو شده'), ('visited', 'ویزیت شده')], max_length=10, verbose_name='نوع رویداد')),
+                ('appointment_id', models.BigIntegerField(blank=True, null=True, verbose_name='شناسه نوبت')),
+                ('data', models.JSONField(blank=True, default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='events', to='booking.doctorprofile', verbose_name='پزشک')),
+            ],
+            options={
+                'verbose_name': 'رویداد مطب',
+                'verbose_name_plural': 'رویدادهای مطب',
+                'indexes': [models.Index(fields=['doctor', 'id'], name='booking_cli_doctor__8f11ac_idx')],
+            },
+        ),
+    ]
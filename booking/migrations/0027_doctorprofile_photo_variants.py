@@ -0,0 +1,33 @@
+# Generated by Django 5.2.8 on 2026-10-19 14:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0026_clinicevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='doctorprofile',
+            name='photo_height',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='doctorprofile',
+            name='photo_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='doctorprofile',
+            name='photo_width',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AlterField(
+            model_name='doctorprofile',
+            name='photo',
+            field=models.ImageField(blank=True, height_field='photo_height', null=True, upload_to='doctor_photos/', verbose_name='عکس پزشک', width_field='photo_width'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-19 14:11
+
+import booking.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0027_doctorprofile_photo_variants'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='doctorprofile',
+            name='photo',
+            field=models.ImageField(blank=True, height_field='photo_height', null=True, storage=booking.storage.ContentAddressedStorage(), upload_to='doctor_photos/', verbose_name='عکس پزشک', width_field='photo_width'),
+        ),
+    ]
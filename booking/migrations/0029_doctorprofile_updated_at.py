@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-19 14:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0028_doctorprofile_photo_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='doctorprofile',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, verbose_name='آخرین تغییر'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.8 on 2026-10-19 14:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0029_doctorprofile_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['appointment_datetime'], name='booking_app_appoint_5d2b2f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['doctor', 'appointment_datetime'], name='booking_app_doctor__ca8561_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['patient_phone'], name='booking_app_patient_bf5daf_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['patient_national_id'], name='booking_app_patient_cd0c4e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['patient_name'], name='booking_app_patient_286433_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.8 on 2026-10-19 14:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0030_appointment_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReminderLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('day_before', 'یادآوری روز قبل')], default='day_before', max_length=20, verbose_name='نوع یادآوری')),
+                ('status', models.CharField(choices=[('sending', 'در حال ارسال'), ('sent', 'ارسال شده'), ('failed', 'ناموفق')], default='sending', max_length=10, verbose_name='وضعیت')),
+                ('run', models.UUIDField(verbose_name='شناسه اجرا')),
+                ('error', models.CharField(blank=True, max_length=255, verbose_name='خطا')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('sent_at', models.DateTimeField(blank=True, null=True, verbose_name='زمان ارسال')),
+                ('appointment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reminders', to='booking.appointment', verbose_name='نوبت')),
+            ],
+            options={
+                'verbose_name': 'یادآوری نوبت',
+                'verbose_name_plural': 'یادآوری\u200cهای نوبت',
+                'indexes': [models.Index(fields=['run'], name='booking_rem_run_b775da_idx')],
+                'constraints': [models.UniqueConstraint(fields=('appointment', 'kind'), name='unique_reminder_per_appointment')],
+            },
+        ),
+    ]
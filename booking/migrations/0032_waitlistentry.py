@@ -0,0 +1,61 @@
+# Generated by Django 5.2.8 on 2026-10-19 14:48
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0031_reminderlog'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WaitlistEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('patient_name', models.CharField(max_length=100, verbose_name='نام بیمار')),
+                ('patient_phone', models.CharField(max_length=20, verbose_name='شماره همراه بیمار')),
+                ('insurance_type', models.CharField(choices=[('TAMIN', 'تامین اجتماعی'), ('KHADAMAT', 'خدمات درمانی'), ('ARTESH', 'نیروی مسلح'), ('AZAD', 'آزاد')], default='AZAD', max_length=10, verbose_name='نوع بیمه')),
+                ('date_from', models.DateField(verbose_name='از تاریخ')),
+                ('date_to', models.DateField(verbose_name='تا تاریخ')),
+                ('shift', models.CharField(blank=True, choices=[('MORNING', 'صبح'), ('AFTERNOON', 'بعدازظهر')], max_length=10, verbose_name='شیفت (خالی: هر شیفت)')),
+                ('status', models.CharField(choices=[('waiting', 'در انتظار'), ('offered', 'پیشنهاد شده'), ('booked', 'رزرو شده'), ('expired', 'منقضی شده'), ('cancelled', 'لغو شده')], default='waiting', max_length=10, verbose_name='وضعیت')),
+                ('offer_expires_at', models.DateTimeField(blank=True, null=True, verbose_name='مهلت پیشنهاد')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'لیست انتظار',
+                'verbose_name_plural': 'لیست انتظار',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(condition=models.Q(('status', 4)), fields=['created_at'], name='appointment_pending_idx'),
+        ),
+        migrations.AddField(
+            model_name='waitlistentry',
+            name='appointment',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='waitlist_offers', to='booking.appointment', verbose_name='نوبت پیشنهادی'),
+        ),
+        migrations.AddField(
+            model_name='waitlistentry',
+            name='doctor',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='waitlist', to='booking.doctorprofile', verbose_name='پزشک'),
+        ),
+        migrations.AddField(
+            model_name='waitlistentry',
+            name='patient',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='waitlist_entries', to=settings.AUTH_USER_MODEL, verbose_name='بیمار'),
+        ),
+        migrations.AddIndex(
+            model_name='waitlistentry',
+            index=models.Index(condition=models.Q(('status', 'waiting')), fields=['doctor', 'created_at'], name='waitlist_waiting_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='waitlistentry',
+            index=models.Index(condition=models.Q(('status', 'offered')), fields=['offer_expires_at'], name='waitlist_offered_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-19 15:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0032_waitlistentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointment',
+            name='payment_started_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='زمان شروع پرداخت'),
+        ),
+        migrations.AddField(
+            model_name='waitlistentry',
+            name='offer_sent_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='زمان ارسال پیامک پیشنهاد'),
+        ),
+    ]
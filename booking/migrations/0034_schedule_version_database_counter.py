@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-19 15:39
+
+import booking.models
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0033_payment_started_at_offer_sent_at'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='doctorprofile',
+            name='schedule_version',
+            field=booking.models.DatabaseCounterField(default=0, editable=False, verbose_name='نسخه برنامه نوبت\u200cدهی'),
+        ),
+    ]
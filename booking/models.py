@@ -3,6 +3,22 @@ from django.db import models
 from django.contrib.auth.models import AbstractUser, UserManager
 from django.conf import settings
 
+from . import images
+from .storage import photo_storage
+
+
+class DatabaseCounterField(models.PositiveIntegerField):
+    """
+    A counter only ever changed by ``F()`` updates in the database. A save of
+    an existing row leaves the column as it is, so an instance loaded earlier
+    does not write its stale copy back; an insert stores the instance's value.
+    """
+
+    def pre_save(self, model_instance, add):
+        if add:
+            return super().pre_save(model_instance, add)
+        return models.F(self.attname)
+
 
 class CustomUserManager(UserManager):
     def _create_user(self, username, password, **extra_fields):
@@ -73,7 +89,14 @@ class DoctorProfile(models.Model):
     address = models.TextField(verbose_name="آدرس مطب", null=True, blank=True)
     phone_number = models.CharField(max_length=20, verbose_name="شماره تلفن مطب", null=True, blank=True)
     mobile_number = models.CharField(max_length=20, verbose_name="شماره موبایل", null=True, blank=True)
-    photo = models.ImageField(upload_to='doctor_photos/', null=True, blank=True, verbose_name="عکس پزشک")
+    photo = models.ImageField(
+        upload_to='doctor_photos/', storage=photo_storage, null=True, blank=True, verbose_name="عکس پزشک",
+        width_field='photo_width', height_field='photo_height',
+    )
+    photo_width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    photo_height = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    # Resized copies of the photo, see booking.images.prepare_photo.
+    photo_variants = models.JSONField(default=dict, blank=True, editable=False)
     biography = models.TextField(blank=True, verbose_name="بیوگرافی")
     visit_fee = models.DecimalField(max_digits=10, decimal_places=0, default=100000, verbose_name="هزینه ویزیت آنلاین")
     booking_days = models.PositiveIntegerField(default=30, verbose_name="تعداد روزهای نمایش نوبت")
@@ -81,11 +104,23 @@ class DoctorProfile(models.Model):
     secretary_name = models.CharField(max_length=100, blank=True, null=True, verbose_name="نام منشی")
     secretary_mobile = models.CharField(max_length=20, blank=True, null=True, verbose_name="موبایل منشی")
     financial_settings_completed = models.BooleanField(default=False, verbose_name="تنظیمات مالی تکمیل شده")
+    # Bumped in the database only (see signals.bump_schedule_version).
+    schedule_version = DatabaseCounterField(default=0, editable=False, verbose_name="نسخه برنامه نوبت‌دهی")
+    # Also bumped by changes to the doctor's availability and reviews (see signals.touch_doctor).
+    updated_at = models.DateTimeField(auto_now=True, db_index=True, verbose_name="آخرین تغییر")
 
     @property
     def has_availability(self):
         return self.availabilities.exists()
 
+    def save(self, *args, **kwargs):
+        if not self.photo:
+            self.photo_variants = {}
+        elif not self.photo._committed:
+            # A new upload: store it processed, together with its variants.
+            images.prepare_photo(self)
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"دکتر {self.user.get_full_name()}"
 
@@ -149,6 +184,8 @@ class Appointment(models.Model):
     status = models.IntegerField(choices=STATUS_CHOICES, default=4)
     created_at = models.DateTimeField(auto_now_add=True)
     payment_order_id = models.BigIntegerField(unique=True, null=True, blank=True, verbose_name="شناسه یکتای پرداخت")
+    # When the latest payment order was issued; an unpaid hold runs out PAYMENT_HOLD_MINUTES after it.
+    payment_started_at = models.DateTimeField(null=True, blank=True, editable=False, verbose_name="زمان شروع پرداخت")
 
     # Fields for secretary panel
     PAYMENT_METHOD_CHOICES = (
@@ -161,6 +198,14 @@ class Appointment(models.Model):
     service_description = models.CharField(max_length=255, default="حق ویزیت", verbose_name="شرح خدمات")
     payment_method = models.IntegerField(choices=PAYMENT_METHOD_CHOICES, null=True, blank=True, verbose_name="نوع پرداخت")
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # The status, doctor and time as loaded, so that signals can tell what a save changed.
+        instance._loaded_status = instance.__dict__.get('status')
+        instance._loaded_slot = (instance.__dict__.get('doctor_id'), instance.__dict__.get('appointment_datetime'))
+        return instance
+
     def __str__(self):
         return f"نوبت برای {self.patient_name} نزد {self.doctor} در تاریخ {self.appointment_datetime.strftime('%Y-%m-%d %H:%M')}"
 
@@ -168,6 +213,16 @@ class Appointment(models.Model):
         verbose_name = "نوبت"
         verbose_name_plural = "نوبت‌ها"
         ordering = ['-appointment_datetime']
+        # For the admin changelist: its default ordering, the doctor filter and the search fields.
+        indexes = [
+            models.Index(fields=['appointment_datetime']),
+            models.Index(fields=['doctor', 'appointment_datetime']),
+            models.Index(fields=['patient_phone']),
+            models.Index(fields=['patient_national_id']),
+            models.Index(fields=['patient_name']),
+            # Unpaid holds, for expire_holds.
+            models.Index(fields=['created_at'], condition=models.Q(status=4), name='appointment_pending_idx'),
+        ]
 
 class Review(models.Model):
     RATING_CHOICES = (
@@ -229,4 +284,168 @@ class InsuranceFee(models.Model):
     class Meta:
         verbose_name = "هزینه بیمه"
         verbose_name_plural = "هزینه‌های بیمه"
-        unique_together = ('doctor', 'insurance_type')
\ No newline at end of file
+        unique_together = ('doctor', 'insurance_type')
+
+class NextAvailableSlot(models.Model):
+    """
+    Index of each doctor's next free appointment times, kept up to date by
+    booking.signals and rebuilt by the rebuild_slot_index command.
+    """
+    doctor = models.ForeignKey(DoctorProfile, on_delete=models.CASCADE, related_name='next_slots', verbose_name="پزشک")
+    specialty = models.ForeignKey(Specialty, on_delete=models.CASCADE, null=True, blank=True, related_name='next_slots', verbose_name="تخصص")
+    slot_datetime = models.DateTimeField(verbose_name="زمان نوبت")
+
+    def __str__(self):
+        return f"نوبت آزاد {self.doctor} در {self.slot_datetime}"
+
+    class Meta:
+        verbose_name = "نوبت آزاد بعدی"
+        verbose_name_plural = "نوبت‌های آزاد بعدی"
+        ordering = ['slot_datetime']
+        unique_together = ('doctor', 'slot_datetime')
+        indexes = [models.Index(fields=['specialty', 'slot_datetime'])]
+
+
+class ScheduleClosure(models.Model):
+    """
+    A period in which the doctor takes no appointments (a closed shift, day
+    or vacation). Covers ``[start, end)``.
+    """
+    doctor = models.ForeignKey(DoctorProfile, on_delete=models.CASCADE, related_name='closures', verbose_name="پزشک")
+    start = models.DateTimeField(verbose_name="شروع")
+    end = models.DateTimeField(verbose_name="پایان")
+    reason = models.CharField(max_length=255, blank=True, verbose_name="علت")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"تعطیلی {self.doctor} از {self.start} تا {self.end}"
+
+    class Meta:
+        verbose_name = "تعطیلی"
+        verbose_name_plural = "تعطیلی‌ها"
+        ordering = ['start']
+        indexes = [models.Index(fields=['doctor', 'end'])]
+
+
+class ScheduleOverride(models.Model):
+    """
+    Replaces a shift of the weekly DoctorAvailability on one date, or adds
+    one. A visit count of 0 cancels the shift on that date.
+    """
+    doctor = models.ForeignKey(DoctorProfile, on_delete=models.CASCADE, related_name='overrides', verbose_name="پزشک")
+    date = models.DateField(verbose_name="تاریخ")
+    shift = models.CharField(max_length=10, choices=DoctorAvailability.SHIFT_CHOICES, verbose_name="شیفت کاری")
+    start_time = models.TimeField(verbose_name="ساعت شروع")
+    end_time = models.TimeField(verbose_name="ساعت پایان")
+    visit_count = models.PositiveIntegerField(verbose_name="تعداد ویزیت")
+
+    def __str__(self):
+        return f"{self.doctor} - {self.date} {self.get_shift_display()}"
+
+    class Meta:
+        verbose_name = "برنامه کاری روز خاص"
+        verbose_name_plural = "برنامه‌های کاری روز خاص"
+        unique_together = ('doctor', 'date', 'shift')
+
+
+class ClinicEvent(models.Model):
+    """
+    A change to a doctor's appointments, streamed to the open clinic screens
+    (see ``booking.events``).
+    """
+    KIND_CHOICES = (
+        ('booked', 'نوبت جدید'),
+        ('paid', 'پرداخت شده'),
+        ('canceled', 'لغو شده'),
+        ('visited', 'ویزیت شده'),
+    )
+
+    doctor = models.ForeignKey(DoctorProfile, on_delete=models.CASCADE, related_name='events', verbose_name="پزشک")
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, verbose_name="نوع رویداد")
+    appointment_id = models.BigIntegerField(null=True, blank=True, verbose_name="شناسه نوبت")
+    data = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.get_kind_display()} - {self.doctor}"
+
+    class Meta:
+        verbose_name = "رویداد مطب"
+        verbose_name_plural = "رویدادهای مطب"
+        indexes = [models.Index(fields=['doctor', 'id'])]
+
+
+class ReminderLog(models.Model):
+    """
+    A reminder SMS for an appointment (see ``booking.reminders``). The row is
+    written before the SMS is sent, so a rerun never sends it twice.
+    """
+    KIND_CHOICES = (
+        ('day_before', 'یادآوری روز قبل'),
+    )
+    STATUS_CHOICES = (
+        ('sending', 'در حال ارسال'),
+        ('sent', 'ارسال شده'),
+        ('failed', 'ناموفق'),
+    )
+
+    appointment = models.ForeignKey(Appointment, on_delete=models.CASCADE, related_name='reminders', verbose_name="نوبت")
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, default='day_before', verbose_name="نوع یادآوری")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='sending', verbose_name="وضعیت")
+    run = models.UUIDField(verbose_name="شناسه اجرا")
+    error = models.CharField(max_length=255, blank=True, verbose_name="خطا")
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True, verbose_name="زمان ارسال")
+
+    def __str__(self):
+        return f"{self.get_kind_display()} - {self.appointment_id} ({self.get_status_display()})"
+
+    class Meta:
+        verbose_name = "یادآوری نوبت"
+        verbose_name_plural = "یادآوری‌های نوبت"
+        constraints = [
+            models.UniqueConstraint(fields=['appointment', 'kind'], name='unique_reminder_per_appointment'),
+        ]
+        indexes = [models.Index(fields=['run'])]
+
+
+class WaitlistEntry(models.Model):
+    """
+    A patient waiting for a slot with a doctor between two dates, in one
+    shift or any. A freed slot is offered to the entry that has waited
+    longest and held for it a short while (see ``booking.waitlist``).
+    """
+    STATUS_CHOICES = (
+        ('waiting', 'در انتظار'),
+        ('offered', 'پیشنهاد شده'),
+        ('booked', 'رزرو شده'),
+        ('expired', 'منقضی شده'),
+        ('cancelled', 'لغو شده'),
+    )
+
+    doctor = models.ForeignKey(DoctorProfile, on_delete=models.CASCADE, related_name='waitlist', verbose_name="پزشک")
+    patient = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='waitlist_entries', verbose_name="بیمار", null=True, blank=True)
+    patient_name = models.CharField(max_length=100, verbose_name="نام بیمار")
+    patient_phone = models.CharField(max_length=20, verbose_name="شماره همراه بیمار")
+    insurance_type = models.CharField(max_length=10, choices=Appointment.INSURANCE_CHOICES, verbose_name="نوع بیمه", default='AZAD')
+    date_from = models.DateField(verbose_name="از تاریخ")
+    date_to = models.DateField(verbose_name="تا تاریخ")
+    shift = models.CharField(max_length=10, choices=DoctorAvailability.SHIFT_CHOICES, blank=True, verbose_name="شیفت (خالی: هر شیفت)")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='waiting', verbose_name="وضعیت")
+    appointment = models.ForeignKey(Appointment, on_delete=models.SET_NULL, related_name='waitlist_offers', verbose_name="نوبت پیشنهادی", null=True, blank=True)
+    offer_expires_at = models.DateTimeField(null=True, blank=True, verbose_name="مهلت پیشنهاد")
+    offer_sent_at = models.DateTimeField(null=True, blank=True, verbose_name="زمان ارسال پیامک پیشنهاد")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.patient_name} - {self.doctor} ({self.get_status_display()})"
+
+    class Meta:
+        verbose_name = "لیست انتظار"
+        verbose_name_plural = "لیست انتظار"
+        # Only the waiting and offered entries are ever searched, so the
+        # indexes leave out the history.
+        indexes = [
+            models.Index(fields=['doctor', 'created_at'], condition=models.Q(status='waiting'), name='waitlist_waiting_idx'),
+            models.Index(fields=['offer_expires_at'], condition=models.Q(status='offered'), name='waitlist_offered_idx'),
+        ]
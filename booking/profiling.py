@@ -0,0 +1,240 @@
+"""
+On-demand request profiling for staff.
+
+A staff user adds ``?_profile=sample`` (or ``cprofile``), or sends an
+``X-Profile`` header with one of those values, to have that one request
+profiled. ``sample`` records the stack of the request thread every
+``SAMPLE_INTERVAL`` seconds in the collapsed format of flamegraph.pl and
+speedscope; ``cprofile`` stores cProfile stats (snakeviz, flameprof). Both
+also record every SQL query with its duration. Profiles are written to
+``PROFILER_DIR`` and listed at ``/profiles/``; each user may profile
+``PROFILER_RATE_LIMIT`` requests an hour.
+
+Requests without the parameter or header go straight through.
+"""
+import cProfile
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import ExitStack
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.utils import timezone
+from django.utils.text import slugify
+
+PARAMETER = '_profile'
+HEADER = 'X-Profile'
+MODES = ('sample', 'cprofile')
+SAMPLE_INTERVAL = 0.001
+KEEP = 200
+EXTENSIONS = {'sample': 'folded', 'cprofile': 'prof'}
+
+
+def profile_dir():
+    return Path(settings.PROFILER_DIR)
+
+
+class StackSampler(threading.Thread):
+    """
+    Counts the stacks of another thread, sampled every ``interval`` seconds.
+    Started and stopped like ``cProfile.Profile``.
+    """
+
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def enable(self):
+        self.start()
+
+    def disable(self):
+        self._done.set()
+        self.join()
+
+    def folded(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+
+class QueryRecorder:
+    """An ``execute_wrapper`` that notes every query with its duration."""
+
+    def __init__(self, alias):
+        self.alias = alias
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'alias': self.alias,
+                'sql': sql,
+                'ms': round((time.perf_counter() - start) * 1000, 3),
+            })
+
+
+def requested_mode(request):
+    mode = request.GET.get(PARAMETER) or request.headers.get(HEADER)
+    if mode is None:
+        return None
+    return mode if mode in MODES else MODES[0]
+
+
+def allowed(request):
+    """Whether the user of the request is staff and has profiles left this hour."""
+    user = request.user
+    if not (user.is_active and user.is_staff):
+        return False
+    key = f'profiler-rate:{user.pk}'
+    cache.add(key, 0, 60 * 60)
+    try:
+        return cache.incr(key) <= settings.PROFILER_RATE_LIMIT
+    except ValueError:
+        # The counter expired between add() and incr().
+        return True
+
+
+def _prune(directory):
+    metas = sorted(directory.glob('*.json'))
+    for meta in metas[:max(len(metas) - KEEP, 0)]:
+        for path in directory.glob(f'{meta.stem}.*'):
+            path.unlink(missing_ok=True)
+
+
+def save(request, response, mode, profiler, queries, duration):
+    """Writes the profile and its description; returns the name they share."""
+    match = request.resolver_match
+    view = match.view_name if match else 'unresolved'
+    name = '-'.join(filter(None, [
+        timezone.now().strftime('%Y%m%d-%H%M%S'),
+        slugify(view.replace(':', '-')),
+        slugify('-'.join(str(value) for value in match.kwargs.values()))[:40] if match else '',
+        uuid.uuid4().hex[:6],
+    ]))
+    directory = profile_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+
+    extension = EXTENSIONS[mode]
+    if mode == 'cprofile':
+        profiler.dump_stats(directory / f'{name}.{extension}')
+    else:
+        (directory / f'{name}.{extension}').write_text(profiler.folded(), encoding='utf-8')
+    meta = {
+        'name': name,
+        'file': f'{name}.{extension}',
+        'mode': mode,
+        'view': view,
+        'args': list(match.args) if match else [],
+        'kwargs': {key: str(value) for key, value in match.kwargs.items()} if match else {},
+        'path': request.get_full_path(),
+        'method': request.method,
+        'status': response.status_code,
+        'user': request.user.get_username(),
+        'created_at': timezone.now().isoformat(),
+        'duration_ms': round(duration * 1000, 3),
+        'sql_ms': round(sum(query['ms'] for query in queries), 3),
+        'queries': queries,
+    }
+    (directory / f'{name}.json').write_text(json.dumps(meta, ensure_ascii=False, indent=1), encoding='utf-8')
+    _prune(directory)
+    return name
+
+
+def list_profiles():
+    """The descriptions of the stored profiles, newest first, without their queries."""
+    directory = profile_dir()
+    if not directory.is_dir():
+        return []
+    profiles = []
+    for path in sorted(directory.glob('*.json'), reverse=True):
+        try:
+            meta = json.loads(path.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            continue
+        meta['query_count'] = len(meta.pop('queries', []))
+        profiles.append(meta)
+    return profiles
+
+
+def profile_path(filename):
+    """The path of a stored profile file, or None if ``filename`` is not one."""
+    directory = profile_dir()
+    path = directory / filename
+    if path.parent != directory or path.suffix.lstrip('.') not in (*EXTENSIONS.values(), 'json') or not path.is_file():
+        return None
+    return path
+
+
+def _profiled(request, mode, call_view):
+    recorders = [QueryRecorder(alias) for alias in connections]
+    with ExitStack() as stack:
+        for recorder in recorders:
+            stack.enter_context(connections[recorder.alias].execute_wrapper(recorder))
+        profiler = cProfile.Profile() if mode == 'cprofile' else StackSampler(threading.get_ident())
+        start = time.perf_counter()
+        profiler.enable()
+        try:
+            response = call_view()
+            if hasattr(response, 'render') and not response.is_rendered:
+                response.render()
+        finally:
+            profiler.disable()
+        duration = time.perf_counter() - start
+    queries = [query for recorder in recorders for query in recorder.queries]
+    response['X-Profile-Id'] = save(request, response, mode, profiler, queries, duration)
+    return response
+
+
+class ProfilerMiddleware:
+    """
+    Profiles the views of the requests that ask for it (see the module
+    docstring) by calling them from ``process_view`` on the thread they would
+    run on anyway. Async views are not profiled: their coroutines share the
+    event loop with other requests.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+            # Checked on the event loop, so untriggered requests don't hop to a thread.
+            self.process_view = self.aprocess_view
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        mode = requested_mode(request)
+        if mode is None or iscoroutinefunction(view_func) or not allowed(request):
+            return None
+        return _profiled(request, mode, lambda: view_func(request, *view_args, **view_kwargs))
+
+    async def aprocess_view(self, request, view_func, view_args, view_kwargs):
+        if requested_mode(request) is None:
+            return None
+        return await sync_to_async(ProfilerMiddleware.process_view)(self, request, view_func, view_args, view_kwargs)
@@ -0,0 +1,117 @@
+"""
+Appointment reminders.
+
+``send_reminders`` texts every patient with a reserved appointment on a given
+day, normally tomorrow (``manage.py send_reminders``, run from cron). The
+appointments are read in one query over the ``appointment_datetime`` index,
+together with their doctors and leaving out those already reminded. Each
+chunk is claimed with ``ReminderLog`` rows before its SMSes go out, so a
+rerun or an overlapping run never sends a reminder twice; failed sends are
+retried by the next run. The SMSes of a chunk are sent concurrently over the
+pooled HTTP client. Nothing is sent while ``AMOOT_REMINDER_PATTERN_ID`` is unset.
+"""
+import datetime
+import logging
+import time
+import uuid
+from collections import namedtuple
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from . import gateways, jalali
+from .models import Appointment, ReminderLog
+
+KIND = 'day_before'
+CHUNK_SIZE = 500
+CONCURRENCY = 50
+TIME_FORMAT = '%Y/%m/%d ساعت %H:%M'
+
+logger = logging.getLogger('booking.sms')
+
+Reminder = namedtuple('Reminder', 'appointment_id mobile pattern_values')
+
+
+def due(day):
+    """The reserved appointments on ``day`` that have not been reminded, with what their SMS says."""
+    start = timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+    reminded = ReminderLog.objects.filter(appointment=OuterRef('pk'), kind=KIND, status__in=['sending', 'sent'])
+    rows = Appointment.objects.filter(
+        status=1, appointment_datetime__gte=start, appointment_datetime__lt=start + datetime.timedelta(days=1),
+    ).exclude(Exists(reminded)).order_by('appointment_datetime').values_list(
+        'pk', 'patient_name', 'patient_phone', 'appointment_datetime',
+        'doctor__user__first_name', 'doctor__user__last_name', 'doctor__address', 'doctor__phone_number',
+    )
+
+    times = {}
+    reminders = []
+    for pk, patient_name, mobile, at, first_name, last_name, address, phone in rows:
+        # Most appointments of a day share their slot times.
+        if at not in times:
+            times[at] = jalali.format_date(jalali.localtime(at), TIME_FORMAT)
+        doctor = f'{first_name} {last_name}'.strip()
+        reminders.append(Reminder(pk, mobile, f'{patient_name},{doctor},{times[at]},{address or ""},{phone or ""}'))
+    return reminders
+
+
+def _claim(appointment_ids, run):
+    """Marks the reminders of ``appointment_ids`` as this run's; returns the IDs it got."""
+    with transaction.atomic():
+        ReminderLog.objects.filter(appointment_id__in=appointment_ids, kind=KIND, status='failed').update(
+            run=run, status='sending', error='',
+        )
+        ReminderLog.objects.bulk_create(
+            [ReminderLog(appointment_id=pk, kind=KIND, run=run) for pk in appointment_ids], ignore_conflicts=True,
+        )
+    return set(ReminderLog.objects.filter(run=run, appointment_id__in=appointment_ids).values_list('appointment_id', flat=True))
+
+
+def _record(run, chunk, outcomes):
+    sent = [reminder.appointment_id for reminder, (outcome, _) in zip(chunk, outcomes) if outcome == 'sent']
+    ReminderLog.objects.filter(run=run, appointment_id__in=sent).update(status='sent', sent_at=timezone.now())
+    errors = {}
+    for reminder, (outcome, detail) in zip(chunk, outcomes):
+        if outcome != 'sent':
+            errors.setdefault(f'{outcome}: {detail}'[:255], []).append(reminder.appointment_id)
+    for error, appointment_ids in errors.items():
+        ReminderLog.objects.filter(run=run, appointment_id__in=appointment_ids).update(status='failed', error=error)
+    return len(sent)
+
+
+async def asend_reminders(day, concurrency=CONCURRENCY, chunk_size=CHUNK_SIZE, dry_run=False):
+    started = time.perf_counter()
+    reminders = await sync_to_async(due)(day)
+    stats = {'day': day.isoformat(), 'due': len(reminders), 'sent': 0, 'failed': 0, 'skipped': 0}
+    if not dry_run and reminders and not settings.AMOOT_REMINDER_PATTERN_ID:
+        logger.warning('AMOOT_REMINDER_PATTERN_ID is not set; %s reminders for %s were not sent', len(reminders), stats['day'])
+        dry_run = True
+    if not dry_run:
+        run = uuid.uuid4()
+        for offset in range(0, len(reminders), chunk_size):
+            chunk = reminders[offset:offset + chunk_size]
+            claimed = await sync_to_async(_claim)([reminder.appointment_id for reminder in chunk], run)
+            stats['skipped'] += len(chunk) - len(claimed)
+            chunk = [reminder for reminder in chunk if reminder.appointment_id in claimed]
+            outcomes = await gateways.asend_sms_batch(
+                [(reminder.mobile, reminder.pattern_values) for reminder in chunk],
+                settings.AMOOT_REMINDER_PATTERN_ID, concurrency=concurrency,
+            )
+            sent = await sync_to_async(_record)(run, chunk, outcomes)
+            stats['sent'] += sent
+            stats['failed'] += len(chunk) - sent
+    stats['seconds'] = round(time.perf_counter() - started, 3)
+    stats['per_second'] = round(stats['sent'] / stats['seconds'], 1) if stats['seconds'] else 0
+    logger.info('Reminders for %s: %s sent, %s failed', stats['day'], stats['sent'], stats['failed'], extra=stats)
+    return stats
+
+
+def send_reminders(day, **options):
+    """
+    Sends the reminders of ``day``; returns counts of the due, sent, failed
+    and skipped (claimed by another run) reminders and the time taken.
+    """
+    # Database work runs back on this thread, in its connection and transaction.
+    return async_to_sync(asend_reminders)(day, **options)
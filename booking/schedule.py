@@ -0,0 +1,321 @@
+"""
+Slot engine.
+
+Resolves the effective schedule of a doctor (weekly ``DoctorAvailability``
+templates, with dated ``ScheduleOverride`` rows layered on top), expands it
+into concrete appointment times, takes out booked, blocked and closed ones,
+and maintains the ``NextAvailableSlot`` index used to find the earliest free
+slot across doctors.
+"""
+import bisect
+import datetime
+from collections import namedtuple
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import (
+    Appointment, DoctorAvailability, DoctorProfile, NextAvailableSlot, ScheduleClosure, ScheduleOverride,
+    TimeSlotException,
+)
+
+BOOKED_STATUSES = (1, 2, 4)
+NEXT_SLOTS_PER_DOCTOR = 5
+
+
+def day_start(day):
+    """Midnight at the start of ``day``, as an aware datetime."""
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+
+
+class ClosedPeriods:
+    """
+    The closures of a doctor over a period, merged into sorted,
+    non-overlapping ``[start, end)`` intervals so that checking a moment is a
+    binary search rather than a scan over the closure rows.
+    """
+
+    def __init__(self, intervals=()):
+        self.starts = []
+        self.ends = []
+        for start, end in sorted(intervals):
+            if self.ends and start <= self.ends[-1]:
+                self.ends[-1] = max(self.ends[-1], end)
+            else:
+                self.starts.append(start)
+                self.ends.append(end)
+
+    @classmethod
+    def for_doctor(cls, doctor, start, end):
+        """The closures of ``doctor`` that overlap ``[start, end)``."""
+        return cls(ScheduleClosure.objects.filter(
+            doctor=doctor, start__lt=end, end__gt=start,
+        ).values_list('start', 'end'))
+
+    def __contains__(self, moment):
+        index = bisect.bisect_right(self.starts, moment) - 1
+        return index >= 0 and moment < self.ends[index]
+
+    def __bool__(self):
+        return bool(self.starts)
+
+
+class Shift(namedtuple('Shift', 'shift start_time end_time visit_count is_override')):
+    """One shift of the effective schedule of a day."""
+
+    @property
+    def label(self):
+        return dict(DoctorAvailability.SHIFT_CHOICES).get(self.shift, self.shift)
+
+
+def effective_shifts(doctor, start_date, end_date):
+    """
+    The shifts the doctor works on each date between two dates (inclusive),
+    as ``{date: [Shift, ...]}`` sorted by start time, in one query for the
+    weekly templates and one for the overrides. An override replaces the
+    weekly shift of the same name on its date, or adds it; one with no
+    visits cancels it. Dates without shifts are left out.
+    """
+    weekly = {}
+    for availability in DoctorAvailability.objects.filter(doctor=doctor, is_active=True):
+        weekly.setdefault(availability.day_of_week, {})[availability.shift] = Shift(
+            availability.shift, availability.start_time, availability.end_time, availability.visit_count, False,
+        )
+    overrides = {}
+    for override in ScheduleOverride.objects.filter(doctor=doctor, date__range=[start_date, end_date]):
+        overrides.setdefault(override.date, {})[override.shift] = Shift(
+            override.shift, override.start_time, override.end_time, override.visit_count, True,
+        )
+    if not weekly and not overrides:
+        return {}
+
+    result = {}
+    day = start_date
+    while day <= end_date:
+        shifts = dict(weekly.get(day.weekday(), {}))
+        shifts.update(overrides.get(day, {}))
+        shifts = sorted((shift for shift in shifts.values() if shift.visit_count > 0), key=lambda shift: shift.start_time)
+        if shifts:
+            result[day] = shifts
+        day += datetime.timedelta(days=1)
+    return result
+
+
+def shift_slots(shift, day):
+    """The appointment times of one shift (a ``Shift`` or ``DoctorAvailability``) on ``day``, as aware datetimes."""
+    start = datetime.datetime.combine(day, shift.start_time)
+    duration = datetime.datetime.combine(day, shift.end_time) - start
+    interval = duration / shift.visit_count if shift.visit_count > 1 else duration
+    return [timezone.make_aware(start + interval * i) for i in range(shift.visit_count)]
+
+
+def day_slots(doctor, day, include_added=False):
+    """
+    Returns the effective shifts of a doctor on ``day`` and the list of
+    their slots, each marked available, booked, canceled (a blocked slot) or
+    closed (inside a ``ScheduleClosure``). With ``include_added`` the extra
+    slots added by the secretary are listed too.
+    """
+    shifts = effective_shifts(doctor, day, day).get(day, [])
+    booked = set(Appointment.objects.filter(
+        doctor=doctor, appointment_datetime__date=day, status__in=BOOKED_STATUSES,
+    ).values_list('appointment_datetime', flat=True))
+    canceled, added = set(), set()
+    for slot, is_cancellation in TimeSlotException.objects.filter(
+        doctor=doctor, datetime_slot__date=day,
+    ).values_list('datetime_slot', 'is_cancellation'):
+        (canceled if is_cancellation else added).add(slot)
+    closed = ClosedPeriods.for_doctor(doctor, day_start(day), day_start(day + datetime.timedelta(days=1)))
+
+    times = {slot for shift in shifts for slot in shift_slots(shift, day)}
+    if include_added:
+        times |= added
+    all_slots = []
+    for slot in sorted(times):
+        if slot in booked:
+            status = 'booked'
+        elif slot in canceled:
+            status = 'canceled'
+        elif slot in closed:
+            status = 'closed'
+        else:
+            status = 'available'
+        all_slots.append({'time': slot, 'status': status})
+    return shifts, all_slots
+
+
+def day_summaries(doctor, start_date, end_date):
+    """
+    Capacity and bookings per working day of the effective schedule between
+    two dates (inclusive), in one pass. ``capacity`` counts the slots not blocked or closed, ``booked``
+    the active appointments of the day. Days without a shift are left out.
+    """
+    shifts_by_day = effective_shifts(doctor, start_date, end_date)
+    if not shifts_by_day:
+        return []
+
+    booked_counts = {}
+    for moment in Appointment.objects.filter(
+        doctor=doctor, appointment_datetime__date__range=[start_date, end_date], status__in=BOOKED_STATUSES,
+    ).values_list('appointment_datetime', flat=True):
+        day = timezone.localdate(moment)
+        booked_counts[day] = booked_counts.get(day, 0) + 1
+    canceled = set(TimeSlotException.objects.filter(
+        doctor=doctor, datetime_slot__date__range=[start_date, end_date], is_cancellation=True,
+    ).values_list('datetime_slot', flat=True))
+    closed = ClosedPeriods.for_doctor(doctor, day_start(start_date), day_start(end_date + datetime.timedelta(days=1)))
+
+    summaries = []
+    for day, shifts in shifts_by_day.items():
+        slots = [slot for shift in shifts for slot in shift_slots(shift, day)]
+        capacity = sum(1 for slot in slots if slot not in canceled and slot not in closed)
+        summaries.append({
+            'date': day,
+            'capacity': capacity,
+            'booked': booked_counts.get(day, 0),
+            'closed': capacity == 0,
+        })
+    return summaries
+
+
+def free_slots(doctor, start_date, end_date, after=None, limit=None):
+    """
+    The free appointment times of ``doctor`` between two dates (inclusive),
+    in order, using one query each for the weekly schedule, overrides,
+    bookings, blocked slots and closures. Times before ``after`` are skipped; at most ``limit`` are returned.
+    """
+    shifts_by_day = effective_shifts(doctor, start_date, end_date)
+    if not shifts_by_day:
+        return []
+
+    booked = set(Appointment.objects.filter(
+        doctor=doctor, appointment_datetime__date__range=[start_date, end_date], status__in=BOOKED_STATUSES,
+    ).values_list('appointment_datetime', flat=True))
+    canceled = set(TimeSlotException.objects.filter(
+        doctor=doctor, datetime_slot__date__range=[start_date, end_date], is_cancellation=True,
+    ).values_list('datetime_slot', flat=True))
+    closed = ClosedPeriods.for_doctor(doctor, day_start(start_date), day_start(end_date + datetime.timedelta(days=1)))
+
+    result = []
+    for day, shifts in shifts_by_day.items():
+        for slot in sorted(slot for shift in shifts for slot in shift_slots(shift, day)):
+            if (after is None or slot >= after) and slot not in booked and slot not in canceled and slot not in closed:
+                result.append(slot)
+                if limit is not None and len(result) >= limit:
+                    return result
+    return result
+
+
+def close_period(doctor, start, end, reason=''):
+    """
+    Closes ``[start, end)`` for bookings. Closures it overlaps or touches are
+    merged into it, so a doctor keeps one row per continuous closed period.
+    """
+    with transaction.atomic():
+        touching = list(ScheduleClosure.objects.select_for_update().filter(doctor=doctor, start__lte=end, end__gte=start))
+        if touching:
+            start = min([start] + [closure.start for closure in touching])
+            end = max([end] + [closure.end for closure in touching])
+            reason = reason or next((closure.reason for closure in touching if closure.reason), '')
+            for closure in touching:
+                closure.delete()
+        return ScheduleClosure.objects.create(doctor=doctor, start=start, end=end, reason=reason)
+
+
+def open_period(doctor, start, end):
+    """
+    Re-opens ``[start, end)``: closures are trimmed or split around it and the
+    individually blocked slots inside it are removed.
+    """
+    with transaction.atomic():
+        for closure in ScheduleClosure.objects.select_for_update().filter(doctor=doctor, start__lt=end, end__gt=start):
+            before = (closure.start, start) if closure.start < start else None
+            after = (end, closure.end) if end < closure.end else None
+            if before and after:
+                closure.end = start
+                closure.save()
+                ScheduleClosure.objects.create(doctor=doctor, start=end, end=after[1], reason=closure.reason)
+            elif before or after:
+                closure.start, closure.end = before or after
+                closure.save()
+            else:
+                closure.delete()
+        for exception in TimeSlotException.objects.filter(
+            doctor=doctor, datetime_slot__gte=start, datetime_slot__lt=end, is_cancellation=True,
+        ):
+            exception.delete()
+
+
+def refresh_next_slots(doctor):
+    """Recomputes the ``NextAvailableSlot`` rows of one doctor."""
+    now = timezone.now()
+    today = timezone.localdate(now)
+    slots = free_slots(
+        doctor, today, today + datetime.timedelta(days=max(doctor.booking_days - 1, 0)),
+        after=now, limit=NEXT_SLOTS_PER_DOCTOR,
+    )
+    with transaction.atomic():
+        NextAvailableSlot.objects.filter(doctor=doctor).delete()
+        NextAvailableSlot.objects.bulk_create([
+            NextAvailableSlot(doctor=doctor, specialty_id=doctor.specialty_id, slot_datetime=slot)
+            for slot in slots
+        ])
+    return slots
+
+
+def refresh_day_slots(doctor, day):
+    """
+    Updates the ``NextAvailableSlot`` rows of one doctor after a change that
+    only touches ``day``, e.g. one booking or cancellation. The free times of
+    that day are recomputed and merged into the index; the rest of the
+    horizon is only searched when the index lost a row and was full, i.e.
+    when its replacement lies past the last indexed time.
+    """
+    now = timezone.now()
+    today = timezone.localdate(now)
+    last_day = today + datetime.timedelta(days=max(doctor.booking_days - 1, 0))
+    if not today <= day <= last_day:
+        return None
+    with transaction.atomic():
+        indexed = list(NextAvailableSlot.objects.select_for_update().filter(doctor=doctor).values_list('slot_datetime', flat=True))
+        full = len(indexed) >= NEXT_SLOTS_PER_DOCTOR
+        if full and indexed[-1] < day_start(day):
+            # Everything free on that day comes after the indexed times.
+            return indexed
+        slots = {slot for slot in indexed if slot >= now and timezone.localdate(slot) != day}
+        slots.update(free_slots(doctor, day, day, after=now))
+        if full and len(slots) < NEXT_SLOTS_PER_DOCTOR:
+            slots.update(free_slots(
+                doctor, max(timezone.localdate(indexed[-1]), today), last_day,
+                after=max(indexed[-1], now), limit=2 * NEXT_SLOTS_PER_DOCTOR,
+            ))
+        slots = sorted(slots)[:NEXT_SLOTS_PER_DOCTOR]
+
+        NextAvailableSlot.objects.filter(doctor=doctor).exclude(slot_datetime__in=slots).delete()
+        NextAvailableSlot.objects.bulk_create([
+            NextAvailableSlot(doctor=doctor, specialty_id=doctor.specialty_id, slot_datetime=slot)
+            for slot in slots if slot not in indexed
+        ])
+    return slots
+
+
+def rebuild_next_slots(doctors=None):
+    """Refreshes the index for ``doctors`` (all doctors by default); returns how many were refreshed."""
+    if doctors is None:
+        doctors = DoctorProfile.objects.all()
+    count = 0
+    for doctor in doctors:
+        refresh_next_slots(doctor)
+        count += 1
+    return count
+
+
+def earliest_slots(specialty_id=None, limit=10):
+    """
+    The earliest free slots across all doctors (of a specialty, if given),
+    read from the index in a single query.
+    """
+    queryset = NextAvailableSlot.objects.filter(slot_datetime__gte=timezone.now())
+    if specialty_id is not None:
+        queryset = queryset.filter(specialty_id=specialty_id)
+    return list(queryset.select_related('doctor__user', 'specialty').order_by('slot_datetime')[:limit])
@@ -0,0 +1,187 @@
+"""
+Keeps the NextAvailableSlot index in step with the data it is derived from.
+
+Every change to a doctor's weekly availability, dated overrides, blocked
+slots or closures refreshes that doctor's index rows once the surrounding
+transaction commits, and bumps the doctor's ``schedule_version`` right away
+so cached calendars are revalidated. Appointments do the same only when they
+are created or deleted or their status, time or doctor changes, and then
+only the index rows of the days they touch are updated.
+Changes to the availability and reviews of a doctor bump their ``updated_at``,
+which the sitemap reports, and changes to a doctor, user or insurance fee drop
+what is cached of them. Status changes of appointments are also published
+on the clinic event bus, and the slots freed by them are offered to the
+waitlist.
+"""
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import clinic, events, fees, schedule, waitlist
+from .models import (
+    Appointment, DoctorAvailability, DoctorProfile, InsuranceFee, Review, ScheduleClosure, ScheduleOverride,
+    TimeSlotException,
+)
+
+_local = threading.local()
+
+
+def _refresh_doctor(doctor_id, day=None):
+    doctor = DoctorProfile.objects.filter(pk=doctor_id).first()
+    if doctor is None:
+        return
+    if day is None:
+        schedule.refresh_next_slots(doctor)
+    else:
+        schedule.refresh_day_slots(doctor, day)
+
+
+def queue_refresh(doctor_id, day=None):
+    """
+    Refreshes a doctor's next free slots after the current transaction
+    commits: all of them, or with ``day`` only what a change on that day
+    affects. Bulk changes queue one refresh per row; only the last one queued
+    for a doctor (and day) does the work.
+    """
+    key = doctor_id if day is None else (doctor_id, day)
+    generations = _local.__dict__.setdefault('generations', {})
+    generation = generations[key] = generations.get(key, 0) + 1
+
+    def refresh():
+        if generations.get(key) == generation:
+            # Dropped once the latest refresh runs, so the dict does not grow with every doctor-day touched.
+            generations.pop(key, None)
+            _refresh_doctor(doctor_id, day)
+
+    transaction.on_commit(refresh)
+
+
+def bump_schedule_version(doctor_id):
+    """Marks the calendar of a doctor as changed, in the same transaction as the change."""
+    DoctorProfile.objects.filter(pk=doctor_id).update(schedule_version=F('schedule_version') + 1)
+
+
+def touch_doctor(doctor_id):
+    """Marks the public profile of a doctor as changed."""
+    DoctorProfile.objects.filter(pk=doctor_id).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=DoctorAvailability)
+@receiver(post_delete, sender=DoctorAvailability)
+@receiver(post_save, sender=TimeSlotException)
+@receiver(post_delete, sender=TimeSlotException)
+@receiver(post_save, sender=ScheduleClosure)
+@receiver(post_delete, sender=ScheduleClosure)
+@receiver(post_save, sender=ScheduleOverride)
+@receiver(post_delete, sender=ScheduleOverride)
+def schedule_changed(sender, instance, **kwargs):
+    bump_schedule_version(instance.doctor_id)
+    queue_refresh(instance.doctor_id)
+
+
+@receiver(post_save, sender=DoctorAvailability)
+@receiver(post_delete, sender=DoctorAvailability)
+@receiver(post_save, sender=ScheduleClosure)
+@receiver(post_delete, sender=ScheduleClosure)
+@receiver(post_save, sender=ScheduleOverride)
+@receiver(post_delete, sender=ScheduleOverride)
+def availability_changed(sender, instance, **kwargs):
+    touch_doctor(instance.doctor_id)
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def review_changed(sender, instance, **kwargs):
+    doctor_id = Appointment.objects.filter(pk=instance.appointment_id).values_list('doctor_id', flat=True).first()
+    if doctor_id is not None:
+        touch_doctor(doctor_id)
+
+
+@receiver(post_save, sender=DoctorProfile)
+def doctor_profile_saved(sender, instance, **kwargs):
+    # The specialty and the number of bookable days both shape the index.
+    queue_refresh(instance.pk)
+    clinic.invalidate_doctor(instance.pk)
+
+
+@receiver(post_delete, sender=DoctorProfile)
+def doctor_profile_deleted(sender, instance, **kwargs):
+    clinic.invalidate_user(instance.user_id)
+
+
+@receiver(post_save, sender=InsuranceFee)
+@receiver(post_delete, sender=InsuranceFee)
+def insurance_fee_changed(sender, instance, **kwargs):
+    fees.invalidate(instance.doctor_id)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def user_saved(sender, instance, **kwargs):
+    # The role and doctor of a user, and the name of a doctor, are part of the clinic context.
+    clinic.invalidate_user(instance.pk)
+    if instance.user_type == 'DOCTOR':
+        for doctor_id in DoctorProfile.objects.filter(user=instance).values_list('pk', flat=True):
+            clinic.invalidate_doctor(doctor_id)
+
+
+def _appointment_slots_changed(slots, refresh=True):
+    """
+    Bumps the calendars of the doctors of ``(doctor_id, time)`` pairs and, with
+    ``refresh``, queues the index update of their days (of all days if the
+    time is not known).
+    """
+    for doctor_id in {doctor_id for doctor_id, _ in slots if doctor_id is not None}:
+        bump_schedule_version(doctor_id)
+    if refresh:
+        for doctor_id, day in {(doctor_id, moment and timezone.localdate(moment)) for doctor_id, moment in slots}:
+            if doctor_id is not None:
+                queue_refresh(doctor_id, day)
+
+
+@receiver(post_save, sender=Appointment)
+def appointment_saved(sender, instance, created, **kwargs):
+    previous = None if created else getattr(instance, '_loaded_status', None)
+    loaded_slot = None if created else getattr(instance, '_loaded_slot', None)
+    slot = (instance.doctor_id, instance.appointment_datetime)
+    instance._loaded_status = instance.status
+    instance._loaded_slot = slot
+    # Saves that only set the order id, the patient or notes leave the schedule alone.
+    moved = loaded_slot != slot
+    if moved or previous != instance.status:
+        booked_changed = previous is None or (previous in schedule.BOOKED_STATUSES) != (instance.status in schedule.BOOKED_STATUSES)
+        _appointment_slots_changed(
+            [slot, loaded_slot] if moved and loaded_slot else [slot], refresh=moved or booked_changed,
+        )
+    if previous == instance.status:
+        return
+    if instance.status == 3 and previous in (1, 4):
+        waitlist.queue_release(instance.doctor_id, instance.appointment_datetime)
+    elif instance.status == 1 and previous == 4:
+        waitlist.mark_booked(instance)
+    if instance.status == 1:
+        kind = {None: 'booked', 3: 'booked', 4: 'paid'}.get(previous)
+    elif instance.status == 2:
+        kind = 'visited'
+    elif instance.status == 3:
+        kind = 'canceled' if previous in (1, 2) else None
+    else:
+        kind = None
+    if kind is None:
+        return
+    events.publish(instance.doctor_id, kind, instance.pk, events.appointment_data(instance))
+
+
+@receiver(post_delete, sender=Appointment)
+def appointment_deleted(sender, instance, **kwargs):
+    _appointment_slots_changed(
+        [(instance.doctor_id, instance.appointment_datetime)], refresh=instance.status in schedule.BOOKED_STATUSES,
+    )
+    if instance.status in (1, 2):
+        events.publish(instance.doctor_id, 'canceled', instance.pk, events.appointment_data(instance))
+    if instance.status in (1, 4):
+        waitlist.queue_release(instance.doctor_id, instance.appointment_datetime)
@@ -1,7 +1,33 @@
+"""
+Sitemaps.
+
+``/sitemap.xml`` is an index of the sections, each split into pages of at
+most ``limit`` URLs. Every generated document is written to
+``SITEMAP_CACHE_DIR`` under a version that changes whenever a doctor is added,
+removed or updated, so a crawl after the first serves files from disk, and a
+crawler that sends back the ETag or Last-Modified it got is answered with a
+304 after one indexed query.
+"""
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+from django.conf import settings
 from django.contrib.sitemaps import Sitemap
+from django.contrib.sitemaps import views as sitemap_views
+from django.db.models import Count, Max
+from django.http import Http404, HttpResponse
 from django.urls import reverse
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date
+
 from .models import DoctorProfile
 
+SECTION_URL_NAME = 'django.contrib.sitemaps.views.sitemap'
+
+
 class StaticViewSitemap(Sitemap):
     priority = 0.5
     changefreq = 'daily'
@@ -15,11 +41,115 @@ class StaticViewSitemap(Sitemap):
 class DoctorProfileSitemap(Sitemap):
     changefreq = "weekly"
     priority = 0.9
+    limit = 2000
 
     def items(self):
-        return DoctorProfile.objects.all()
+        return DoctorProfile.objects.only('pk', 'updated_at').order_by('pk')
+
+    def location(self, obj):
+        return reverse('booking:doctor_detail', args=[obj.pk])
 
     def lastmod(self, obj):
-        # Assuming you have a field that tracks the last modification time of the profile.
-        # If not, you can remove this method.
-        return None
+        return obj.updated_at
+
+    def get_latest_lastmod(self):
+        return DoctorProfile.objects.aggregate(latest=Max('updated_at'))['latest']
+
+
+SITEMAPS = {
+    'static': StaticViewSitemap,
+    'doctors': DoctorProfileSitemap,
+}
+
+
+def version():
+    """
+    A name for the current state of the doctor directory, and the time of its
+    latest change. Deleting a doctor changes the count; any other change moves
+    the latest ``updated_at``.
+    """
+    stats = DoctorProfile.objects.aggregate(count=Count('pk'), latest=Max('updated_at'))
+    latest = stats['latest']
+    return f"{stats['count']}-{int(latest.timestamp() * 1000000) if latest else 0}", latest
+
+
+def _write(root, key, name, content):
+    """
+    Stores a generated document of version ``key``. It is written to a
+    temporary file outside the version directories and moved into place, so
+    a document is never seen half written. Older versions are pruned only
+    once nothing has been written to them for ``SITEMAP_CACHE_TTL`` seconds:
+    another process may still be serving one it has just looked up.
+    """
+    root.mkdir(parents=True, exist_ok=True)
+    fd, temporary_path = tempfile.mkstemp(dir=root, prefix='.sitemap-')
+    with os.fdopen(fd, 'wb') as file:
+        file.write(content)
+    try:
+        for attempt in range(2):
+            (root / key).mkdir(exist_ok=True)
+            try:
+                os.replace(temporary_path, root / key / name)
+                break
+            except FileNotFoundError:
+                # Another process pruned the directory in between.
+                continue
+    finally:
+        if os.path.exists(temporary_path):
+            os.unlink(temporary_path)
+
+    stale = time.time() - settings.SITEMAP_CACHE_TTL
+    for other in root.iterdir():
+        if other.name == key:
+            continue
+        try:
+            if other.stat().st_mtime >= stale:
+                continue
+            if other.is_dir():
+                shutil.rmtree(other)
+            else:
+                other.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def _serve(request, name, generate):
+    # The URLs in the documents are absolute, so http and https get their own.
+    name = f'{request.scheme}-{name}'
+    key, latest = version()
+    etag = quote_etag(f'{key}-{name}')
+    last_modified = int(latest.timestamp()) if latest else None
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        root = Path(settings.SITEMAP_CACHE_DIR)
+        try:
+            content = (root / key / name).read_bytes()
+        except FileNotFoundError:
+            generated = generate()
+            if generated.status_code != 200:
+                return generated
+            content = generated.render().content
+            _write(root, key, name, content)
+        response = HttpResponse(content, content_type='application/xml')
+
+    response['ETag'] = etag
+    response['X-Robots-Tag'] = 'noindex, noodp, noarchive'
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def index(request):
+    return _serve(request, 'index.xml', lambda: sitemap_views.index(
+        request, SITEMAPS, sitemap_url_name=SECTION_URL_NAME,
+    ))
+
+
+def section(request, section):
+    page = request.GET.get('p', '1')
+    if section not in SITEMAPS or not page.isdigit():
+        raise Http404("No sitemap available for section: %r" % section)
+    return _serve(request, f'{section}-{int(page)}.xml', lambda: sitemap_views.sitemap(
+        request, SITEMAPS, section=section,
+    ))
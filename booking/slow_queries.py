@@ -0,0 +1,207 @@
+"""
+Slow-query log.
+
+Every database connection gets an ``execute_wrapper`` that times its
+queries. Those that take ``SLOW_QUERY_MS`` or longer are appended to
+``SLOW_QUERY_LOG`` (one JSON object per line) with the line of the project
+that ran them and a fingerprint of the SQL, in which the values and the
+length of ``IN`` lists are left out. The first time a fingerprint is slow,
+and then at most once every ``SLOW_QUERY_EXPLAIN_INTERVAL`` seconds, the plan
+of the query is stored with it: ``EXPLAIN QUERY PLAN`` on SQLite,
+``EXPLAIN ANALYZE`` on PostgreSQL. ``manage.py slow_queries`` reports the
+fingerprints that cost the most.
+
+Parameters are used for the EXPLAIN but never written to the log.
+"""
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+import time
+
+from django.conf import settings
+from django.db import DatabaseError
+from django.db.backends.signals import connection_created
+from django.utils import timezone
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'(?<![\w"])-?\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\bIN\s*\((?:\s*(?:%s|\?)\s*,?)+\)', re.IGNORECASE)
+_SPACE = re.compile(r'\s+')
+
+_explained = {}
+_lock = threading.Lock()
+_local = threading.local()
+
+_PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_THIS_FILE = os.path.abspath(__file__)
+
+
+def normalize(sql):
+    """The SQL with its values and the length of its IN lists left out."""
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _IN_LIST.sub('IN (...)', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+def fingerprint(sql):
+    return hashlib.md5(normalize(sql).encode()).hexdigest()[:12]
+
+
+def caller():
+    """``path:line function`` of the innermost frame of the project outside this module."""
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = os.path.abspath(frame.f_code.co_filename)
+        if (
+            filename != _THIS_FILE
+            and filename.startswith(_PROJECT_DIR + os.sep)
+            and f'{os.sep}site-packages{os.sep}' not in filename
+        ):
+            return f'{os.path.relpath(filename, _PROJECT_DIR)}:{frame.f_lineno} {frame.f_code.co_name}'
+        frame = frame.f_back
+    return None
+
+
+def _should_explain(key):
+    now = time.monotonic()
+    with _lock:
+        last = _explained.get(key)
+        if last is not None and now - last < settings.SLOW_QUERY_EXPLAIN_INTERVAL:
+            return False
+        _explained[key] = now
+        return True
+
+
+def explain(connection, sql, params):
+    """The plan of a SELECT as a list of lines."""
+    if connection.vendor == 'postgresql':
+        # EXPLAIN ANALYZE runs the query again; an error inside a transaction would abort it.
+        prefix = 'EXPLAIN' if connection.in_atomic_block else 'EXPLAIN (ANALYZE, BUFFERS)'
+    elif connection.vendor == 'sqlite':
+        prefix = 'EXPLAIN QUERY PLAN'
+    else:
+        prefix = 'EXPLAIN'
+    # The cursor of the backend itself: its query is neither timed by this
+    # wrapper nor counted in connection.queries.
+    cursor = connection.create_cursor()
+    try:
+        cursor.execute(f'{prefix} {sql}', params)
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+    if connection.vendor == 'sqlite':
+        # (id, parent, notused, detail)
+        return [row[-1] for row in rows]
+    return [' '.join(str(column) for column in row) for row in rows]
+
+
+def _write(record):
+    path = settings.SLOW_QUERY_LOG
+    line = json.dumps(record, ensure_ascii=False) + '\n'
+    with _lock:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'a', encoding='utf-8') as log:
+            log.write(line)
+
+
+class SlowQueryLogger:
+    """An ``execute_wrapper`` that logs the queries slower than ``SLOW_QUERY_MS``."""
+
+    def __call__(self, execute, sql, params, many, context):
+        if getattr(_local, 'active', False):
+            return execute(sql, params, many, context)
+        start = time.perf_counter()
+        result = execute(sql, params, many, context)
+        ms = (time.perf_counter() - start) * 1000
+        threshold = settings.SLOW_QUERY_MS
+        if threshold is not None and ms >= threshold:
+            _local.active = True
+            try:
+                self.log(context['connection'], sql, params, many, ms)
+            finally:
+                _local.active = False
+        return result
+
+    def log(self, connection, sql, params, many, ms):
+        key = fingerprint(sql)
+        record = {
+            'at': timezone.now().isoformat(),
+            'fingerprint': key,
+            'ms': round(ms, 3),
+            'alias': connection.alias,
+            'vendor': connection.vendor,
+            'many': many,
+            'caller': caller(),
+            'sql': normalize(sql),
+        }
+        if not many and sql.lstrip()[:6].upper() == 'SELECT' and _should_explain(key):
+            try:
+                record['plan'] = explain(connection, sql, params)
+            except DatabaseError as error:
+                record['plan_error'] = str(error)
+        try:
+            _write(record)
+        except OSError:
+            # A full disk must not fail the request that ran the query.
+            pass
+
+
+def read_log(path=None):
+    """The records of the log, skipping lines cut short by a crash."""
+    try:
+        log = open(path or settings.SLOW_QUERY_LOG, encoding='utf-8')
+    except FileNotFoundError:
+        return
+    with log:
+        for line in log:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+
+def summarize(records, since=None):
+    """
+    One entry per fingerprint with its count, total, mean and maximum time,
+    the callers that ran it and the latest plan captured for it.
+    """
+    summary = {}
+    for record in records:
+        if since is not None and record['at'] < since:
+            continue
+        entry = summary.get(record['fingerprint'])
+        if entry is None:
+            entry = summary[record['fingerprint']] = {
+                'fingerprint': record['fingerprint'],
+                'sql': record['sql'],
+                'count': 0,
+                'total_ms': 0.0,
+                'max_ms': 0.0,
+                'callers': {},
+                'plan': None,
+                'last_at': None,
+            }
+        entry['count'] += 1
+        entry['total_ms'] += record['ms']
+        entry['max_ms'] = max(entry['max_ms'], record['ms'])
+        entry['last_at'] = record['at']
+        if record.get('caller'):
+            entry['callers'][record['caller']] = entry['callers'].get(record['caller'], 0) + 1
+        if record.get('plan'):
+            entry['plan'] = record['plan']
+    for entry in summary.values():
+        entry['total_ms'] = round(entry['total_ms'], 3)
+        entry['mean_ms'] = round(entry['total_ms'] / entry['count'], 3)
+    return list(summary.values())
+
+
+def install(sender, connection, **kwargs):
+    if not any(isinstance(wrapper, SlowQueryLogger) for wrapper in connection.execute_wrappers):
+        connection.execute_wrappers.append(SlowQueryLogger())
+
+
+connection_created.connect(install, dispatch_uid='booking.slow_queries.install')
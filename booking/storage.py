@@ -0,0 +1,73 @@
+"""
+Content-addressed media storage.
+
+Files are named after the SHA-256 of their content, so uploading the same
+photo twice stores it once, and a name never changes content, which lets it
+be cached forever.
+"""
+import hashlib
+import os
+import posixpath
+import re
+import tempfile
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+HASH_LENGTH = 32
+CONTENT_ADDRESSED_NAME = re.compile(r'^[0-9a-f]{%d}\.[0-9a-z]+$' % HASH_LENGTH)
+
+
+def is_content_addressed(name):
+    """Whether ``name`` is a file written by ``ContentAddressedStorage``."""
+    return bool(CONTENT_ADDRESSED_NAME.match(posixpath.basename(name)))
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Stores ``dir/name.ext`` as ``dir/<sha256>.ext``. Saving content that is
+    already stored returns the existing name without writing anything.
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+
+        extension = os.path.splitext(name)[1].lower()
+        name = posixpath.join(posixpath.dirname(name), digest.hexdigest()[:HASH_LENGTH] + extension)
+        if self.exists(name):
+            return name
+        return super().save(name, content, max_length=max_length)
+
+    def get_available_name(self, name, max_length=None):
+        # A taken name holds the same content, so there is no need for another.
+        return name
+
+    def _save(self, name, content):
+        # Written to a temporary file and moved into place, so a concurrent
+        # upload of the same content can never expose a partial file.
+        full_path = self.path(name)
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+        fd, temporary_path = tempfile.mkstemp(dir=directory, prefix='.upload-')
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                for chunk in content.chunks():
+                    file.write(chunk if isinstance(chunk, bytes) else chunk.encode())
+            os.chmod(temporary_path, self.file_permissions_mode or 0o644)
+            os.replace(temporary_path, full_path)
+        except BaseException:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+            raise
+        return name
+
+
+photo_storage = ContentAddressedStorage()
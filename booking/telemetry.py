@@ -0,0 +1,198 @@
+"""
+Structured logs and metrics.
+
+Log records are handed to a queue by ``QueuedHandler`` and written by a
+listener thread as one JSON object per line, so a request never waits on
+log I/O. Every record carries the ID of the request it was logged in (see
+``RequestIdMiddleware``). The subsystems log to their own loggers:
+``booking``, ``booking.payment``, ``booking.sms`` and ``booking.reports``.
+
+Counters and histograms of bookings, payments, SMS sends and reports are
+kept in the process and rendered in the Prometheus text format at
+``/metrics``. Each worker process counts its own requests.
+
+This module is imported by the logging configuration, before the apps are
+loaded, so it must not import models.
+"""
+import copy
+import datetime
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+request_id = ContextVar('request_id', default=None)
+
+
+class RequestIdFilter(logging.Filter):
+    """Adds the ID of the current request to the record as ``request_id``."""
+
+    def filter(self, record):
+        if not hasattr(record, 'request_id'):
+            # django.request logs the response after the middleware has returned.
+            record.request_id = request_id.get() or getattr(getattr(record, 'request', None), 'id', None)
+        return True
+
+
+# The attributes every LogRecord has; anything else was passed in ``extra``.
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'request_id'}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        data = {
+            'time': datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'request_id': getattr(record, 'request_id', None),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith('_'):
+                data[key] = value
+        if record.exc_info:
+            data['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            data['exception'] = record.exc_text
+        if record.stack_info:
+            data['stack'] = record.stack_info
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class QueuedHandler(QueueHandler):
+    """
+    Puts records on an unbounded queue that a listener thread writes as JSON
+    lines to ``filename`` (rotated at ``max_bytes``), or to stderr.
+    """
+
+    def __init__(self, filename=None, max_bytes=10 * 1024 * 1024, backup_count=5):
+        super().__init__(queue.SimpleQueue())
+        if filename:
+            os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
+            target = RotatingFileHandler(filename, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8', delay=True)
+        else:
+            target = logging.StreamHandler(sys.stderr)
+        target.setFormatter(JsonFormatter())
+        self.listener = QueueListener(self.queue, target)
+        self.listener.start()
+
+    def prepare(self, record):
+        # Resolve what can only be resolved on this thread, and keep the
+        # ``extra`` fields, which QueueHandler.prepare would flatten into the message.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def close(self):
+        # Writes out what is still queued; the configuration is replaced on reload and at exit.
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+        super().close()
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(str(labels[name]) for name in self.labelnames), 0)
+
+    def render(self):
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} counter'
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield f'{self.name}{_format_labels(self.labelnames, key)} {value}'
+
+
+class Histogram:
+    DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[index] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels):
+        entry = self._values.get(tuple(str(labels[name]) for name in self.labelnames))
+        return sum(entry[0]) if entry else 0
+
+    def render(self):
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} histogram'
+        with self._lock:
+            values = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        for key, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip((*self.buckets, '+Inf'), counts):
+                cumulative += count
+                yield f'{self.name}_bucket{_format_labels(self.labelnames, key, [("le", bound)])} {cumulative}'
+            yield f'{self.name}_sum{_format_labels(self.labelnames, key)} {total}'
+            yield f'{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}'
+
+
+REGISTRY = []
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    return ''.join(f'{line}\n' for metric in REGISTRY for line in metric.render())
+
+
+bookings = Counter('avalnobat_bookings_total', 'Appointment bookings by outcome.', ['outcome'])
+payments = Counter('avalnobat_payments_total', 'Payment gateway calls by operation and result code.', ['operation', 'result'])
+payment_seconds = Histogram('avalnobat_payment_gateway_seconds', 'Duration of payment gateway calls.', ['operation'])
+sms = Counter('avalnobat_sms_total', 'SMS sends by pattern and outcome.', ['pattern', 'outcome'])
+sms_seconds = Histogram('avalnobat_sms_send_seconds', 'Duration of SMS API calls.', ['pattern'])
+report_seconds = Histogram('avalnobat_report_seconds', 'Time to build reports and exports.', ['report'])
@@ -1,8 +1,8 @@
 from django import template
-import jdatetime
-import pytz
 import math
 
+from booking import jalali
+
 register = template.Library()
 
 @register.filter(name='to_jalali_js')
@@ -12,12 +12,10 @@ def to_jalali_js(gregorian_date):
     """
     if not gregorian_date:
         return ""
-    if hasattr(gregorian_date, 'date'):
-        gregorian_date = gregorian_date.date()
     try:
-        j_date = jdatetime.date.fromgregorian(date=gregorian_date)
+        j_date = jalali.from_gregorian(gregorian_date)
         return f"{j_date.year}/{j_date.month}/{j_date.day}"
-    except (ValueError, TypeError):
+    except (ValueError, TypeError, AttributeError):
         return gregorian_date
 
 @register.filter(name='to_jalali_date')
@@ -28,9 +26,9 @@ def to_jalali_date(gregorian_date):
     if not gregorian_date:
         return ""
     try:
-        j_date = jdatetime.date.fromgregorian(date=gregorian_date)
+        j_date = jalali.from_gregorian(gregorian_date)
         return f"{j_date.year}/{j_date.month}/{j_date.day}"
-    except (ValueError, TypeError):
+    except (ValueError, TypeError, AttributeError):
         return gregorian_date
 
 @register.filter(name='to_jalali')
@@ -48,27 +46,8 @@ def to_jalali(gregorian_date, format_str="%Y/%m/%d"):
         gregorian_date = gregorian_date.date()
 
     try:
-        jalali_date = jdatetime.date.fromgregorian(date=gregorian_date)
-
-        jalali_day_names = ["شنبه", "یکشنبه", "دوشنبه", "سه‌شنبه", "چهارشنبه", "پنجشنبه", "جمعه"]
-        jalali_month_names = [
-            "فروردین", "اردیبهشت", "خرداد", "تیر", "مرداد", "شهریور",
-            "مهر", "آبان", "آذر", "دی", "بهمن", "اسفند"
-        ]
-
-        result = format_str
-        result = result.replace('%Y', str(jalali_date.year))
-        result = result.replace('%m', f'{jalali_date.month:02d}')
-        result = result.replace('%d', f'{jalali_date.day:02d}')
-
-        if '%A' in result:
-            result = result.replace('%A', jalali_day_names[jalali_date.weekday()])
-
-        if '%B' in result:
-            result = result.replace('%B', jalali_month_names[jalali_date.month - 1])
-
-        return result
-    except (ValueError, TypeError):
+        return jalali.format_date(gregorian_date, format_str)
+    except (ValueError, TypeError, AttributeError):
         return gregorian_date
 
 @register.filter(name='to_jalali_datetime')
@@ -82,35 +61,8 @@ def to_jalali_datetime(gregorian_datetime, format_str="%A %Y/%m/%d, ساعت %H:
         return ""
     try:
         # Convert to the 'Asia/Tehran' timezone
-
-        tehran_tz = pytz.timezone('Asia/Tehran')
-        if gregorian_datetime.tzinfo is None:
-            gregorian_datetime = pytz.utc.localize(gregorian_datetime)
-
-        local_datetime = gregorian_datetime.astimezone(tehran_tz)
-        jalali_datetime = jdatetime.datetime.fromgregorian(datetime=local_datetime)
-
-        jalali_day_names = ["شنبه", "یکشنبه", "دوشنبه", "سه‌شنبه", "چهارشنبه", "پنجشنبه", "جمعه"]
-        jalali_month_names = [
-            "فروردین", "اردیبهشت", "خرداد", "تیر", "مرداد", "شهریور",
-            "مهر", "آبان", "آذر", "دی", "بهمن", "اسفند"
-        ]
-
-        result = format_str
-        result = result.replace('%Y', str(jalali_datetime.year))
-        result = result.replace('%m', f'{jalali_datetime.month:02d}')
-        result = result.replace('%d', f'{jalali_datetime.day:02d}')
-        result = result.replace('%H', f'{jalali_datetime.hour:02d}')
-        result = result.replace('%M', f'{jalali_datetime.minute:02d}')
-
-        if '%A' in result:
-            result = result.replace('%A', jalali_day_names[jalali_datetime.weekday()])
-
-        if '%B' in result:
-            result = result.replace('%B', jalali_month_names[jalali_datetime.month - 1])
-
-        return result
-    except (ValueError, TypeError):
+        return jalali.format_date(jalali.localtime(gregorian_datetime), format_str)
+    except (ValueError, TypeError, AttributeError):
         return gregorian_datetime
 
 @register.filter(name='intcomma')
@@ -151,14 +103,9 @@ def to_persian_weekday(gregorian_date):
     if not gregorian_date:
         return ""
 
-    if hasattr(gregorian_date, 'date'):
-        gregorian_date = gregorian_date.date()
-
     try:
-        jalali_date = jdatetime.date.fromgregorian(date=gregorian_date)
-        weekdays = ["شنبه", "یکشنبه", "دوشنبه", "سه‌شنبه", "چهارشنبه", "پنجشنبه", "جمعه"]
-        return weekdays[jalali_date.weekday()]
-    except (ValueError, TypeError):
+        return jalali.DAY_NAMES[jalali.from_gregorian(gregorian_date).weekday]
+    except (ValueError, TypeError, AttributeError):
         return ""
 
 @register.filter(name='split')
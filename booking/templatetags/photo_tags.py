@@ -0,0 +1,50 @@
+"""
+Template tags for doctor photos.
+"""
+from django import template
+from django.templatetags.static import static
+from django.utils.html import format_html
+
+from booking.images import VARIANTS
+
+register = template.Library()
+
+PLACEHOLDER = 'booking/images/default-doctor.svg'
+
+
+@register.simple_tag
+def doctor_photo(doctor, display_size=100, css_class='doctor-photo', loading='lazy'):
+    """
+    A ``<picture>`` of the doctor's photo variants, in WebP with a JPEG
+    fallback, that lets the browser pick the variant for ``display_size``
+    CSS pixels and the screen density. Photos uploaded before variants were
+    made are shown as stored; doctors without a photo get a placeholder.
+    """
+    alt = f"عکس دکتر {doctor.user.get_full_name()}"
+    if not doctor.photo:
+        return format_html(
+            '<img src="{}" alt="{}" class="{}" width="{}" height="{}">',
+            static(PLACEHOLDER), alt, css_class, display_size, display_size,
+        )
+
+    variants = doctor.photo_variants
+    storage = doctor.photo.storage
+    if not variants:
+        return format_html(
+            '<img src="{}" alt="{}" class="{}" loading="{}" decoding="async">',
+            doctor.photo.url, alt, css_class, loading,
+        )
+
+    ordered = sorted((variants[name] for name in VARIANTS if name in variants), key=lambda entry: entry['width'])
+    fallback = next((entry for entry in ordered if entry['width'] >= display_size), ordered[-1])
+
+    def srcset(fmt):
+        return ', '.join(f"{storage.url(entry[fmt])} {entry['width']}w" for entry in ordered)
+
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}px">'
+        '<img src="{}" srcset="{}" sizes="{}px" width="{}" height="{}" alt="{}" class="{}" loading="{}" decoding="async">'
+        '</picture>',
+        srcset('webp'), display_size,
+        storage.url(fallback['jpeg']), srcset('jpeg'), display_size, display_size, display_size, alt, css_class, loading,
+    )
@@ -1,14 +1,71 @@
 import datetime
+import json
+import logging
+import os
+import re
+from decimal import Decimal
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+from pathlib import Path
+from urllib.parse import urlsplit
 import jdatetime
-from django.test import TestCase
+import openpyxl
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.template.loader import render_to_string
 from django.urls import reverse
-from unittest.mock import patch
+from unittest.mock import ANY, MagicMock, patch
+from PIL import Image
 from django.contrib.auth import get_user_model
 from django.utils import timezone
-from .models import Specialty, DoctorProfile, Appointment, DoctorAvailability, DailyExpense
+from asgiref.sync import async_to_sync
+from . import clinic, events, fake_gateways, fees, gateways, importer, jalali, reminders, schedule, signals, slow_queries, telemetry, waitlist
+from .admin import EstimatedCountPaginator, estimated_rows
+from .sitemaps import DoctorProfileSitemap
+from .storage import is_content_addressed
+from .views import serve_media
+from .models import (
+    Specialty, DoctorProfile, Appointment, DoctorAvailability, DailyExpense, NextAvailableSlot, ScheduleClosure,
+    ScheduleOverride, ClinicEvent, InsuranceFee, ReminderLog, WaitlistEntry,
+)
 
 User = get_user_model()
 
+# The manifest storage needs the output of collectstatic; tests render the
+# templates against the source files (StaticPipelineTestCase covers the manifest).
+# Cached public pages would leak between tests, so caching is off unless a test
+# turns it on (PublicPageCacheTestCase); that includes the process-local fee tables.
+# The slow-query log is off as well (SlowQueryLogTestCase), and the info logs
+# of the booking flow are kept out of the test output.
+_no_local_fees = patch.object(fees, 'LOCAL_TIMEOUT', 0)
+_test_settings = override_settings(
+    STORAGES={
+        **settings.STORAGES,
+        'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    },
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}},
+    SLOW_QUERY_MS=None,
+)
+
+
+def setUpModule():
+    _test_settings.enable()
+    _no_local_fees.start()
+    logging.disable(logging.INFO)
+
+
+def tearDownModule():
+    logging.disable(logging.NOTSET)
+    _no_local_fees.stop()
+    _test_settings.disable()
+
 class BookingAppTestCase(TestCase):
     def setUp(self):
         # Create Users
@@ -85,11 +142,11 @@ class BookingAppTestCase(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertTemplateUsed(response, 'booking/doctor_dashboard.html')
 
-    @patch('booking.views.requests.post')
-    @patch('zeep.Client')
-    def test_full_booking_flow_for_guest(self, mock_client, mock_post):
+    @patch('booking.gateways.asend_sms')
+    @patch('booking.gateways.get_payment_client')
+    def test_full_booking_flow_for_guest(self, mock_client, mock_send_sms):
         """Test the complete booking flow for a guest patient with Jalali date."""
-        mock_post.return_value.status_code = 200
+        mock_send_sms.return_value.status_code = 200
         mock_client.return_value.service.bpPayRequest.return_value = "0,ref_id"
         today_gregorian = datetime.date.today()
         today_jalali_str = jdatetime.date.fromgregorian(date=today_gregorian).strftime('%Y-%m-%d')
@@ -112,6 +169,7 @@ class BookingAppTestCase(TestCase):
         self.assertEqual(response.status_code, 302)
         appointment = Appointment.objects.first()
         self.assertEqual(int(appointment.status), 4)
+        mock_send_sms.assert_awaited_once()
 
         # Manually set the OTP in the session for the test
         session = self.client.session
@@ -184,7 +242,7 @@ class BookingAppTestCase(TestCase):
         settlement_expense = DailyExpense.objects.get(description="تسویه صندوق منشی")
         self.assertEqual(settlement_expense.amount, 200000)
 
-    @patch('booking.views.requests.post')
+    @patch('requests.post')
     def test_doctor_signup(self, mock_post):
         """Test the doctor signup process."""
         mock_post.return_value.status_code = 200
@@ -263,4 +321,1168 @@ class BookingAppTestCase(TestCase):
         self.assertEqual(response.status_code, 302)
 
         past_appointment.refresh_from_db()
-        self.assertEqual(int(past_appointment.status), 1)
\ No newline at end of file
+        self.assertEqual(int(past_appointment.status), 1)
+
+class JalaliCalendarTestCase(SimpleTestCase):
+    def test_table_matches_jdatetime(self):
+        day = datetime.date(2001, 3, 1)
+        while day < datetime.date(2072, 4, 1):
+            j_date = jdatetime.date.fromgregorian(date=day)
+            self.assertEqual(tuple(jalali.from_gregorian(day)), (j_date.year, j_date.month, j_date.day, j_date.weekday()))
+            self.assertEqual(jalali.to_gregorian(j_date.year, j_date.month, j_date.day), day)
+            day += datetime.timedelta(days=1)
+
+    def test_bounds_and_parsing(self):
+        self.assertEqual(jalali.month_bounds(1403, 12), (datetime.date(2025, 2, 19), datetime.date(2025, 3, 20)))
+        self.assertEqual(jalali.year_bounds(1402), (datetime.date(2023, 3, 21), datetime.date(2024, 3, 19)))
+        self.assertEqual(jalali.parse('1403/12/30'), datetime.date(2025, 3, 20))
+        with self.assertRaises(ValueError):
+            jalali.parse('1404-12-30')
+        # Outside the table it falls back to jdatetime.
+        self.assertEqual(jalali.from_gregorian(datetime.date(1990, 3, 21)).year, 1369)
+
+    def test_filters(self):
+        from .templatetags import booking_filters
+        moment = datetime.datetime(2024, 3, 20, 20, 45, tzinfo=datetime.timezone.utc)
+        self.assertEqual(booking_filters.to_jalali(moment.date(), '%A %d %B %Y'), 'چهارشنبه 01 فروردین 1403')
+        self.assertEqual(booking_filters.to_jalali_js(moment), '1403/1/1')
+        self.assertEqual(booking_filters.to_jalali_datetime(moment), 'پنجشنبه 1403/01/02, ساعت 00:15')
+        self.assertEqual(booking_filters.to_persian_weekday(moment.date()), 'چهارشنبه')
+
+
+class SlotIndexTestCase(TestCase):
+    def setUp(self):
+        self.specialty = Specialty.objects.create(name='قلب و عروق')
+        self.tomorrow = timezone.localdate() + datetime.timedelta(days=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.doctor = DoctorProfile.objects.create(
+                user=User.objects.create_user(username='doctor', first_name='علی', last_name='رضایی', user_type='DOCTOR'),
+                specialty=self.specialty,
+            )
+            DoctorAvailability.objects.create(
+                doctor=self.doctor, day_of_week=self.tomorrow.weekday(), shift='MORNING',
+                start_time='09:00', end_time='12:00', visit_count=6,
+            )
+
+    def slot(self, hour, minute=0):
+        return timezone.make_aware(datetime.datetime.combine(self.tomorrow, datetime.time(hour, minute)))
+
+    def test_index_follows_bookings(self):
+        self.assertEqual(
+            list(NextAvailableSlot.objects.values_list('slot_datetime', flat=True)),
+            [self.slot(9), self.slot(9, 30), self.slot(10), self.slot(10, 30), self.slot(11)],
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            appointment = Appointment.objects.create(
+                doctor=self.doctor, appointment_datetime=self.slot(9), patient_name='بیمار', patient_phone='09150000000', status=1,
+            )
+        self.assertEqual(NextAvailableSlot.objects.first().slot_datetime, self.slot(9, 30))
+        self.assertEqual(NextAvailableSlot.objects.last().slot_datetime, self.slot(11, 30))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            appointment.status = 3
+            appointment.save()
+        self.assertEqual(NextAvailableSlot.objects.first().slot_datetime, self.slot(9))
+
+    def test_index_is_updated_per_day(self):
+        def version():
+            return DoctorProfile.objects.values_list('schedule_version', flat=True).get(pk=self.doctor.pk)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            appointment = Appointment.objects.create(
+                doctor=self.doctor, appointment_datetime=self.slot(10), patient_name='بیمار', patient_phone='09150000000', status=4,
+            )
+        appointment = Appointment.objects.get(pk=appointment.pk)
+        before = version()
+        with self.captureOnCommitCallbacks() as callbacks:
+            appointment.payment_order_id = 123
+            appointment.save()
+        self.assertEqual((version(), callbacks), (before, []))
+
+        # Paying keeps the slot booked: the calendar changes, the index does not.
+        with patch('booking.schedule.refresh_day_slots') as refresh_day_slots, self.captureOnCommitCallbacks(execute=True):
+            appointment.status = 1
+            appointment.save()
+        self.assertEqual(version(), before + 1)
+        refresh_day_slots.assert_not_called()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            appointment.appointment_datetime = self.slot(9)
+            appointment.save()
+        self.assertEqual(version(), before + 2)
+        indexed = list(NextAvailableSlot.objects.values_list('slot_datetime', flat=True))
+        self.assertEqual(indexed, [self.slot(9, 30), self.slot(10), self.slot(10, 30), self.slot(11), self.slot(11, 30)])
+        self.assertEqual(indexed, schedule.refresh_next_slots(self.doctor))
+        # The refreshes that ran are not remembered.
+        day = timezone.localtime(self.slot(9)).date()
+        self.assertNotIn((self.doctor.pk, day), signals._local.__dict__.get('generations', {}))
+
+    def test_earliest_slots_endpoint_and_doctor_list(self):
+        other = Specialty.objects.create(name='پوست و مو')
+        response = self.client.get(reverse('booking:earliest_slots'), {'specialty': other.pk})
+        self.assertEqual(response.json()['slots'], [])
+
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('booking:earliest_slots'), {'specialty': self.specialty.pk, 'limit': 2})
+        slots = response.json()['slots']
+        self.assertEqual([slot['time'] for slot in slots], ['09:00', '09:30'])
+        self.assertEqual(slots[0]['doctor_id'], self.doctor.pk)
+        self.assertEqual(slots[0]['booking_url'], reverse('booking:book_appointment', kwargs={
+            'pk': self.doctor.pk, 'date': jalali.format_date(self.tomorrow, '%Y-%m-%d'),
+        }))
+
+        response = self.client.get(reverse('booking:doctor_list'))
+        self.assertEqual(response.context['doctors'][0].next_available, self.slot(9))
+        self.assertContains(response, 'اولین نوبت آزاد')
+
+
+class ScheduleClosureTestCase(TestCase):
+    def setUp(self):
+        self.doctor_user = User.objects.create_user(username='doctor', password='password123', user_type='DOCTOR')
+        self.doctor = DoctorProfile.objects.create(user=self.doctor_user)
+        self.tomorrow = timezone.localdate() + datetime.timedelta(days=1)
+        for day in range(7):
+            DoctorAvailability.objects.create(
+                doctor=self.doctor, day_of_week=day, shift='MORNING', start_time='09:00', end_time='12:00', visit_count=6,
+            )
+        self.client.login(username='doctor', password='password123')
+
+    def manage(self, day, **data):
+        return self.client.post(reverse('booking:manage_day', kwargs={'date': jalali.format_date(day, '%Y-%m-%d')}), data)
+
+    def test_close_and_reopen_range(self):
+        last = self.tomorrow + datetime.timedelta(days=13)
+        self.manage(self.tomorrow, action='close', scope='range', reason='مرخصی',
+                    start_date=jalali.format_date(self.tomorrow), end_date=jalali.format_date(last))
+        # A second, overlapping closure is merged into the first.
+        self.manage(self.tomorrow, action='close', scope='day')
+        self.assertEqual(ScheduleClosure.objects.count(), 1)
+
+        summaries = {day['date']: day for day in schedule.day_summaries(self.doctor, self.tomorrow, last + datetime.timedelta(days=1))}
+        self.assertTrue(all(summaries[self.tomorrow + datetime.timedelta(days=i)]['closed'] for i in range(14)))
+        self.assertEqual(summaries[last + datetime.timedelta(days=1)]['capacity'], 6)
+        _, slots = schedule.day_slots(self.doctor, self.tomorrow)
+        self.assertEqual({slot['status'] for slot in slots}, {'closed'})
+
+        response = self.client.get(reverse('booking:doctor_detail', kwargs={'pk': self.doctor.pk}))
+        self.assertNotIn(self.tomorrow, [day['date'] for day in response.context['available_days']])
+
+        # Re-opening one day in the middle splits the vacation in two.
+        middle = self.tomorrow + datetime.timedelta(days=5)
+        self.manage(middle, action='open', scope='day')
+        self.assertEqual(
+            list(ScheduleClosure.objects.values_list('start', 'end')),
+            [(schedule.day_start(self.tomorrow), schedule.day_start(middle)),
+             (schedule.day_start(middle + datetime.timedelta(days=1)), schedule.day_start(last + datetime.timedelta(days=1)))],
+        )
+        _, slots = schedule.day_slots(self.doctor, middle)
+        self.assertEqual({slot['status'] for slot in slots}, {'available'})
+
+    def test_close_shift(self):
+        response = self.manage(self.tomorrow, action='close', scope='shift', shift='MORNING')
+        self.assertEqual(response.status_code, 302)
+        closure = ScheduleClosure.objects.get()
+        self.assertEqual(timezone.localtime(closure.end).time(), datetime.time(12, 0))
+        self.assertEqual(schedule.free_slots(self.doctor, self.tomorrow, self.tomorrow), [])
+
+        response = self.manage(self.tomorrow, action='close', scope='range', start_date='bad', end_date='')
+        self.assertEqual(ScheduleClosure.objects.count(), 1)
+
+    def test_dated_override(self):
+        # The afternoon shift of one date only, with its own hours and visit count.
+        self.manage(self.tomorrow, action='override', shift='AFTERNOON', start_time='16:00', end_time='21:00', visit_count=10)
+        shifts, slots = schedule.day_slots(self.doctor, self.tomorrow)
+        self.assertEqual([(shift.shift, shift.is_override) for shift in shifts], [('MORNING', False), ('AFTERNOON', True)])
+        self.assertEqual(len(slots), 16)
+        self.assertEqual(timezone.localtime(slots[-1]['time']).time(), datetime.time(20, 30))
+
+        # The morning shift is cancelled for that date; the next week is unaffected.
+        self.manage(self.tomorrow, action='override', shift='MORNING', start_time='09:00', end_time='12:00', visit_count=0)
+        next_week = self.tomorrow + datetime.timedelta(days=7)
+        summaries = {day['date']: day['capacity'] for day in schedule.day_summaries(self.doctor, self.tomorrow, next_week)}
+        self.assertEqual(summaries[self.tomorrow], 10)
+        self.assertEqual(summaries[next_week], 6)
+
+        response = self.client.get(reverse('booking:manage_day', kwargs={'date': jalali.format_date(self.tomorrow, '%Y-%m-%d')}))
+        self.assertContains(response, 'بازگشت به برنامه هفتگی', count=2)
+
+        self.manage(self.tomorrow, action='clear_override', shift='MORNING')
+        self.assertEqual(ScheduleOverride.objects.get().shift, 'AFTERNOON')
+
+        response = self.manage(self.tomorrow, action='override', shift='AFTERNOON', start_time='18:00', end_time='16:00', visit_count=4)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(ScheduleOverride.objects.get().visit_count, 10)
+
+    def test_calendar_etag(self):
+        url = reverse('booking:secretary_calendar') + f'?start={self.tomorrow.isoformat()}&days=7'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        days = response.json()['days']
+        self.assertEqual(len(days), 7)
+        self.assertEqual((days[0]['capacity'], days[0]['booked']), (6, 0))
+        etag = response['ETag']
+
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        # A booking changes the schedule version, so the old ETag no longer matches.
+        Appointment.objects.create(
+            doctor=self.doctor, patient_name='بیمار', status=1,
+            appointment_datetime=schedule.shift_slots(self.doctor.availabilities.first(), self.tomorrow)[0],
+        )
+        self.doctor.save()  # A stale instance must not roll the version back.
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['days'][0]['booked'], 1)
+
+        self.assertEqual(self.client.get(reverse('booking:secretary_calendar') + '?days=500').status_code, 400)
+
+    def test_schedule_version_survives_saves(self):
+        DoctorProfile.objects.filter(pk=self.doctor.pk).update(schedule_version=5)
+        # A stale instance leaves the version alone, but its other fields are saved.
+        self.doctor.address = 'مشهد'
+        self.doctor.save()
+        self.assertEqual(DoctorProfile.objects.values_list('schedule_version', 'address').get(pk=self.doctor.pk), (5, 'مشهد'))
+
+        # A row that went missing is inserted again, with the version of the instance.
+        pk = self.doctor.pk
+        DoctorProfile.objects.filter(pk=pk).delete()
+        self.doctor.save()
+        self.assertEqual(DoctorProfile.objects.get(pk=pk).schedule_version, self.doctor.schedule_version)
+        copy = DoctorProfile(user=User.objects.create_user(username='copy', user_type='DOCTOR'), pk=pk + 100, schedule_version=3)
+        copy.save(force_insert=True)
+        self.assertEqual(DoctorProfile.objects.get(pk=pk + 100).schedule_version, 3)
+
+
+class ClinicEventTestCase(TestCase):
+    def setUp(self):
+        self.doctor_user = User.objects.create_user(username='doctor', password='password123', user_type='DOCTOR')
+        self.doctor = DoctorProfile.objects.create(user=self.doctor_user)
+        self.moment = timezone.make_aware(datetime.datetime.combine(timezone.localdate(), datetime.time(12, 30)))
+
+    def test_status_changes_are_published(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            pending = Appointment.objects.create(doctor=self.doctor, patient_name='علی رضایی', appointment_datetime=self.moment)
+        with self.captureOnCommitCallbacks(execute=True):
+            appointment = Appointment.objects.get(pk=pending.pk)
+            appointment.status = 1
+            appointment.save()
+            appointment.status = 2
+            appointment.save()
+            appointment.save()
+            appointment.delete()
+        self.assertEqual(list(ClinicEvent.objects.order_by('id').values_list('kind', flat=True)), ['paid', 'visited', 'canceled'])
+        self.assertEqual(ClinicEvent.objects.first().data['time'], timezone.localtime(self.moment).strftime('%H:%M'))
+
+    def test_stream(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Appointment.objects.create(doctor=self.doctor, patient_name='بیمار', status=1, appointment_datetime=self.moment)
+        event = ClinicEvent.objects.get()
+
+        async def collect(last_id):
+            return [chunk async for chunk in events.stream(self.doctor.pk, last_id, lifetime=0.1)]
+
+        chunks = async_to_sync(collect)(0)
+        self.assertTrue(chunks[0].startswith('retry:'))
+        self.assertEqual(chunks[1].splitlines()[:2], [f'id: {event.pk}', 'event: booked'])
+        self.assertEqual(len(async_to_sync(collect)(event.pk)), 1)
+
+        self.assertEqual(self.client.get(reverse('booking:clinic_events')).status_code, 401)
+        self.client.login(username='doctor', password='password123')
+        # Without ASGI the view answers at once and the browser polls.
+        response = self.client.get(reverse('booking:clinic_events'), HTTP_LAST_EVENT_ID='0')
+        self.assertFalse(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        body = response.content.decode()
+        self.assertTrue(body.startswith(f'retry: {int(events.WSGI_POLL_INTERVAL * 1000)}'))
+        self.assertIn(f'id: {event.pk}', body)
+        response = self.client.get(reverse('booking:waiting_room'))
+        self.assertContains(response, 'بیمار')
+
+    def test_polling_without_last_event_id(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Appointment.objects.create(doctor=self.doctor, patient_name='بیمار', status=1, appointment_datetime=self.moment)
+        self.client.login(username='doctor', password='password123')
+        # The first poll starts at the latest event and must say so, or every reconnect starts over.
+        body = self.client.get(reverse('booking:clinic_events')).content.decode()
+        self.assertIn(f'id: {ClinicEvent.objects.get().pk}', body)
+        self.assertNotIn('event:', body)
+        last_id = re.search(r'^id: (\d+)$', body, re.M).group(1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Appointment.objects.create(
+                doctor=self.doctor, patient_name='بیمار دوم', status=1,
+                appointment_datetime=self.moment + datetime.timedelta(minutes=15),
+            )
+        body = self.client.get(reverse('booking:clinic_events'), HTTP_LAST_EVENT_ID=last_id).content.decode()
+        self.assertIn('event: booked', body)
+        self.assertIn('بیمار دوم', body)
+
+
+class DoctorPhotoTestCase(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        media_override = override_settings(MEDIA_ROOT=media_root.name)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+        self.doctor = DoctorProfile.objects.create(user=User.objects.create_user(username='doctor', user_type='DOCTOR'))
+
+    def upload(self, name='IMG_0001.JPG', size=(800, 600), color='teal'):
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Orientation: the camera was turned 90 degrees.
+        exif[0x010F] = 'Camera'
+        buffer = BytesIO()
+        Image.new('RGB', size, color).save(buffer, 'JPEG', exif=exif)
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+    def test_upload_is_processed(self):
+        self.doctor.photo = self.upload()
+        self.doctor.save()
+        self.doctor.refresh_from_db()
+
+        self.assertTrue(self.doctor.photo.name.endswith('.jpg'))
+        self.assertEqual((self.doctor.photo_width, self.doctor.photo_height), (600, 800))
+        with Image.open(self.doctor.photo.path) as stored:
+            self.assertEqual(len(stored.getexif()), 0)
+        self.assertEqual(set(self.doctor.photo_variants), {'thumb', 'card'})
+        thumb = self.doctor.photo_variants['thumb']
+        with Image.open(self.doctor.photo.storage.path(thumb['webp'])) as image:
+            self.assertEqual((image.format, image.size), ('WEBP', (100, 100)))
+
+        response = self.client.get(reverse('booking:doctor_list'))
+        self.assertContains(response, f"{self.doctor.photo.storage.url(thumb['webp'])} 100w")
+        self.assertContains(response, 'loading="lazy"')
+        self.assertNotContains(response, 'via.placeholder.com')
+
+        self.doctor.photo = None
+        self.doctor.save()
+        self.assertEqual(self.doctor.photo_variants, {})
+        self.assertContains(self.client.get(reverse('booking:doctor_list')), 'default-doctor.svg')
+
+    def test_identical_uploads_are_stored_once(self):
+        other = DoctorProfile.objects.create(user=User.objects.create_user(username='other', user_type='DOCTOR'))
+        for profile in (self.doctor, other):
+            profile.photo = self.upload(name=f'{profile.pk}.JPG')
+            profile.save()
+        self.assertEqual(self.doctor.photo.name, other.photo.name)
+        self.assertEqual(self.doctor.photo_variants, other.photo_variants)
+        self.assertTrue(is_content_addressed(self.doctor.photo.name))
+
+        # The media URLs are only routed with DEBUG on, so the view is called directly.
+        response = serve_media(RequestFactory().get(self.doctor.photo.url), self.doctor.photo.name)
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        response.close()
+
+        storage = self.doctor.photo.storage
+        shared = [self.doctor.photo.name] + [entry['webp'] for entry in self.doctor.photo_variants.values()]
+        with open(storage.path('doctor_photos/liara.json'), 'w') as marker:
+            marker.write('{}')
+        self.doctor.photo = self.upload(color='navy')
+        self.doctor.save()
+        call_command('gc_media', grace_hours=0, stdout=StringIO())
+        self.assertTrue(all(storage.exists(name) for name in shared))
+
+        other.photo = None
+        other.save()
+        call_command('gc_media', grace_hours=0, stdout=StringIO())
+        self.assertFalse(any(storage.exists(name) for name in shared))
+        self.assertTrue(storage.exists(self.doctor.photo.name))
+        self.assertTrue(storage.exists('doctor_photos/liara.json'))
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class PublicPageCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.doctor_user = User.objects.create_user(username='cached', password='password', user_type='DOCTOR')
+        self.doctor = DoctorProfile.objects.create(user=self.doctor_user)
+
+    def test_public_pages_are_cached_without_the_session(self):
+        url = reverse('booking:doctor_detail', args=[self.doctor.pk])
+        response = self.client.get(url)
+        self.assertIn('public', response['Cache-Control'])
+        self.assertNotIn('Cookie', response.get('Vary', ''))
+
+        # Logged-in visitors get the same cached page, without a database hit.
+        self.client.force_login(self.doctor_user)
+        with self.assertNumQueries(0):
+            cached = self.client.get(url)
+        self.assertEqual(cached.content, response.content)
+        self.assertNotContains(cached, 'مدیریت برنامه کاری')
+
+        status = self.client.get(reverse('booking:session_status'))
+        self.assertIn('no-store', status['Cache-Control'])
+        self.assertEqual(status.json()['user_type'], 'DOCTOR')
+        self.assertIn('مدیریت برنامه کاری', status.json()['nav'])
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ClinicContextTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.doctor = DoctorProfile.objects.create(user=User.objects.create_user(username='clinic', user_type='DOCTOR'))
+        self.secretary = User.objects.create_user(username='desk', user_type='SECRETARY', doctor=self.doctor)
+        self.client.force_login(self.secretary)
+
+    def test_context_is_cached_per_user_until_the_doctor_changes(self):
+        url = reverse('booking:daily_patients')
+        with CaptureQueriesContext(connection) as first:
+            self.client.get(url)
+        with CaptureQueriesContext(connection) as second:
+            response = self.client.get(url)
+        self.assertLess(len(second), len(first))
+        self.assertEqual(response.wsgi_request.clinic.doctor, self.doctor)
+        self.assertTrue(response.wsgi_request.clinic.is_secretary)
+        self.assertIsNotNone(cache.get(clinic._cache_key(self.secretary.pk)))
+
+        self.doctor.booking_days = 10
+        self.doctor.save()
+        self.assertIsNone(cache.get(clinic._cache_key(self.secretary.pk)))
+
+    def test_profile_edit_does_not_write_back_the_cached_profile(self):
+        self.client.force_login(self.doctor.user)
+        self.client.get(reverse('booking:edit_profile'))
+        # Changed elsewhere while the context is cached.
+        DoctorProfile.objects.filter(pk=self.doctor.pk).update(mobile_number='09121111111', booking_days=7)
+
+        form = self.client.get(reverse('booking:edit_profile')).context['profile_form']
+        self.assertEqual(form.initial['booking_days'], 7)
+        data = {name: value for name, value in form.initial.items() if value is not None and name != 'photo'}
+        response = self.client.post(reverse('booking:edit_profile'), {**data, 'address': 'تهران', 'first_name': 'علی'})
+        self.assertRedirects(response, reverse('booking:edit_profile'))
+        self.doctor.refresh_from_db()
+        self.assertEqual((self.doctor.address, self.doctor.mobile_number, self.doctor.booking_days), ('تهران', '09121111111', 7))
+        # The save dropped the cached context; the redirect cached the new profile.
+        self.assertEqual(cache.get(clinic._cache_key(self.doctor.user_id))['doctor'].address, 'تهران')
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class FeeTableTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.doctor = DoctorProfile.objects.create(
+            user=User.objects.create_user(username='fees', user_type='DOCTOR'), visit_fee=100000,
+        )
+        local = patch.object(fees, 'LOCAL_TIMEOUT', 30)
+        local.start()
+        self.addCleanup(local.stop)
+        self.addCleanup(fees.invalidate, self.doctor.pk)
+
+    def test_fee_table_is_cached_and_written_through(self):
+        self.assertEqual(fees.fee_for(self.doctor, 'TAMIN'), 100000)
+        with self.assertNumQueries(0):
+            self.assertEqual(fees.fee_table(self.doctor.pk), {})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            fees.set_fees(self.doctor.pk, {'TAMIN': Decimal(180000), 'AZAD': None})
+        with self.assertNumQueries(0):
+            self.assertEqual(fees.fee_for(self.doctor, 'TAMIN'), 180000)
+            self.assertEqual(fees.fee_for(self.doctor, 'AZAD'), 100000)
+            # An unchanged fee is not written again.
+            fees.set_fees(self.doctor.pk, {'TAMIN': Decimal(180000)})
+
+        # A free visit or a one-off discount does not become the fee of the insurance type.
+        fees.set_fees(self.doctor.pk, {'TAMIN': Decimal(0)})
+        fees.set_fees(self.doctor.pk, {'TAMIN': Decimal(50000)})
+        self.assertEqual(fees.fee_for(self.doctor, 'TAMIN'), 180000)
+        self.assertEqual(InsuranceFee.objects.get(doctor=self.doctor).fee, 180000)
+
+        # Edits made elsewhere (e.g. the admin) drop the cached table.
+        InsuranceFee.objects.filter(doctor=self.doctor).get().delete()
+        self.assertEqual(fees.fee_for(self.doctor, 'TAMIN'), 100000)
+
+
+class SitemapTestCase(TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir, ignore_errors=True)
+        override = override_settings(SITEMAP_CACHE_DIR=self.cache_dir)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.doctors = [
+            DoctorProfile.objects.create(user=User.objects.create_user(username=f'sitemap{i}', user_type='DOCTOR'))
+            for i in range(3)
+        ]
+
+    @patch.object(DoctorProfileSitemap, 'limit', 2)
+    def test_paginated_cached_sitemap(self):
+        index = self.client.get('/sitemap.xml')
+        self.assertContains(index, '/sitemap-doctors.xml?p=2')
+        self.assertNotContains(index, '/sitemap-doctors.xml?p=3')
+
+        page = self.client.get('/sitemap-doctors.xml', {'p': 2})
+        self.assertContains(page, reverse('booking:doctor_detail', args=[self.doctors[2].pk]))
+        self.assertContains(page, '<lastmod>')
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get('/sitemap-doctors.xml', {'p': 2}).content, page.content)
+        with self.assertNumQueries(1):
+            not_modified = self.client.get('/sitemap-doctors.xml', {'p': 2}, HTTP_IF_NONE_MATCH=page['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+
+        # A change to the availability of a doctor is a change to the profile.
+        before = self.doctors[2].updated_at
+        DoctorAvailability.objects.create(
+            doctor=self.doctors[2], day_of_week=0, shift='MORNING', start_time='09:00', end_time='12:00', visit_count=6,
+        )
+        self.doctors[2].refresh_from_db()
+        self.assertGreater(self.doctors[2].updated_at, before)
+        changed = self.client.get('/sitemap-doctors.xml', {'p': 2}, HTTP_IF_NONE_MATCH=page['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], page['ETag'])
+        # The old version may still be being served by another process; it
+        # goes once it has been unused for SITEMAP_CACHE_TTL.
+        versions = list(Path(self.cache_dir).iterdir())
+        self.assertEqual(len(versions), 2)
+        for version in versions:
+            os.utime(version, (0, 0))
+        self.client.get('/sitemap.xml')
+        self.assertEqual(len(list(Path(self.cache_dir).iterdir())), 1)
+
+        self.assertEqual(self.client.get('/sitemap-doctors.xml', {'p': 3}).status_code, 404)
+
+
+class AppointmentAdminTestCase(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser(username='support', password='password'))
+        self.doctors = [
+            DoctorProfile.objects.create(user=User.objects.create_user(
+                username=f'admin{i}', first_name='دکتر', last_name=last_name, user_type='DOCTOR',
+            ))
+            for i, last_name in enumerate(['کریمی', 'نادری'])
+        ]
+        self.url = reverse('admin:booking_appointment_changelist')
+
+    def book(self, count, status=1):
+        start = timezone.now() + datetime.timedelta(days=1)
+        return [
+            Appointment.objects.create(
+                doctor=self.doctors[0], patient_name=f'بیمار {i}', patient_phone=f'0912000{i:04d}',
+                appointment_datetime=start + datetime.timedelta(minutes=15 * i), status=status,
+            )
+            for i in range(count)
+        ]
+
+    def test_changelist_queries_do_not_grow_with_rows_or_doctors(self):
+        self.book(2)
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(self.url, {'doctor__id__exact': self.doctors[0].pk})
+        self.book(6)
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get(self.url, {'doctor__id__exact': self.doctors[0].pk})
+        self.assertEqual(len(many), len(few))
+        # Only the selected doctor is in the filter; the other is never loaded.
+        self.assertContains(response, f'<option value="{self.doctors[0].pk}" selected>')
+        self.assertNotContains(response, 'نادری')
+        search = self.client.get(reverse('admin:autocomplete'), {
+            'term': 'نادری', 'app_label': 'booking', 'model_name': 'appointment', 'field_name': 'doctor',
+        })
+        self.assertEqual([result['id'] for result in search.json()['results']], [str(self.doctors[1].pk)])
+
+        with patch.object(EstimatedCountPaginator, 'EXACT_COUNT_LIMIT', 0):
+            self.assertEqual(self.client.get(self.url).context['cl'].result_count, estimated_rows(Appointment))
+
+    def test_bulk_actions(self):
+        reserved = self.book(2)
+        pending = Appointment.objects.create(
+            doctor=self.doctors[0], patient_name='در انتظار', patient_phone='09120009999',
+            appointment_datetime=timezone.now() + datetime.timedelta(days=2), status=4,
+        )
+        selection = [reserved[0].pk, pending.pk]
+
+        self.client.post(self.url, {'action': 'mark_visited', '_selected_action': selection})
+        self.assertEqual(Appointment.objects.get(pk=reserved[0].pk).status, 2)
+        self.assertEqual(Appointment.objects.get(pk=pending.pk).status, 4)
+
+        self.client.post(self.url, {'action': 'cancel_appointments', '_selected_action': [reserved[1].pk, pending.pk]})
+        self.assertEqual(set(Appointment.objects.filter(status=3).values_list('pk', flat=True)), {reserved[1].pk, pending.pk})
+
+        response = self.client.post(self.url, {'action': 'export_xlsx', '_selected_action': selection})
+        rows = list(openpyxl.load_workbook(BytesIO(response.content)).active.values)
+        self.assertEqual(len(rows), 3)
+        self.assertEqual({row[0] for row in rows[1:]}, set(selection))
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ProfilerTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.profile_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.profile_dir, ignore_errors=True)
+        override = override_settings(PROFILER_DIR=self.profile_dir, PROFILER_RATE_LIMIT=2)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.staff = User.objects.create_user(username='staff', password='pw', is_staff=True)
+        self.client.force_login(self.staff)
+
+    def test_profiles_are_stored_and_listed(self):
+        url = reverse('booking:help_guide')
+        self.assertNotIn('X-Profile-Id', self.client.get(url))
+
+        sampled = self.client.get(url, {'_profile': 'sample'})
+        self.assertEqual(sampled.status_code, 200)
+        profiled = self.client.get(url, HTTP_X_PROFILE='cprofile')
+        self.assertTrue((Path(self.profile_dir) / f"{sampled['X-Profile-Id']}.folded").exists())
+        self.assertTrue((Path(self.profile_dir) / f"{profiled['X-Profile-Id']}.prof").exists())
+        meta = json.loads((Path(self.profile_dir) / f"{profiled['X-Profile-Id']}.json").read_text(encoding='utf-8'))
+        self.assertEqual((meta['view'], meta['mode'], meta['status']), ('booking:help_guide', 'cprofile', 200))
+
+        # Two an hour.
+        self.assertNotIn('X-Profile-Id', self.client.get(url, {'_profile': 'sample'}))
+
+        listing = self.client.get(reverse('booking:profile_list'))
+        self.assertContains(listing, reverse('booking:profile_download', args=[meta['file']]))
+        download = self.client.get(reverse('booking:profile_download', args=[meta['file']]))
+        self.assertEqual(download.status_code, 200)
+        self.assertIn('attachment', download['Content-Disposition'])
+        self.assertEqual(self.client.get(reverse('booking:profile_download', args=['settings.py'])).status_code, 404)
+
+    def test_only_staff_can_profile(self):
+        patient = User.objects.create_user(username='patient', password='pw')
+        self.client.force_login(patient)
+        self.assertNotIn('X-Profile-Id', self.client.get(reverse('booking:help_guide'), {'_profile': 'cprofile'}))
+        self.assertEqual(list(Path(self.profile_dir).iterdir()), [])
+        self.assertEqual(self.client.get(reverse('booking:profile_list')).status_code, 302)
+
+
+class SlowQueryLogTestCase(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.log = Path(directory) / 'slow.jsonl'
+        override = override_settings(SLOW_QUERY_MS=0, SLOW_QUERY_LOG=self.log)
+        override.enable()
+        self.addCleanup(override.disable)
+        slow_queries._explained.clear()
+
+    def test_fingerprint_ignores_values(self):
+        self.assertEqual(
+            slow_queries.fingerprint('SELECT * FROM t WHERE id IN (%s, %s) AND name = \'a\' LIMIT 21'),
+            slow_queries.fingerprint('SELECT * FROM t WHERE id IN (%s) AND name = \'bb\' LIMIT 5'),
+        )
+
+    def test_slow_queries_are_logged_with_caller_and_plan(self):
+        DoctorProfile.objects.create(user=User.objects.create_user(username='slowdoc', user_type='DOCTOR'))
+        with CaptureQueriesContext(connection) as captured:
+            self.client.get(reverse('booking:doctor_list'))
+        # The EXPLAINs are not counted as queries of the page.
+        self.assertFalse(any('EXPLAIN' in query['sql'] for query in captured.captured_queries))
+        self.client.get(reverse('booking:doctor_list'))
+
+        records = list(slow_queries.read_log(self.log))
+        self.assertTrue(any(record['caller'].startswith('booking/views/') for record in records))
+        # One plan per fingerprint, however often it runs.
+        planned = [record['fingerprint'] for record in records if 'plan' in record]
+        self.assertTrue(planned)
+        self.assertEqual(len(planned), len(set(planned)))
+
+        out = StringIO()
+        call_command('slow_queries', '--log', str(self.log), '--top', '3', stdout=out)
+        self.assertIn('called', out.getvalue())
+        self.assertEqual(out.getvalue().count('queries, '), 3)
+
+
+class TelemetryTestCase(TestCase):
+    def test_request_id(self):
+        response = self.client.get(reverse('booking:help_guide'), HTTP_X_REQUEST_ID='edge-42')
+        self.assertEqual(response['X-Request-ID'], 'edge-42')
+        response = self.client.get(reverse('booking:help_guide'), HTTP_X_REQUEST_ID='bad id\n')
+        self.assertRegex(response['X-Request-ID'], r'^[0-9a-f]{32}$')
+
+    def test_json_lines_are_written_off_thread(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / 'app.jsonl'
+            handler = telemetry.QueuedHandler(filename=str(path))
+            handler.addFilter(telemetry.RequestIdFilter())
+            logger = logging.getLogger('booking.tests.telemetry')
+            logger.addHandler(handler)
+            logger.propagate = False
+            self.addCleanup(logger.removeHandler, handler)
+            token = telemetry.request_id.set('abc')
+            try:
+                logger.warning('paid %s', 12, extra={'order_id': 7})
+                try:
+                    1 / 0
+                except ZeroDivisionError:
+                    logger.exception('failed')
+            finally:
+                telemetry.request_id.reset(token)
+            handler.close()
+
+            lines = [json.loads(line) for line in path.read_text(encoding='utf-8').splitlines()]
+        self.assertEqual(lines[0]['message'], 'paid 12')
+        self.assertEqual((lines[0]['request_id'], lines[0]['order_id']), ('abc', 7))
+        self.assertIn('ZeroDivisionError', lines[1]['exception'])
+
+    @patch('requests.post')
+    def test_sms_metrics(self, mock_post):
+        mock_post.return_value.status_code = 200
+        mock_post.return_value.json.return_value = {'Status': 'Success'}
+        sent = telemetry.sms.value(pattern=4018, outcome='sent')
+        gateways.send_sms('09120000000', 4018, '123456')
+        self.assertEqual(telemetry.sms.value(pattern=4018, outcome='sent'), sent + 1)
+        self.assertEqual(mock_post.call_args.kwargs['timeout'], (gateways.HTTP_CONNECT_TIMEOUT, gateways.HTTP_TIMEOUT))
+
+        mock_post.side_effect = requests.Timeout('read timed out')
+        errors = telemetry.sms.value(pattern=4018, outcome='error')
+        with self.assertRaises(gateways.SMSError):
+            gateways.send_sms('09120000000', 4018, '123456')
+        self.assertEqual(telemetry.sms.value(pattern=4018, outcome='error'), errors + 1)
+        mock_post.side_effect = None
+
+        metrics = self.client.get(reverse('booking:metrics'))
+        self.assertEqual(metrics['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        self.assertContains(metrics, f'avalnobat_sms_total{{pattern="4018",outcome="sent"}} {sent + 1}')
+        self.assertContains(metrics, 'avalnobat_sms_send_seconds_bucket{pattern="4018",le="+Inf"}')
+        self.assertEqual(self.client.get(reverse('booking:metrics'), REMOTE_ADDR='10.0.0.5').status_code, 404)
+
+
+@override_settings(AMOOT_REMINDER_PATTERN_ID='4200')
+class ReminderTestCase(TestCase):
+    def setUp(self):
+        user = User.objects.create_user(username='dr_reminder', password='x', first_name='علی', last_name='رضایی', user_type='DOCTOR')
+        self.doctor = DoctorProfile.objects.create(
+            user=user, specialty=Specialty.objects.create(name='قلب'), address='مشهد', phone_number='05138400000',
+        )
+        self.day = timezone.localdate() + datetime.timedelta(days=1)
+
+        def at(day, hour):
+            return timezone.make_aware(datetime.datetime.combine(day, datetime.time(hour)))
+
+        self.due = [
+            Appointment.objects.create(
+                doctor=self.doctor, appointment_datetime=at(self.day, 8 + i), patient_name=f'بیمار {i}',
+                patient_phone=f'0912000000{i}', status=1,
+            )
+            for i in range(3)
+        ]
+        # Cancelled, unpaid and the day after are not reminded.
+        Appointment.objects.create(doctor=self.doctor, appointment_datetime=at(self.day, 12), patient_name='لغو', patient_phone='09120000010', status=3)
+        Appointment.objects.create(doctor=self.doctor, appointment_datetime=at(self.day, 13), patient_name='در انتظار', patient_phone='09120000011', status=4)
+        Appointment.objects.create(
+            doctor=self.doctor, appointment_datetime=at(self.day + datetime.timedelta(days=1), 8),
+            patient_name='پس‌فردا', patient_phone='09120000012', status=1,
+        )
+
+    @patch('booking.gateways.asend_sms')
+    def test_sends_each_reminder_once(self, mock_send_sms):
+        mock_send_sms.return_value = MagicMock(status_code=200, **{'json.return_value': {'Status': 'Success'}})
+        with self.assertNumQueries(1):
+            due = reminders.due(self.day)
+        self.assertEqual([reminder.appointment_id for reminder in due], [appointment.pk for appointment in self.due])
+        self.assertIn(',علی رضایی,', due[0].pattern_values)
+
+        stats = reminders.send_reminders(self.day, chunk_size=2)
+        self.assertEqual((stats['due'], stats['sent'], stats['failed']), (3, 3, 0))
+        self.assertEqual(mock_send_sms.await_count, 3)
+        mock_send_sms.assert_any_await('09120000000', settings.AMOOT_REMINDER_PATTERN_ID, due[0].pattern_values, client=ANY)
+        self.assertEqual(ReminderLog.objects.filter(status='sent', sent_at__isnull=False).count(), 3)
+
+        out = StringIO()
+        call_command('send_reminders', date=self.day.isoformat(), stdout=out)
+        self.assertIn('0 due, 0 sent', out.getvalue())
+        self.assertEqual(mock_send_sms.await_count, 3)
+
+    @patch('booking.gateways.asend_sms')
+    def test_failures_are_retried(self, mock_send_sms):
+        ok = mock_send_sms.return_value = MagicMock(status_code=200, **{'json.return_value': {'Status': 'Success'}})
+        mock_send_sms.side_effect = [gateways.SMSError('timeout'), ok, ok]
+        stats = reminders.send_reminders(self.day)
+        self.assertEqual((stats['sent'], stats['failed']), (2, 1))
+        failed = ReminderLog.objects.get(status='failed')
+        self.assertIn('timeout', failed.error)
+
+        mock_send_sms.side_effect = None
+        self.assertEqual(reminders.send_reminders(self.day, dry_run=True)['due'], 1)
+        stats = reminders.send_reminders(self.day)
+        self.assertEqual((stats['due'], stats['sent']), (1, 1))
+        mock_send_sms.assert_awaited_with(
+            Appointment.objects.get(pk=failed.appointment_id).patient_phone, settings.AMOOT_REMINDER_PATTERN_ID, ANY, client=ANY,
+        )
+        self.assertFalse(ReminderLog.objects.exclude(status='sent').exists())
+
+    @override_settings(AMOOT_REMINDER_PATTERN_ID=None)
+    @patch('booking.gateways.asend_sms')
+    def test_nothing_is_sent_without_a_pattern(self, mock_send_sms):
+        stats = reminders.send_reminders(self.day)
+        self.assertEqual((stats['due'], stats['sent'], stats['failed']), (3, 0, 0))
+        mock_send_sms.assert_not_called()
+        # Still due once the pattern is configured.
+        self.assertFalse(ReminderLog.objects.exists())
+
+
+@override_settings(AMOOT_WAITLIST_PATTERN_ID='5000')
+class WaitlistTestCase(TestCase):
+    def setUp(self):
+        user = User.objects.create_user(username='dr_waitlist', password='x', first_name='علی', last_name='رضایی', user_type='DOCTOR')
+        self.doctor = DoctorProfile.objects.create(user=user, specialty=Specialty.objects.create(name='قلب'))
+        self.day = timezone.localdate() + datetime.timedelta(days=1)
+        DoctorAvailability.objects.create(
+            doctor=self.doctor, day_of_week=self.day.weekday(), shift='MORNING',
+            start_time=datetime.time(8, 0), end_time=datetime.time(12, 0), visit_count=4,
+        )
+        self.slot = timezone.make_aware(datetime.datetime.combine(self.day, datetime.time(9, 0)))
+        self.appointment = Appointment.objects.create(
+            doctor=self.doctor, appointment_datetime=self.slot, patient_name='بیمار', patient_phone='09120000000', status=1,
+        )
+        self.patient = User.objects.create_user(username='09130000000', password='x', first_name='مریم', user_type='PATIENT')
+
+        def entry(phone, **fields):
+            return WaitlistEntry.objects.create(**{
+                'doctor': self.doctor, 'patient_name': phone, 'patient_phone': phone,
+                'date_from': self.day, 'date_to': self.day + datetime.timedelta(days=7), **fields,
+            })
+
+        # In the order they joined: the first wants another shift, the third other dates.
+        entry('09130000001', shift='AFTERNOON')
+        self.first = entry('09130000000', patient=self.patient)
+        entry('09130000003', date_from=self.day + datetime.timedelta(days=2))
+        self.second = entry('09130000004', shift='MORNING')
+        for minutes, pk in enumerate(WaitlistEntry.objects.order_by('pk').values_list('pk', flat=True)):
+            WaitlistEntry.objects.filter(pk=pk).update(created_at=timezone.now() - datetime.timedelta(minutes=60 - minutes))
+
+    def test_match_is_one_indexed_query(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(waitlist.next_entry(self.doctor.pk, self.day, 'MORNING'), self.first)
+        plan = WaitlistEntry.objects.filter(
+            doctor=self.doctor, status='waiting', date_from__lte=self.day, date_to__gte=self.day, shift__in=['MORNING', ''],
+        ).order_by('created_at').explain()
+        self.assertIn('waitlist_waiting_idx', plan)
+
+    @patch('booking.gateways.asend_sms')
+    def test_cancellation_offers_the_slot(self, mock_send_sms):
+        mock_send_sms.return_value = MagicMock(status_code=200, **{'json.return_value': {'Status': 'Success'}})
+        self.appointment.status = 3
+        with self.captureOnCommitCallbacks(execute=True):
+            self.appointment.save()
+
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.status, 'offered')
+        offer = self.first.appointment
+        self.assertEqual((offer.appointment_datetime, offer.status, offer.patient_id), (self.slot, 4, self.patient.pk))
+        # The cancelling request does not wait for the SMS API; the cron batch texts the offer.
+        mock_send_sms.assert_not_called()
+        self.assertEqual(waitlist.send_offers(), (1, 0))
+        self.assertEqual(waitlist.send_offers(), (0, 0))
+        mobile, pattern, values = mock_send_sms.call_args.args
+        self.assertEqual((mobile, pattern), ('09130000000', '5000'))
+        self.first.refresh_from_db()
+        self.assertIsNotNone(self.first.offer_sent_at)
+        link = values.rsplit(',', 1)[1]
+        self.assertTrue(link.startswith('https://'))
+
+        response = self.client.get(urlsplit(link).path)
+        self.assertRedirects(response, reverse('booking:payment_page'), fetch_redirect_response=False)
+        self.assertEqual(self.client.session['pending_appointment_id'], offer.pk)
+
+        offer.status = 1
+        offer.save()
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.status, 'booked')
+
+    @patch('booking.gateways.asend_sms')
+    def test_failed_offer_keeps_no_expiry(self, mock_send_sms):
+        mock_send_sms.return_value = MagicMock(status_code=500, text='down')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.appointment.delete()
+        self.assertEqual(waitlist.send_offers(), (0, 1))
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.status, 'offered')
+        self.assertIsNone(self.first.offer_expires_at)
+        self.assertEqual(waitlist.expire_holds(now=timezone.now() + datetime.timedelta(hours=2))['offers'], 0)
+
+    @override_settings(AMOOT_WAITLIST_PATTERN_ID=None)
+    def test_no_offers_without_a_pattern(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.appointment.delete()
+        self.assertFalse(WaitlistEntry.objects.exclude(status='waiting').exists())
+        self.assertFalse(Appointment.objects.filter(status=4).exists())
+
+    @patch('booking.gateways.asend_sms')
+    def test_expire_holds(self, mock_send_sms):
+        mock_send_sms.return_value = MagicMock(status_code=200, **{'json.return_value': {'Status': 'Success'}})
+        stale = WaitlistEntry.objects.create(
+            doctor=self.doctor, patient_name='x', patient_phone='09130000009',
+            date_from=self.day - datetime.timedelta(days=5), date_to=self.day - datetime.timedelta(days=2),
+        )
+        unpaid = Appointment.objects.create(
+            doctor=self.doctor, appointment_datetime=self.slot + datetime.timedelta(hours=1),
+            patient_name='بدون پرداخت', patient_phone='09120000001', status=4,
+        )
+        Appointment.objects.filter(pk=unpaid.pk).update(created_at=timezone.now() - datetime.timedelta(hours=1))
+        # Booked as long ago, but at the bank right now: the hold runs from the payment order.
+        paying = Appointment.objects.create(
+            doctor=self.doctor, appointment_datetime=self.slot + datetime.timedelta(hours=2),
+            patient_name='در حال پرداخت', patient_phone='09120000002', status=4, payment_started_at=timezone.now(),
+        )
+        Appointment.objects.filter(pk=paying.pk).update(created_at=timezone.now() - datetime.timedelta(hours=1))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.appointment.delete()
+        self.first.refresh_from_db()
+        # An offer not texted yet has no expiry; pretend it was texted half an hour ago.
+        self.assertIsNone(self.first.offer_expires_at)
+        WaitlistEntry.objects.filter(pk=self.first.pk).update(
+            offer_sent_at=timezone.now() - datetime.timedelta(minutes=31),
+            offer_expires_at=timezone.now() - datetime.timedelta(minutes=1),
+        )
+
+        out = StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('expire_holds', stdout=out)
+        self.assertIn('2 holds cancelled, 1 waitlist offers and 1 waitlist entries expired', out.getvalue())
+        # Run after the releases have committed, as the command does outside a test transaction.
+        self.assertEqual(waitlist.send_offers(), (1, 0))
+        self.assertEqual(Appointment.objects.get(pk=paying.pk).status, 4)
+        stale.refresh_from_db()
+        self.assertEqual(stale.status, 'expired')
+        self.assertEqual(Appointment.objects.get(pk=self.first.appointment_id).status, 3)
+        self.assertEqual(WaitlistEntry.objects.get(pk=self.first.pk).status, 'expired')
+        # The next entry in line is offered one of the two freed morning slots.
+        self.second.refresh_from_db()
+        self.assertEqual(self.second.status, 'offered')
+        self.assertIn(self.second.appointment.appointment_datetime, [self.slot, unpaid.appointment_datetime])
+
+        self.client.force_login(self.patient)
+        session = self.client.session
+        session['pending_appointment_id'] = unpaid.pk
+        session.save()
+        self.assertContains(self.client.get(reverse('booking:payment_page')), 'مهلت پرداخت این نوبت به پایان رسیده است')
+
+    @patch('booking.gateways.get_payment_client')
+    def test_payment_after_the_hold_ran_out_is_reversed(self, mock_client):
+        service = mock_client.return_value.service
+        service.bpVerifyRequest.return_value = service.bpSettleRequest.return_value = service.bpReversalRequest.return_value = '0'
+        # The hold was cancelled by expire_holds and the slot given to the waitlist meanwhile.
+        with self.captureOnCommitCallbacks(execute=True):
+            Appointment.objects.filter(pk=self.appointment.pk).update(status=4, payment_order_id=777)
+            self.appointment.refresh_from_db()
+            self.appointment.status = 3
+            self.appointment.save()
+        self.assertEqual(Appointment.objects.filter(appointment_datetime=self.slot, status=4).count(), 1)
+
+        response = self.client.post(reverse('booking:verify_payment'), {'ResCode': '0', 'SaleOrderId': '777', 'SaleReferenceId': '1'})
+        self.assertContains(response, 'مهلت پرداخت این نوبت پیش از تکمیل پرداخت به پایان رسیده')
+        self.assertContains(response, 'بازگردانده شد')
+        service.bpSettleRequest.assert_not_called()
+        service.bpReversalRequest.assert_awaited_once()
+        self.assertEqual(Appointment.objects.get(pk=self.appointment.pk).status, 3)
+
+    def test_join_waitlist(self):
+        url = reverse('booking:join_waitlist', kwargs={'pk': self.doctor.pk})
+        self.client.force_login(self.patient)
+        day = jalali.format_date(self.day, '%Y/%m/%d')
+        response = self.client.post(url, {'date_from': day, 'date_to': day, 'shift': '', 'insurance_type': 'AZAD'})
+        self.assertRedirects(response, reverse('booking:doctor_detail', kwargs={'pk': self.doctor.pk}), fetch_redirect_response=False)
+        entry = WaitlistEntry.objects.latest('pk')
+        self.assertEqual((entry.date_from, entry.date_to, entry.patient_phone), (self.day, self.day, '09130000000'))
+        response = self.client.post(url, {'date_from': 'x', 'date_to': '1400/01/01', 'shift': '', 'insurance_type': 'AZAD'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['form'].errors)
+
+
+class ImportTestCase(TestCase):
+    def setUp(self):
+        self.doctor_user = User.objects.create_user(username='dr_import', password='x', user_type='DOCTOR')
+        self.doctor = DoctorProfile.objects.create(user=self.doctor_user)
+
+    def test_normalization(self):
+        moment = importer.parse_datetime('۱۴۰۲/۰۵/۱۰ ساعت ۹:۳۰')
+        self.assertEqual(timezone.localtime(moment).replace(tzinfo=None), datetime.datetime(2023, 8, 1, 9, 30))
+        self.assertEqual(importer.parse_date('2023-08-01'), datetime.date(2023, 8, 1))
+        self.assertEqual(importer.parse_amount('۱۵۰٬۰۰۰'), Decimal(150000))
+        self.assertEqual(importer.parse_amount(150000.0), Decimal(150000))
+        with self.assertRaises(ValueError):
+            importer.parse_date('1402/13/01')
+
+    def test_csv_import_in_chunks(self):
+        rows = ['نام بیمار,شماره همراه,کد ملی,نوع بیمه,زمان نوبت,مبلغ ویزیت دریافتی']
+        rows += [f'بیمار {i},912000{i:04d},{i},آزاد,۱۴۰۲/۰۵/{1 + i % 28:02d} 10:{i % 60:02d},"150,000"' for i in range(25)]
+        rows += ['بی‌تاریخ,09120000000,,آزاد,,', 'بیمه,09120000001,,نامعلوم,1402/05/01 10:00,']
+        path = Path(tempfile.mkdtemp()) / 'patients.csv'
+        self.addCleanup(shutil.rmtree, path.parent)
+        path.write_text('\n'.join(rows), encoding='utf-8-sig')
+
+        out, err = StringIO(), StringIO()
+        call_command('import_records', 'appointments', str(path), doctor='dr_import', dry_run=True, chunk_size=10, stdout=out, stderr=err)
+        self.assertIn('25 rows would be imported', out.getvalue())
+        self.assertIn('Row 28:', err.getvalue())
+        self.assertFalse(Appointment.objects.exists())
+
+        call_command('import_records', 'appointments', str(path), doctor=str(self.doctor.pk), chunk_size=10, stdout=out, stderr=err)
+        self.assertEqual(Appointment.objects.filter(doctor=self.doctor, status=2).count(), 25)
+        appointment = Appointment.objects.get(patient_name='بیمار 7')
+        self.assertEqual((appointment.patient_phone, appointment.patient_national_id), ('09120000007', '0000000007'))
+        self.assertEqual(appointment.visit_fee_paid, 150000)
+
+        result = importer.import_rows('appointments', self.doctor, importer.read_rows(path.open('rb'), path.name))
+        self.assertEqual((result.created, result.duplicates, result.invalid), (0, 25, 2))
+
+    def test_xlsx_upload(self):
+        workbook = openpyxl.Workbook()
+        workbook.active.append(['تاریخ', 'شرح', 'مبلغ'])
+        workbook.active.append(['۱۴۰۲/۰۱/۱۵', 'اجاره', 5000000])
+        workbook.active.append([datetime.datetime(2023, 4, 5), 'قبض برق', '۲۰۰٬۰۰۰'])
+        upload = BytesIO()
+        workbook.save(upload)
+        upload.name = 'expenses.xlsx'
+        upload.seek(0)
+
+        self.client.force_login(self.doctor_user)
+        response = self.client.post(reverse('booking:import_records'), {'kind': 'expenses', 'file': upload})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['result'].created, 2)
+        self.assertEqual(
+            list(DailyExpense.objects.order_by('date').values_list('date', 'amount')),
+            [(datetime.date(2023, 4, 4), 5000000), (datetime.date(2023, 4, 5), 200000)],
+        )
+
+        response = self.client.post(reverse('booking:import_records'), {'kind': 'expenses', 'file': SimpleUploadedFile('a.txt', b'x')})
+        self.assertTrue(response.context['form'].errors)
+
+
+class BenchmarkCommandTestCase(TestCase):
+    def test_benchmark_reports_every_scenario(self):
+        """The benchmark command times every hot path and emits a JSON report."""
+        out = StringIO()
+        call_command(
+            'benchmark', doctors=1, years=0.05, iterations=2, warmup=0,
+            stdout=out, stderr=StringIO(),
+        )
+        report = json.loads(out.getvalue())
+
+        self.assertIn('meta', report)
+        self.assertEqual(report['meta']['scale']['doctors'], 1)
+        for name in ['doctor_list', 'doctor_detail', 'book_appointment', 'manage_day',
+                     'secretary_panel', 'daily_patients', 'secretary_payments',
+                     'financial_report_daily', 'export_patients_to_excel', 'export_expenses_to_excel']:
+            result = report['results'][name]
+            self.assertEqual(result['status_codes'], [200], name)
+            self.assertEqual(result['iterations'], 2)
+            self.assertLessEqual(result['p50_ms'], result['max_ms'])
+
+        # Generated data is rolled back unless --keep-data is given.
+        self.assertFalse(DoctorProfile.objects.filter(user__username__startswith='bench_').exists())
+
+
+class LoadTestCommandTestCase(TransactionTestCase):
+    def test_loadtest_completes_full_flow(self):
+        """Virtual patients book, verify and pay through the stand-in gateways."""
+        users = User.objects.count()
+        out = StringIO()
+        call_command(
+            'loadtest', patients=3, concurrency=1, gateway_latency=0,
+            stdout=out, stderr=StringIO(),
+        )
+        report = json.loads(out.getvalue())
+
+        self.assertEqual(report['outcomes']['paid'], 3)
+        self.assertEqual(report['double_booking_violations'], 0)
+        self.assertEqual(report['gateway_calls']['bpSettleRequest'], 3)
+        self.assertIn('verify_payment', report['latency_ms'])
+        # The load-test doctor and the patients it created are removed afterwards.
+        self.assertFalse(DoctorProfile.objects.exists())
+        self.assertEqual(User.objects.count(), users)
+
+
+class FakeGatewayTestCase(TestCase):
+    """Payment and SMS paths against the local fake gateways, without mocks."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = fake_gateways.start_in_thread()
+        cls.app = cls.server.get_app()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.app.failure_rate = 0
+        self.patient_user = User.objects.create_user(username='09150000000', user_type='PATIENT')
+        doctor_user = User.objects.create_user(username='doctor', first_name='علی', last_name='رضایی', user_type='DOCTOR')
+        self.doctor_profile = DoctorProfile.objects.create(user=doctor_user, address='مشهد', phone_number='0513')
+        self.appointment = Appointment.objects.create(
+            doctor=self.doctor_profile, patient=self.patient_user,
+            appointment_datetime=timezone.now() + datetime.timedelta(days=1),
+            patient_name='بیمار تستی', patient_phone='09150000000', status=4,
+        )
+        session = self.client.session
+        session['pending_appointment_id'] = self.appointment.id
+        session.save()
+        self.settings_override = override_settings(**fake_gateways.gateway_settings(fake_gateways.server_url(self.server)))
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+    def test_payment_round_trip(self):
+        # The online booking fee does not follow the fee the clinic charges for the visit.
+        InsuranceFee.objects.create(doctor=self.doctor_profile, insurance_type='AZAD', fee=250000)
+        response = self.client.get(reverse('booking:payment_page'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['payment_amount'], self.doctor_profile.visit_fee)
+        self.assertIsNone(response.context['error_message'])
+        self.assertTrue(response.context['ref_id'].startswith('FAKE'))
+        self.assertContains(response, fake_gateways.START_PAY_PATH)
+
+        self.appointment.refresh_from_db()
+        sms_before = self.app.stats['sms']
+        response = self.client.post(reverse('booking:verify_payment'), {
+            'ResCode': '0',
+            'SaleOrderId': str(self.appointment.payment_order_id),
+            'SaleReferenceId': '123456',
+        })
+        self.assertRedirects(response, reverse('booking:patient_dashboard'))
+        self.appointment.refresh_from_db()
+        self.assertEqual(self.appointment.status, 1)
+        self.assertEqual(self.app.stats['sms'], sms_before + 1)
+
+    def test_injected_bank_failure(self):
+        self.app.failure_rate = 1
+        response = self.client.get(reverse('booking:payment_page'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['error_message'], 'خطای سیستمی')
+
+    def test_http_client_is_closed_outside_asgi(self):
+        async def send():
+            async with gateways.http_client() as client:
+                await gateways.asend_sms('09150000000', 4018, '123456', client=client)
+            return client
+
+        clients = gateways._http_clients.copy()
+        client = async_to_sync(send)()
+        self.assertTrue(client.is_closed)
+        self.assertEqual(len(gateways._http_clients), len(clients))
+
+        with self.settings(ASGI_SERVER=True):
+            self.assertFalse(async_to_sync(send)().is_closed)
+
+
+class StaticPipelineTestCase(SimpleTestCase):
+    def test_collectstatic_hashes_and_compresses(self):
+        # Only static/booking; compressing the fonts and the admin assets as well would slow the suite down.
+        finders = ['django.contrib.staticfiles.finders.FileSystemFinder']
+        dirs = [('booking', settings.BASE_DIR / 'static' / 'booking')]
+        storages = {**settings.STORAGES, 'staticfiles': {'BACKEND': 'whitenoise.storage.CompressedManifestStaticFilesStorage'}}
+        with tempfile.TemporaryDirectory() as static_root, override_settings(
+            STATIC_ROOT=static_root, STATICFILES_FINDERS=finders, STATICFILES_DIRS=dirs, STORAGES=storages,
+        ):
+            call_command('collectstatic', interactive=False, verbosity=0)
+            manifest = json.loads((Path(static_root) / 'staticfiles.json').read_text())['paths']
+            hashed_css = manifest['booking/css/base.css']
+            self.assertNotEqual(hashed_css, 'booking/css/base.css')
+            for suffix in ('', '.gz', '.br'):
+                self.assertTrue((Path(static_root) / (hashed_css + suffix)).exists(), suffix)
+
+            html = render_to_string('booking/base.html')
+            self.assertIn(f'/static/{hashed_css}', html)
+            self.assertIn(f"/static/{manifest['booking/js/base.js']}", html)
+
+
+class ImportTimeTestCase(SimpleTestCase):
+    def test_boot_does_not_load_deferred_libraries(self):
+        # The time budget depends on the machine; the deferred imports do not.
+        out = StringIO()
+        call_command('importtime', '--runs', '1', '--budget-ms', '100000', stdout=out)
+        self.assertIn('Within the budget', out.getvalue())
@@ -10,18 +10,25 @@ urlpatterns = [
     path('signup/secretary/', views.secretary_signup, name='secretary_signup'),
     path('signup/secretary/verify/', views.verify_secretary_signup, name='verify_secretary_signup'),
     path('doctor/<int:pk>/', views.doctor_detail, name='doctor_detail'),
+    path('session-status/', views.session_status, name='session_status'),
+    path('earliest-slots/', views.earliest_slots, name='earliest_slots'),
     path('doctor/<int:pk>/book/<str:date>/', views.book_appointment, name='book_appointment'),
     path('verify/', views.verify_appointment, name='verify_appointment'),
+    path('doctor/<int:pk>/waitlist/', views.join_waitlist, name='join_waitlist'),
+    path('waitlist/offer/<str:token>/', views.waitlist_offer, name='waitlist_offer'),
     path('confirm/', views.confirm_payment, name='confirm_payment'),
     path('dashboard/', views.doctor_dashboard, name='doctor_dashboard'),
     path('availability/<int:pk>/edit/', views.edit_availability, name='edit_availability'),
     path('availability/<int:pk>/delete/', views.delete_availability, name='delete_availability'),
     path('availability/<int:pk>/toggle/', views.toggle_availability, name='toggle_availability'),
     path('profile/edit/', views.edit_profile, name='edit_profile'),
+    path('secretary-panel/calendar/', views.secretary_calendar, name='secretary_calendar'),
     re_path(r'^secretary-panel/(?P<date>\d{4}-\d{2}-\d{2})?/?$', views.secretary_panel, name='secretary_panel'),
     re_path(r'^daily-patients/(?P<date>\d{4}-\d{2}-\d{2})?/?$', views.daily_patients, name='daily_patients'),
     path('patient-list/', views.patient_list, name='patient_list'),
     path('reservation-list/', views.reservation_list, name='reservation_list'),
+    path('clinic-events/', views.clinic_events, name='clinic_events'),
+    path('waiting-room/', views.waiting_room, name='waiting_room'),
     path('cancel-reservation/<int:pk>/', views.cancel_reservation, name='cancel_reservation'),
     re_path(r'^secretary-payments/(?P<date>\d{4}-\d{2}-\d{2})?/?$', views.secretary_payments, name='secretary_payments'),
     path('expense/edit/<int:pk>/', views.edit_expense, name='edit_expense'),
@@ -35,6 +42,7 @@ urlpatterns = [
     path('accounting-guide/', views.accounting_guide, name='accounting_guide'),
     path('export/patients/excel/', views.export_patients_to_excel, name='export_patients_to_excel'),
     path('export/expenses/excel/', views.export_expenses_to_excel, name='export_expenses_to_excel'),
+    path('import/', views.import_records, name='import_records'),
     path('patient-login/', views.patient_login, name='patient_login'),
     path('patient-dashboard-entry/', views.patient_dashboard_entry, name='patient_dashboard_entry'),
     path('patient-logout/', views.patient_logout, name='patient_logout'),
@@ -43,4 +51,7 @@ urlpatterns = [
     path('password-reset/verify/', views.password_reset_verify, name='password_reset_verify'),
     path('password-reset/complete/', views.password_reset_complete, name='password_reset_complete'),
     path('help-guide/', views.help_guide, name='help_guide'),
+    path('profiles/', views.profile_list, name='profile_list'),
+    path('profiles/<str:filename>', views.profile_download, name='profile_download'),
+    path('metrics', views.metrics, name='metrics'),
 ]
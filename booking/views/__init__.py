@@ -0,0 +1,59 @@
+"""
+The views of the booking app, one module per area of the site.
+
+The modules are imported when one of their views is first looked up, e.g.
+by the URLconf, and keep heavy libraries (openpyxl, httpx, zeep) out of
+their imports, so starting a worker or running a management command only
+pays for what it uses. ``manage.py importtime`` checks the cost.
+"""
+import importlib
+
+_VIEWS = {
+    'public': (
+        'doctor_list', 'earliest_slots', 'doctor_detail', 'session_status', 'help_guide', 'serve_media',
+    ),
+    'booking': (
+        'book_appointment', 'verify_appointment', 'join_waitlist', 'waitlist_offer', 'patient_dashboard',
+    ),
+    'payment': (
+        'payment_page', 'verify_payment', 'initiate_payment', 'confirm_payment',
+    ),
+    'doctor': (
+        'doctor_dashboard', 'edit_availability', 'delete_availability', 'toggle_availability', 'manage_day',
+        'edit_profile', 'edit_expense', 'delete_expense',
+    ),
+    'secretary': (
+        'secretary_panel', 'secretary_calendar', 'patient_list', 'daily_patients', 'secretary_payments',
+        'reservation_list', 'clinic_events', 'waiting_room', 'cancel_reservation',
+    ),
+    'reports': (
+        'financial_report', 'expense_balance_report', 'expense_item_details', 'accounting_guide',
+    ),
+    'exports': (
+        'export_patients_to_excel', 'export_expenses_to_excel', 'import_records',
+    ),
+    'auth': (
+        'doctor_signup', 'verify_doctor_signup', 'secretary_signup', 'verify_secretary_signup',
+        'patient_dashboard_entry', 'patient_login', 'verify_patient_login', 'patient_logout',
+        'password_reset_request', 'password_reset_verify', 'password_reset_complete', 'CustomLoginView',
+    ),
+    'ops': (
+        'profile_list', 'profile_download', 'metrics',
+    ),
+}
+_MODULES = {name: module for module, names in _VIEWS.items() for name in names}
+
+__all__ = sorted(_MODULES)
+
+
+def __getattr__(name):
+    module = _MODULES.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f'.{module}', __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted([*globals(), *_MODULES])
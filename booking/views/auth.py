@@ -0,0 +1,314 @@
+"""
+Signup, login and password reset of doctors, secretaries and patients.
+"""
+import logging
+import random
+
+from asgiref.sync import sync_to_async
+
+from django.contrib import messages
+from django.contrib.auth import get_user_model, login, logout
+from django.contrib.auth.views import LoginView
+from django.shortcuts import redirect, render
+from django.urls import reverse
+
+from .. import gateways
+from ..forms import DoctorRegistrationForm, SecretarySignUpForm, PasswordResetRequestForm, PasswordResetVerifyForm
+from ..models import DoctorProfile
+from .base import arender
+
+sms_logger = logging.getLogger('booking.sms')
+User = get_user_model()
+
+
+def doctor_signup(request):
+    if request.method == 'POST':
+        form = DoctorRegistrationForm(request.POST, request.FILES)
+        if form.is_valid():
+            user = form.save(commit=False)
+            user.is_active = False  # Deactivate account until verification
+            user.save()
+
+            # Create the doctor's profile
+            DoctorProfile.objects.create(
+                user=user,
+                specialty=form.cleaned_data.get('specialty'),
+                address=form.cleaned_data.get('address'),
+                phone_number=form.cleaned_data.get('phone_number'),
+                mobile_number=form.cleaned_data.get('mobile_number'),
+                photo=form.cleaned_data.get('photo'),
+                biography=form.cleaned_data.get('biography')
+            )
+
+            try:
+                otp_code = str(random.randint(100000, 999999))
+                request.session['otp_code'] = otp_code
+                request.session['new_user_id'] = user.id
+                mob_number = form.cleaned_data.get('mobile_number')
+                gateways.send_sms(mob_number, 4018, otp_code)
+                return redirect('booking:verify_doctor_signup')
+            except gateways.SMSError as e:
+                # Handle exceptions, delete the created user since we can't verify them
+                user.delete()
+                form.add_error(None, "خطا در ارسال کد تایید. لطفاً مجدداً تلاش کنید.")
+                # Fall through to render the form with the error message
+    else: # GET
+        form = DoctorRegistrationForm()
+
+    return render(request, 'booking/signup.html', {'form': form, 'page_title': 'ثبت نام پزشک'})
+
+
+def verify_doctor_signup(request):
+    new_user_id = request.session.get('new_user_id')
+    if not new_user_id:
+        return redirect('signup')
+
+    try:
+        user = User.objects.get(pk=new_user_id)
+    except User.DoesNotExist:
+        return redirect('signup')
+
+    if request.method == 'POST':
+        otp_from_user = request.POST.get('otp')
+        otp_from_session = request.session.get('otp_code')
+
+        if otp_from_user == otp_from_session:
+            user.is_active = True
+            user.save()
+
+            # Clean up session
+            del request.session['new_user_id']
+            del request.session['otp_code']
+
+            login(request, user)
+            return redirect('booking:doctor_dashboard')
+        else:
+            error = 'کد وارد شده صحیح نمی‌باشد.'
+            return render(request, 'booking/verify_doctor_signup.html', {'error': error})
+
+    return render(request, 'booking/verify_doctor_signup.html', {'page_title': 'تأیید ثبت نام پزشک'})
+
+
+def secretary_signup(request):
+    if request.method == 'POST':
+        form = SecretarySignUpForm(request.POST)
+        if form.is_valid():
+            user = form.save(commit=False)
+            user.is_active = False  # Deactivate account until verification
+            user.save()
+
+            try:
+                otp_code = str(random.randint(100000, 999999))
+                request.session['otp_code'] = otp_code
+                request.session['new_user_id'] = user.id
+                doctor_mobile_number = user.doctor.mobile_number
+                gateways.send_sms(doctor_mobile_number, 4018, otp_code)
+                return redirect('booking:verify_secretary_signup')
+            except gateways.SMSError as e:
+                user.delete()
+                form.add_error(None, "خطا در ارسال کد تایید. لطفاً مجدداً تلاش کنید.")
+    else:
+        form = SecretarySignUpForm()
+
+    return render(request, 'booking/secretary_signup.html', {'form': form, 'page_title': 'ثبت نام منشی'})
+
+
+def verify_secretary_signup(request):
+    new_user_id = request.session.get('new_user_id')
+    if not new_user_id:
+        return redirect('booking:secretary_signup')
+
+    try:
+        user = User.objects.get(pk=new_user_id)
+    except User.DoesNotExist:
+        return redirect('booking:secretary_signup')
+
+    if request.method == 'POST':
+        otp_from_user = request.POST.get('otp')
+        otp_from_session = request.session.get('otp_code')
+
+        if otp_from_user == otp_from_session:
+            user.is_active = True
+            user.save()
+
+            del request.session['new_user_id']
+            del request.session['otp_code']
+
+            login(request, user)
+            return redirect('booking:doctor_dashboard')
+        else:
+            error = 'کد وارد شده صحیح نمی‌باشد.'
+            return render(request, 'booking/verify_secretary_signup.html', {'error': error})
+
+    return render(request, 'booking/verify_secretary_signup.html', {'page_title': 'تأیید ثبت نام منشی'})
+
+
+def patient_dashboard_entry(request):
+    """
+    Entry point for patient dashboard.
+    This page will have JS to check localStorage and redirect.
+    """
+    return render(request, 'booking/patient_dashboard_entry.html')
+
+
+async def patient_login(request):
+    """
+    Handles patient login by sending an OTP to their mobile number.
+    """
+    if request.method == 'POST':
+        mobile_number = request.POST.get('mobile_number', '').strip()
+        if not (mobile_number.isdigit() and len(mobile_number) == 11 and mobile_number.startswith('09')):
+             return await arender(request, 'booking/patient_login.html', {'error': 'شماره موبایل نامعتبر است. باید 11 رقم باشد و با 09 شروع شود.'})
+
+        # --- OTP & SMS Sending Logic ---
+        try:
+            otp_code = str(random.randint(100000, 999999))
+            await request.session.aset('otp_code_login', otp_code)
+            await request.session.aset('mobile_number_login', mobile_number)
+            await request.session.aset_expiry(300) # 5 minutes expiry for OTP
+
+            response = await gateways.asend_sms(mobile_number, 4018, otp_code)
+            return redirect('booking:verify_patient_login')
+
+        except gateways.SMSError as e:
+            sms_logger.error('Login OTP could not be sent: %s', e)
+            return await arender(request, 'booking/patient_login.html', {'error': 'سیستم قادر به ارسال پیامک نمیباشد. لطفا با پشتیبانی تماس بگیرید.'})
+
+    return await arender(request, 'booking/patient_login.html')
+
+
+def verify_patient_login(request):
+    """
+    Verifies the OTP sent to the patient's mobile number and logs them in.
+    """
+    mobile_number = request.session.get('mobile_number_login')
+    if not mobile_number:
+        messages.error(request, 'اعتبار سنجی شما به پایان رسیده است. لطفا مجددا تلاش کنید.')
+        return redirect('booking:patient_login')
+
+    if request.method == 'POST':
+        otp_from_user = request.POST.get('otp')
+        otp_from_session = request.session.get('otp_code_login')
+
+        if otp_from_user == otp_from_session:
+            patient_user, created = User.objects.get_or_create(
+                username=mobile_number,
+                defaults={'user_type': 'PATIENT'}
+            )
+            login(request, patient_user)
+            request.session.save()
+            # Store the phone number for the dashboard to pick up
+            request.session['verified_patient_phone'] = mobile_number
+
+            for key in ['otp_code_login', 'mobile_number_login']:
+                if key in request.session:
+                    del request.session[key]
+
+            messages.success(request, 'شما با موفقیت وارد شدید.')
+            return redirect('booking:patient_dashboard')
+        else:
+            return render(request, 'booking/verify_patient_login.html', {'error': 'کد وارد شده صحیح نمی‌باشد.', 'mobile_number': mobile_number})
+
+    return render(request, 'booking/verify_patient_login.html', {'mobile_number': mobile_number})
+
+
+def patient_logout(request):
+    """
+    Logs the patient out.
+    """
+    logout(request)
+    #messages.success(request, 'شما با موفقیت خارج شدید.')
+    return redirect('booking:patient_login')
+
+
+async def password_reset_request(request):
+    if request.method == 'POST':
+        form = PasswordResetRequestForm(request.POST)
+        if await sync_to_async(form.is_valid)():
+            mobile_number = form.cleaned_data['mobile_number']
+            try:
+                doctor_profile = await DoctorProfile.objects.aget(mobile_number=mobile_number)
+
+                otp_code = str(random.randint(100000, 999999))
+                await request.session.aset('otp_code_reset', otp_code)
+                await request.session.aset('reset_user_id', doctor_profile.user_id)
+                await request.session.aset_expiry(300)
+                await gateways.asend_sms(mobile_number, 4018, otp_code)
+
+                return redirect('booking:password_reset_verify')
+
+            except DoctorProfile.DoesNotExist:
+                form.add_error('mobile_number', 'پزشکی با این شماره موبایل یافت نشد.')
+            except gateways.SMSError as e:
+                sms_logger.error('Password reset OTP could not be sent: %s', e)
+                form.add_error(None, f"خطا در ارسال پیامک: {e}")
+
+    else:
+        form = PasswordResetRequestForm()
+
+    return await arender(request, 'booking/password_reset_request.html', {'form': form, 'page_title': 'فراموشی رمز عبور'})
+
+
+def password_reset_verify(request):
+    reset_user_id = request.session.get('reset_user_id')
+    if not reset_user_id:
+        messages.error(request, 'اعتبار سنجی شما به پایان رسیده است. لطفا مجددا تلاش کنید.')
+        return redirect('booking:password_reset_request')
+
+    try:
+        user = User.objects.get(pk=reset_user_id)
+    except User.DoesNotExist:
+        messages.error(request, 'کاربر مورد نظر یافت نشد.')
+        return redirect('booking:password_reset_request')
+
+    if request.method == 'POST':
+        form = PasswordResetVerifyForm(request.POST)
+        if form.is_valid():
+            otp_from_user = form.cleaned_data.get('otp')
+            otp_from_session = request.session.get('otp_code_reset')
+
+            if otp_from_user == otp_from_session:
+                new_password = form.cleaned_data.get('new_password1')
+                user.set_password(new_password)
+                user.save()
+
+                for key in ['otp_code_reset', 'reset_user_id']:
+                    if key in request.session:
+                        del request.session[key]
+
+                messages.success(request, 'رمز عبور شما با موفقیت تغییر کرد.')
+                return redirect('booking:password_reset_complete')
+            else:
+                form.add_error('otp', 'کد وارد شده صحیح نمی‌باشد.')
+    else:
+        form = PasswordResetVerifyForm()
+
+    return render(request, 'booking/password_reset_verify.html', {'form': form, 'page_title': 'تایید و تغییر رمز عبور'})
+
+
+def password_reset_complete(request):
+    return render(request, 'booking/password_reset_complete.html', {'page_title': 'تغییر رمز موفقیت‌آمیز'})
+
+
+class CustomLoginView(LoginView):
+    template_name = 'booking/login.html'
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.user.is_authenticated and request.user.user_type == 'PATIENT':
+            logout(request)
+        return super().dispatch(request, *args, **kwargs)
+
+    def get_success_url(self):
+        user = self.request.user
+        if user.is_authenticated:
+            if user.user_type == 'DOCTOR':
+                doctor_profile = getattr(user, 'doctor_profile', None)
+                if doctor_profile and doctor_profile.financial_settings_completed:
+                    return reverse('booking:daily_patients')
+                else:
+                    return reverse('booking:doctor_dashboard')
+            elif user.user_type == 'SECRETARY':
+                return reverse('booking:daily_patients')
+            elif user.user_type == 'PATIENT':
+                return reverse('booking:patient_dashboard')
+        return reverse('booking:doctor_list')
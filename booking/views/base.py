@@ -0,0 +1,14 @@
+"""
+Helpers shared by the async views.
+"""
+from asgiref.sync import sync_to_async
+
+from django.shortcuts import render
+
+
+async def arender(request, template_name, context=None):
+    """
+    render() for async views. Templates read the session and lazy relations,
+    so rendering runs on the sync thread.
+    """
+    return await sync_to_async(render)(request, template_name, context)
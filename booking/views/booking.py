@@ -0,0 +1,243 @@
+"""
+Booking an appointment, confirming it by SMS code, the waitlist and the
+patient dashboard.
+"""
+import datetime
+import logging
+import random
+
+from asgiref.sync import sync_to_async
+
+from django.contrib import messages
+from django.contrib.auth import get_user_model
+from django.contrib.auth.decorators import login_required
+from django.db import OperationalError, transaction
+from django.shortcuts import aget_object_or_404, get_object_or_404, redirect, render
+
+from .. import gateways, jalali, schedule, telemetry, waitlist
+from ..forms import AppointmentBookingForm, ReviewForm, WaitlistForm
+from ..models import DoctorProfile, Appointment
+from .base import arender
+
+logger = logging.getLogger('booking')
+sms_logger = logging.getLogger('booking.sms')
+
+
+def _create_pending_appointment(doctor, form, appointment_datetime):
+    """
+    Saves the booking form as an appointment awaiting payment.
+    Raises ValueError if the slot was taken in the meantime.
+    """
+    with transaction.atomic():
+        if Appointment.objects.filter(doctor=doctor, appointment_datetime=appointment_datetime, status__in=[1, 2, 4]).exists():
+            raise ValueError("این نوبت لحظاتی پیش رزرو شد.")
+
+        appointment = form.save(commit=False)
+        appointment.doctor = doctor
+        appointment.appointment_datetime = appointment_datetime
+        appointment.status = 4
+        appointment.save()
+    return appointment
+
+
+async def book_appointment(request, pk, date):
+    """
+    نمایش تمام ساعات (خالی و پر) و پردازش رزرو نوبت.
+    """
+    doctor = await aget_object_or_404(DoctorProfile.objects.select_related('user'), pk=pk)
+    try:
+        target_date = jalali.parse(date)
+    except ValueError:
+        return redirect('booking:doctor_detail', pk=doctor.pk)
+
+    availabilities, all_slots = await sync_to_async(schedule.day_slots)(doctor, target_date)
+
+    if not availabilities:
+        return redirect('booking:doctor_detail', pk=doctor.pk)
+
+    if request.method == 'POST':
+        form = AppointmentBookingForm(request.POST)
+        selected_slot_str = request.POST.get('selected_slot')
+
+        if await sync_to_async(form.is_valid)() and selected_slot_str:
+            appointment_datetime = datetime.datetime.fromisoformat(selected_slot_str)
+
+            try:
+                appointment = await sync_to_async(_create_pending_appointment)(doctor, form, appointment_datetime)
+            except ValueError as e:
+                telemetry.bookings.inc(outcome='conflict')
+                error_message = str(e)
+                context = {
+                    'doctor': doctor, 'date': target_date, 'all_slots': all_slots,
+                    'form': form, 'page_title': 'خطا در رزرو نوبت', 'error': error_message
+                }
+                return await arender(request, 'booking/book_appointment.html', context)
+            except OperationalError as e:
+                telemetry.bookings.inc(outcome='error')
+                logger.exception('Booking for doctor %s could not be saved', doctor.pk)
+                error_message = "سیستم در حال حاضر قادر به پردازش رزرو شما نیست. لطفاً بعداً دوباره تلاش کنید."
+                if "attempt to write a readonly database" in str(e):
+                    error_message = "مشکل فنی: پایگاه داده در حالت فقط-خواندنی قرار دارد و امکان ثبت نوبت جدید وجود ندارد. لطفاً به پشتیبانی اطلاع دهید."
+
+                context = {
+                    'doctor': doctor, 'date': target_date, 'all_slots': all_slots,
+                    'form': form, 'page_title': 'خطای سیستمی', 'error': error_message
+                }
+                return await arender(request, 'booking/book_appointment.html', context)
+
+            telemetry.bookings.inc(outcome='pending')
+            logger.info('Appointment %s held for payment', appointment.id, extra={'doctor_id': doctor.pk})
+
+            # --- OTP & SMS Sending Logic ---
+            # Sent after the transaction commits so the slot is not held locked while waiting on the SMS API.
+            otp_code = str(random.randint(100000, 999999))
+            await request.session.aset('otp_code', otp_code)
+            await request.session.aset('pending_appointment_id', appointment.id)
+            try:
+                await gateways.asend_sms(appointment.patient_phone, 4018, otp_code)
+            except gateways.SMSError as e:
+                sms_logger.error('Booking OTP for appointment %s could not be sent: %s', appointment.id, e)
+            return redirect('booking:verify_appointment')
+    else:
+        form = AppointmentBookingForm()
+
+    context = {
+        'doctor': doctor, 'date': target_date, 'all_slots': all_slots,
+        'form': form
+    }
+    return await arender(request, 'booking/book_appointment.html', context)
+
+
+User = get_user_model()
+
+
+def verify_appointment(request):
+    """
+تایید شماره همراه با کد یک‌بار مصرف  session.
+    """
+    pending_appointment_id = request.session.get('pending_appointment_id')
+    if not pending_appointment_id:
+        return redirect('booking:doctor_list') # اگر نوبتی در حال رزرو نباشد
+
+    appointment = get_object_or_404(Appointment, pk=pending_appointment_id)
+
+    if request.method == 'POST':
+        otp_from_user = request.POST.get('otp')
+        otp_from_session = request.session.get('otp_code')
+
+        if otp_from_user == otp_from_session:
+            # Find or create a patient user with the phone number
+            patient_user, created = User.objects.get_or_create(
+                username=appointment.patient_phone,
+                defaults={
+                    'first_name': appointment.patient_name,
+                    'user_type': 'PATIENT'
+                }
+            )
+            # Assign the patient to the appointment
+            appointment.patient = patient_user
+            appointment.save()
+
+            # Store the phone number for the payment page to pick up
+            request.session['verified_patient_phone'] = appointment.patient_phone
+
+            return redirect('booking:payment_page')
+        else:
+            # کد اشتباه است
+            return render(request, 'booking/verify_appointment.html', {'error': 'کد وارد شده صحیح نمی‌باشد.'})
+
+    return render(request, 'booking/verify_appointment.html', {'page_title': 'تأیید نوبت'})
+
+
+@login_required(login_url='booking:patient_login')
+def join_waitlist(request, pk):
+    """
+    ثبت بیمار در لیست انتظار پزشک؛ با آزاد شدن نوبتی در بازه‌ی انتخابی، پیامک پیشنهاد نوبت ارسال می‌شود.
+    """
+    doctor = get_object_or_404(DoctorProfile.objects.select_related('user'), pk=pk)
+    if request.user.user_type != 'PATIENT':
+        return redirect('booking:doctor_detail', pk=doctor.pk)
+
+    if request.method == 'POST':
+        form = WaitlistForm(request.POST)
+        if form.is_valid():
+            entry = form.save(commit=False)
+            entry.doctor = doctor
+            entry.patient = request.user
+            entry.patient_name = request.user.get_full_name() or request.user.username
+            # Patients sign in with their mobile number.
+            entry.patient_phone = request.user.username
+            entry.save()
+            messages.success(request, 'شما در لیست انتظار ثبت شدید؛ با آزاد شدن نوبت پیامک دریافت می‌کنید.')
+            return redirect('booking:doctor_detail', pk=doctor.pk)
+    else:
+        form = WaitlistForm()
+
+    return render(request, 'booking/join_waitlist.html', {
+        'doctor': doctor, 'form': form, 'page_title': 'لیست انتظار',
+    })
+
+
+def waitlist_offer(request, token):
+    """
+    پذیرش نوبت پیشنهادی لیست انتظار از لینک پیامک و انتقال به صفحه‌ی پرداخت.
+    """
+    entry = waitlist.offer_from_token(token)
+    if entry is None:
+        messages.error(request, 'مهلت این پیشنهاد به پایان رسیده یا لینک نامعتبر است.')
+        return redirect('booking:doctor_list')
+    # The link reached the patient's phone, which stands in for the OTP of a booking.
+    request.session['pending_appointment_id'] = entry.appointment_id
+    request.session['verified_patient_phone'] = entry.patient_phone
+    return redirect('booking:payment_page')
+
+
+@login_required
+def patient_dashboard(request):
+    """
+    Displays the patient's dashboard with their appointments.
+    Allows patients to cancel their future appointments.
+    """
+    if request.user.user_type != 'PATIENT':
+        return redirect('booking:doctor_list')
+    appointments = []
+    review_form = ReviewForm()  # Initialize the form
+
+    if hasattr(request.user, 'user_type') and request.user.user_type == 'PATIENT':
+        if request.method == 'POST':
+            if 'appointment_id' in request.POST and 'rating' not in request.POST:
+                appointment_id = request.POST.get('appointment_id')
+                appointment_to_cancel = get_object_or_404(Appointment, pk=appointment_id, patient=request.user)
+                if appointment_to_cancel.appointment_datetime.date() >= datetime.date.today():
+                    appointment_to_cancel.status = 3
+                    appointment_to_cancel.save()
+                    messages.success(request, 'نوبت شما با موفقیت لغو شد.')
+                else:
+                    messages.error(request, 'شما نمی‌توانید نوبت‌های گذشته را لغو کنید.')
+                return redirect('booking:patient_dashboard')
+
+            elif 'appointment_id_review' in request.POST:
+                review_form = ReviewForm(request.POST)  # Populate with POST data
+                if review_form.is_valid():
+                    appointment_id = request.POST.get('appointment_id_review')
+                    appointment = get_object_or_404(Appointment, pk=appointment_id, patient=request.user)
+                    review = review_form.save(commit=False)
+                    review.appointment = appointment
+                    review.save()
+                    messages.success(request, 'نظر شما با موفقیت ثبت شد.')
+                    return redirect('booking:patient_dashboard')
+                # If form is invalid, execution continues and renders the page
+                # with the populated, invalid form instance.
+
+        appointments = Appointment.objects.filter(patient=request.user).select_related('doctor__user', 'doctor__specialty', 'review').order_by('-appointment_datetime')
+
+    verified_phone = request.session.pop('verified_patient_phone', None)
+
+    context = {
+        'appointments': appointments,
+        'page_title': 'نوبت‌های من',
+        'today': datetime.date.today(),
+        'verified_phone': verified_phone,
+        'review_form': review_form, # This now contains the invalid form if submission failed
+    }
+    return render(request, 'booking/patient_dashboard.html', context)
@@ -0,0 +1,346 @@
+"""
+The doctor's dashboard, weekly availability, day management, profile and expenses.
+"""
+import datetime
+
+from django.contrib import messages
+from django.contrib.auth import get_user_model
+from django.contrib.auth.decorators import login_required
+from django.db import transaction
+from django.shortcuts import get_object_or_404, redirect, render
+from django.urls import reverse
+from django.utils import timezone
+
+from .. import jalali, schedule
+from ..decorators import doctor_required
+from ..forms import DoctorAvailabilityForm, AppointmentBookingForm, ScheduleOverrideForm, DailyExpenseForm, UserUpdateForm, DoctorProfileUpdateForm
+from ..models import DoctorAvailability, TimeSlotException, ScheduleClosure, ScheduleOverride, DailyExpense
+
+User = get_user_model()
+
+
+@login_required
+def doctor_dashboard(request):
+    """
+    داشبورد پزشک برای مدیریت زمان‌بندی کاری.
+    """
+    if request.clinic.is_secretary:
+        return redirect('booking:daily_patients')
+    doctor_profile = request.clinic.fresh_doctor() if request.method == 'POST' else request.clinic.doctor
+    if not request.clinic.is_doctor or not doctor_profile:
+        return redirect('booking:doctor_list')
+
+    if request.method == 'POST':
+        form = DoctorAvailabilityForm(request.POST)
+        if form.is_valid():
+            availability = form.save(commit=False)
+            availability.doctor = doctor_profile
+            availability.save()
+            return redirect('booking:doctor_dashboard')
+    else:
+        form = DoctorAvailabilityForm()
+
+    availabilities = DoctorAvailability.objects.filter(doctor=doctor_profile).order_by('day_of_week', 'start_time')
+
+    context = {
+        'form': form,
+        'availabilities': availabilities,
+        'page_title': 'داشبورد مدیریت زمان‌بندی'
+    }
+    return render(request, 'booking/doctor_dashboard.html', context)
+
+
+@login_required
+@doctor_required
+def edit_availability(request, pk):
+    availability = get_object_or_404(DoctorAvailability, pk=pk, doctor=request.clinic.doctor)
+    if request.method == 'POST':
+        form = DoctorAvailabilityForm(request.POST, instance=availability)
+        if form.is_valid():
+            form.save()
+            return redirect('booking:doctor_oard')
+    else:
+        form = DoctorAvailabilityForm(instance=availability)
+
+    context = {
+        'form': form,
+        'page_title': 'ویرایش برنامه کاری'
+    }
+    return render(request, 'booking/edit_availability.html', context)
+
+
+@login_required
+def delete_availability(request, pk):
+    availability = get_object_or_404(DoctorAvailability, pk=pk, doctor=request.clinic.doctor)
+    if request.method == 'POST':
+        availability.delete()
+        return redirect('booking:doctor_dashboard')
+
+    context = {
+        'availability': availability,
+        'page_title': 'تایید حذف برنامه کاری'
+    }
+    return render(request, 'booking/delete_availability.html', context)
+
+
+@login_required
+def toggle_availability(request, pk):
+    availability = get_object_or_404(DoctorAvailability, pk=pk, doctor=request.clinic.doctor)
+    availability.is_active = not availability.is_active
+    availability.save()
+    return redirect('booking:doctor_dashboard')
+
+
+def _closure_period(data, target_date, shifts):
+    """
+    The ``(start, end)`` datetimes a close/open action of manage_day applies to:
+    one shift of the day, the whole day, or a range of Jalali dates.
+    Returns None if the submitted scope is invalid.
+    """
+    scope = data.get('scope')
+    if scope == 'shift':
+        for shift in shifts:
+            if shift.shift == data.get('shift'):
+                return (
+                    timezone.make_aware(datetime.datetime.combine(target_date, shift.start_time)),
+                    timezone.make_aware(datetime.datetime.combine(target_date, shift.end_time)),
+                )
+        return None
+    if scope == 'day':
+        return schedule.day_start(target_date), schedule.day_start(target_date + datetime.timedelta(days=1))
+    if scope == 'range':
+        try:
+            first = jalali.parse(data.get('start_date', '').strip())
+            last = jalali.parse(data.get('end_date', '').strip())
+        except ValueError:
+            return None
+        if last < first:
+            return None
+        return schedule.day_start(first), schedule.day_start(last + datetime.timedelta(days=1))
+    return None
+
+
+@login_required
+def manage_day(request, date):
+    """
+    صفحه مدیریت روزانه برای منشی، شامل ثبت نوبت، مسدود کردن و فعال‌سازی نوبت‌ها.
+    """
+    doctor_profile = request.clinic.fresh_doctor() if request.method == 'POST' else request.clinic.doctor
+    if not doctor_profile:
+        return redirect('booking:doctor_list')
+
+    try:
+        # The date comes from the URL in Jalali format, with '-' or '/' separators.
+        target_date = jalali.parse(date)
+    except ValueError:
+        return redirect('booking:secretary_panel')
+
+    persian_weekday = jalali.DAY_NAMES[jalali.from_gregorian(target_date).weekday]
+
+    # --- Logic to calculate and display all time slots ---
+    shifts, all_slots = schedule.day_slots(doctor_profile, target_date, include_added=True)
+
+    # Handle POST requests for booking, blocking, or unblocking slots
+    if request.method == 'POST':
+        action = request.POST.get('action')
+        slot_iso = request.POST.get('selected_slot')
+
+        if action in ('close', 'open'):
+            # Close or re-open a whole shift, the day or a date range in one go.
+            period = _closure_period(request.POST, target_date, shifts)
+            if period is None:
+                messages.error(request, 'بازه انتخاب شده نامعتبر است.')
+            elif action == 'close':
+                schedule.close_period(doctor_profile, *period, reason=request.POST.get('reason', '').strip())
+                messages.success(request, 'نوبت‌های بازه انتخاب شده مسدود شد.')
+            else:
+                schedule.open_period(doctor_profile, *period)
+                messages.success(request, 'نوبت‌های بازه انتخاب شده فعال شد.')
+            return redirect('booking:manage_day', date=date)
+
+        if action == 'override':
+            # Change a shift's hours or visit count for this date only.
+            instance = ScheduleOverride.objects.filter(
+                doctor=doctor_profile, date=target_date, shift=request.POST.get('shift'),
+            ).first()
+            override_form = ScheduleOverrideForm(request.POST, instance=instance)
+            if override_form.is_valid():
+                override = override_form.save(commit=False)
+                override.doctor = doctor_profile
+                override.date = target_date
+                override.save()
+                messages.success(request, 'برنامه کاری این روز به‌روزرسانی شد.')
+                return redirect('booking:manage_day', date=date)
+
+        elif action == 'clear_override':
+            for override in ScheduleOverride.objects.filter(
+                doctor=doctor_profile, date=target_date, shift=request.POST.get('shift'),
+            ):
+                override.delete()
+            messages.success(request, 'برنامه هفتگی برای این شیفت برگردانده شد.')
+            return redirect('booking:manage_day', date=date)
+
+        if action and slot_iso:
+            slot_datetime = datetime.datetime.fromisoformat(slot_iso)
+
+            if action == 'block':
+                TimeSlotException.objects.get_or_create(
+                    doctor=doctor_profile,
+                    datetime_slot=slot_datetime
+                )
+                return redirect('booking:manage_day', date=date)
+
+            elif action == 'unblock':
+                TimeSlotException.objects.filter(
+                    doctor=doctor_profile,
+                    datetime_slot=slot_datetime
+                ).delete()
+                return redirect('booking:manage_day', date=date)
+
+            elif action == 'book':
+                form = AppointmentBookingForm(request.POST)
+                if form.is_valid():
+                    with transaction.atomic():
+                        # Find or create a patient user
+                        patient_user, created = User.objects.get_or_create(
+                            username=form.cleaned_data['patient_phone'],
+                            defaults={
+                                'first_name': form.cleaned_data['patient_name'],
+                                'user_type': 'PATIENT'
+                            }
+                        )
+                        # Create the appointment
+                        appointment = form.save(commit=False)
+                        appointment.doctor = doctor_profile
+                        appointment.patient = patient_user
+                        appointment.appointment_datetime = slot_datetime
+                        appointment.status = 1
+                        appointment.save()
+                        return redirect('booking:manage_day', date=date)
+                # If form is invalid, we will fall through and re-render the page with errors
+
+        elif action == 'add_slot':
+            last_slot_time = datetime.time(8, 50) # Default start time if no slots exist
+            if all_slots:
+                last_slot_time = max(s['time'] for s in all_slots).time()
+
+            new_slot_datetime_naive = datetime.datetime.combine(target_date, last_slot_time) + datetime.timedelta(minutes=10)
+            new_slot_datetime_aware = timezone.make_aware(new_slot_datetime_naive)
+
+            TimeSlotException.objects.create(
+                doctor=doctor_profile,
+                datetime_slot=new_slot_datetime_aware,
+                is_cancellation=False # This is an addition, not a cancellation
+            )
+            return redirect('booking:manage_day', date=date)
+
+    # If the request was a failed POST for booking, use that form, otherwise create a new one
+    if request.method == 'POST' and 'form' in locals():
+        booking_form = form
+    else:
+        booking_form = AppointmentBookingForm()
+
+    start_of_day = schedule.day_start(target_date)
+    closures = ScheduleClosure.objects.filter(
+        doctor=doctor_profile, start__lt=start_of_day + datetime.timedelta(days=1), end__gt=start_of_day,
+    )
+
+    context = {
+        'doctor': doctor_profile,
+        'date': target_date,
+        'jalali_date_str': date,
+        'all_slots': all_slots,
+        'shifts': shifts,
+        'closures': closures,
+        'overrides': ScheduleOverride.objects.filter(doctor=doctor_profile, date=target_date),
+        'form': booking_form,
+        'override_form': override_form if 'override_form' in locals() else ScheduleOverrideForm(),
+        'has_availability': bool(shifts),
+        'page_title': f'مدیریت نوبت‌های روز {persian_weekday} {jalali.format_date(target_date)}'    
+    }
+    return render(request, 'booking/manage_day.html', context)
+
+
+@login_required
+@doctor_required
+def edit_profile(request):
+    # Not the cached profile: the form is filled from it and saves every field.
+    doctor_profile = request.clinic.fresh_doctor()
+
+    if request.method == 'POST':
+        user_form = UserUpdateForm(request.POST, instance=request.user)
+        profile_form = DoctorProfileUpdateForm(request.POST, request.FILES, instance=doctor_profile)
+
+        if user_form.is_valid() and profile_form.is_valid():
+            user_form.save()
+            profile_form.save()
+            return redirect('booking:edit_profile') # Redirect back to the same page to show success
+    else:
+        user_form = UserUpdateForm(instance=request.user)
+        profile_form = DoctorProfileUpdateForm(instance=doctor_profile)
+
+    context = {
+        'user_form': user_form,
+        'profile_form': profile_form,
+        'page_title': 'ویرایش پروفایل'
+    }
+    return render(request, 'booking/edit_profile.html', context)
+
+
+@login_required
+def edit_expense(request, pk):
+    """
+    ویرایش یک هزینه یا پرداخت ثبت شده.
+    """
+    doctor_profile = request.clinic.fresh_doctor() if request.method == 'POST' else request.clinic.doctor
+    if not doctor_profile:
+        return redirect('booking:doctor_list')
+
+    expense = get_object_or_404(DailyExpense, pk=pk, doctor=doctor_profile)
+
+    if request.user.user_type == 'SECRETARY' and expense.date < datetime.date.today():
+        return redirect('booking:secretary_payments')
+
+    if request.method == 'POST':
+        form = DailyExpenseForm(request.POST, instance=expense)
+        if form.is_valid():
+            form.save()
+            # Redirect to the secretary_payments page for the date of the expense
+            return redirect(reverse('booking:secretary_payments', kwargs={'date': expense.date.strftime('%Y-%m-%d')}))
+    else:
+        form = DailyExpenseForm(instance=expense)
+
+    context = {
+        'form': form,
+        'page_title': 'ویرایش هزینه/پرداخت',
+        'expense_date': expense.date
+    }
+    return render(request, 'booking/edit_expense.html', context)
+
+
+@login_required
+def delete_expense(request, pk):
+    """
+    حذف یک هزینه یا پرداخت ثبت شده.
+    """
+    doctor_profile = request.clinic.fresh_doctor() if request.method == 'POST' else request.clinic.doctor
+    if not doctor_profile:
+        return redirect('booking:doctor_list')
+
+    expense = get_object_or_404(DailyExpense, pk=pk, doctor=doctor_profile)
+
+    if request.user.user_type == 'SECRETARY' and expense.date < datetime.date.today():
+        return redirect('booking:secretary_payments')
+
+    expense_date_str = expense.date.strftime('%Y-%m-%d')
+
+    if request.method == 'POST':
+        expense.delete()
+        return redirect(reverse('booking:secretary_payments', kwargs={'date': expense_date_str}))
+
+    context = {
+        'expense': expense,
+        'page_title': 'تایید حذف',
+        'cancel_url': reverse('booking:secretary_payments', kwargs={'date': expense_date_str})
+    }
+    return render(request, 'booking/delete_expense_confirm.html', context)
@@ -0,0 +1,168 @@
+"""
+Excel exports for doctors, and the import of their records from Excel or
+CSV. openpyxl takes longer to import than the rest of the views together,
+so it is imported by the export that needs it (and by booking.importer).
+"""
+import datetime
+
+from django.contrib.auth.decorators import login_required
+from django.db.models import Avg, Count, Sum
+from django.http import HttpResponse
+from django.shortcuts import redirect, render
+
+from .. import importer, jalali
+from ..decorators import report
+from ..forms import ImportForm
+from ..models import Appointment, DailyExpense
+
+
+@login_required
+@report('export_patients')
+def export_patients_to_excel(request):
+    """
+    Export patient list to Excel.
+    """
+    if not request.user.user_type == 'DOCTOR':
+        return redirect('booking:doctor_list')
+
+    doctor_profile = request.clinic.doctor
+    queryset = Appointment.objects.filter(
+        doctor=doctor_profile, status=1
+    ).order_by('-appointment_datetime')
+
+    response = HttpResponse(
+        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    )
+    response['Content-Disposition'] = 'attachment; filename=patients.xlsx'
+
+    import openpyxl
+
+    workbook = openpyxl.Workbook()
+    worksheet = workbook.active
+    worksheet.title = 'Patients'
+
+    columns = [
+        'نام بیمار',
+        'کد ملی',
+        'شماره همراه',
+        'نوع بیمه',
+        'زمان نوبت',
+        'شرح خدمات',
+    ]
+    row_num = 1
+
+    for col_num, column_title in enumerate(columns, 1):
+        cell = worksheet.cell(row=row_num, column=col_num)
+        cell.value = column_title
+
+    for appointment in queryset:
+        row_num += 1
+        row = [
+            appointment.patient_name,
+            appointment.patient_national_id,
+            appointment.patient_phone,
+            appointment.get_insurance_type_display(),
+            appointment.appointment_datetime.strftime('%Y-%m-%d %H:%M'),
+            appointment.service_description,
+        ]
+        for col_num, cell_value in enumerate(row, 1):
+            cell = worksheet.cell(row=row_num, column=col_num)
+            cell.value = cell_value
+
+    workbook.save(response)
+    return response
+
+
+@login_required
+@report('export_expenses')
+def export_expenses_to_excel(request):
+    """
+    Export expense balance report to Excel.
+    """
+    if not request.user.user_type == 'DOCTOR':
+        return redirect('booking:doctor_list')
+
+    doctor_profile = request.clinic.doctor
+    end_date = datetime.date.today()
+    start_date = jalali.year_start(end_date)
+
+    expenses = DailyExpense.objects.filter(
+        doctor=doctor_profile,
+        date__range=[start_date, end_date],
+        amount__gt=0
+    ).values('description').annotate(
+        count=Count('id'),
+        total_amount=Sum('amount'),
+        average_amount=Avg('amount')
+    ).order_by('-total_amount')
+
+    response = HttpResponse(
+        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    )
+    response['Content-Disposition'] = 'attachment; filename=expenses.xlsx'
+
+    import openpyxl
+
+    workbook = openpyxl.Workbook()
+    worksheet = workbook.active
+    worksheet.title = 'Expenses'
+
+    columns = [
+        'شرح',
+        'تعداد',
+        'مجموع',
+        'میانگین',
+    ]
+    row_num = 1
+
+    for col_num, column_title in enumerate(columns, 1):
+        cell = worksheet.cell(row=row_num, column=col_num)
+        cell.value = column_title
+
+    for expense in expenses:
+        row_num += 1
+        row = [
+            expense['description'],
+            expense['count'],
+            expense['total_amount'],
+            expense['average_amount'],
+        ]
+        for col_num, cell_value in enumerate(row, 1):
+            cell = worksheet.cell(row=row_num, column=col_num)
+            cell.value = cell_value
+
+    workbook.save(response)
+    return response
+
+
+@login_required
+@report('import_records')
+def import_records(request):
+    """
+    ورود نوبت‌ها و هزینه‌های گذشته از فایل اکسل یا CSV (نگاه کنید به booking.importer).
+    """
+    doctor_profile = request.clinic.doctor
+    if not doctor_profile:
+        return redirect('booking:doctor_list')
+
+    result = None
+    if request.method == 'POST':
+        form = ImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            upload = form.cleaned_data['file']
+            try:
+                result = importer.import_rows(
+                    form.cleaned_data['kind'], doctor_profile, importer.read_rows(upload, upload.name),
+                    dry_run=form.cleaned_data['dry_run'],
+                )
+            except importer.ImportFileError as e:
+                form.add_error('file', str(e))
+    else:
+        form = ImportForm(initial={'kind': request.GET.get('kind', 'appointments'), 'dry_run': True})
+
+    context = {
+        'form': form,
+        'result': result,
+        'page_title': 'ورود اطلاعات از اکسل',
+    }
+    return render(request, 'booking/import_records.html', context)
@@ -0,0 +1,42 @@
+"""
+Tools for staff and monitoring: request profiles and metrics.
+"""
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import FileResponse, Http404, HttpResponse
+from django.shortcuts import render
+from django.views.decorators.cache import never_cache
+
+from .. import profiling, telemetry
+
+
+@staff_member_required
+def profile_list(request):
+    """
+    Lists the stored request profiles (see booking.profiling) for download.
+    """
+    context = {
+        'profiles': profiling.list_profiles(),
+        'parameter': profiling.PARAMETER,
+        'page_title': 'پروفایل درخواست‌ها',
+    }
+    return render(request, 'booking/profile_list.html', context)
+
+
+@staff_member_required
+def profile_download(request, filename):
+    path = profiling.profile_path(filename)
+    if path is None:
+        raise Http404("Profile not found")
+    return FileResponse(path.open('rb'), as_attachment=True, filename=path.name)
+
+
+@never_cache
+def metrics(request):
+    """
+    Booking, payment, SMS and report metrics of this process in the
+    Prometheus text format, for scrapers on METRICS_ALLOWED_IPS.
+    """
+    if request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS:
+        raise Http404()
+    return HttpResponse(telemetry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,364 @@
+"""
+Paying for an appointment through the Beh Pardakht (Mellat) gateway.
+"""
+import datetime
+import logging
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import messages
+from django.contrib.auth import alogin
+from django.db import transaction
+from django.shortcuts import aget_object_or_404, get_object_or_404, redirect, render
+from django.urls import reverse
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+
+from .. import gateways, jalali, schedule, telemetry
+from ..models import Appointment
+from .base import arender
+
+payment_logger = logging.getLogger('booking.payment')
+sms_logger = logging.getLogger('booking.sms')
+
+
+MELLAT_BANK_ERRORS = {
+    '0': 'تراکنش با موفقیت انجام شد',
+    '11': 'شماره کارت نامعتبر است',
+    '12': 'موجودی کافی نیست',
+    '13': 'رمز نادرست است',
+    '14': 'تعداد دفعات وارد کردن رمز بیش از حد مجاز است',
+    '15': 'کارت نامعتبر است',
+    '16': 'دفعات برداشت وجه بیش از حد مجاز است',
+    '17': 'کاربر از انجام تراکنش منصرف شده است',
+    '18': 'تاریخ انقضای کارت گذشته است',
+    '19': 'مبلغ برداشت وجه بیش از حد مجاز است',
+    '21': 'پذیرنده نامعتبر است',
+    '23': 'خطای امنیتی رخ داده است',
+    '24': 'اطلاعات کاربری پذیرنده نامعتبر است',
+    '25': 'مبلغ نامعتبر است',
+    '31': 'پاسخ نامعتبر است',
+    '32': 'فرمت اطلاعات وارد شده صحیح نمی باشد',
+    '33': 'حساب نامعتبر است',
+    '34': 'خطای سیستمی',
+    '35': 'تاریخ نامعتبر است',
+    '41': 'شماره درخواست تکراری است',
+    '42': 'تراکنش Sale یافت نشد',
+    '43': 'قبلا درخواست Verify داده شده است',
+    '44': 'درخواست Verfiy یافت نشد',
+    '45': 'تراکنش Settle (تسویه) شده است',
+    '46': 'تراکنش Settle (تسویه)نشده است',
+    '47': 'تراکنش Settle یافت نشد',
+    '48': 'تراکنش Reverse شده است',
+    '49': 'تراکنش Refund یافت نشد',
+    '51': 'تراکنش تکراری است',
+    '54': 'تراکنش مرجع موجود نیست',
+    '55': 'تراکنش نامعتبر است',
+    '61': 'خطا در واریز',
+    '111': 'صادر کننده کارت نامعتبر است',
+    '112': 'خطای سوییچ صادر کننده کارت',
+    '113': 'پاسخی از صادر کننده کارت دریافت نشد',
+    '114': 'دارنده کارت مجاز به انجام این تراکنش نیست',
+    '412': 'شناسه قبض نادرست است',
+    '413': 'شناسه پرداخت نادرست است',
+    '414': 'سازمان صادر کننده قبض نامعتبر است',
+    '415': 'زمان جلسه کاری به پایان رسیده است',
+    '416': 'خطا در ثبت اطلاعات',
+    '417': 'شناسه پرداخت کننده نامعتبر است',
+    '418': 'اشکال در تعریف اطلاعات مشتری',
+    '419': 'تعداد دفعات ورود اطلاعات از حد مجاز گذشته است',
+    '421': 'IP نامعتبر است',
+}
+
+
+async def _gateway_call(client, operation, **params):
+    """
+    Calls a Beh Pardakht operation, counting and logging its result code.
+    The result is returned as a string.
+    """
+    with telemetry.payment_seconds.time(operation=operation):
+        try:
+            result = str(await getattr(client.service, operation)(**params))
+        except Exception:
+            telemetry.payments.inc(operation=operation, result='exception')
+            payment_logger.exception('%s failed', operation, extra={'order_id': params.get('orderId')})
+            raise
+    code = result.split(',')[0]
+    telemetry.payments.inc(operation=operation, result=code)
+    payment_logger.log(
+        logging.INFO if code == '0' else logging.WARNING, '%s returned %s', operation, code,
+        extra={'order_id': params.get('orderId')},
+    )
+    return result
+
+
+async def payment_page(request):
+    """
+    Initiates a payment request with the Beh Pardakht gateway.
+    """
+    pending_appointment_id = await request.session.aget('pending_appointment_id')
+    if not pending_appointment_id:
+        return redirect('booking:doctor_list')
+
+    # 🟢 خطوط ۱۸-۲۲: تبدیل امن شناسه سفارش به عدد صحیح
+    try:
+        order_id_int = int(pending_appointment_id)
+    except (ValueError, TypeError):
+        error_message = "خطا: شناسه سفارش برای ارسال به بانک نامعتبر است."
+        return await arender(request, 'booking/payment_page.html', {'error_message': error_message})
+
+    appointment = await aget_object_or_404(Appointment.objects.select_related('doctor__user'), pk=order_id_int) # استفاده از order_id_int
+    if appointment.status != 4:
+        # Paid already, or the hold ran out (expire_holds) and the slot may have gone to someone else.
+        error_message = "مهلت پرداخت این نوبت به پایان رسیده است. لطفاً دوباره نوبت بگیرید."
+        return await arender(request, 'booking/payment_page.html', {'appointment': appointment, 'error_message': error_message})
+    
+    verified_phone = await request.session.apop('verified_patient_phone', None)
+
+    # Generate a unique order ID for this specific payment attempt
+    unique_order_id = int(f"{appointment.id}{int(time.time())}")
+    appointment.payment_order_id = unique_order_id
+    # The hold runs from here: the patient may spend a while at the bank.
+    appointment.payment_started_at = timezone.now()
+    await appointment.asave(update_fields=['payment_order_id', 'payment_started_at'])
+
+    terminal_id = settings.BEH_PARDAKHT_TERMINAL_ID
+    user_name = settings.BEH_PARDAKHT_USERNAME
+    user_password = settings.BEH_PARDAKHT_PASSWORD
+    order_id = unique_order_id # ⬅️ استفاده از متغیر ایمن شده
+    # The online booking fee; the visit itself is paid at the clinic at the insurance fee.
+    amount = int(appointment.doctor.visit_fee)
+    local_date = datetime.datetime.now().strftime('%Y%m%d')
+    local_time = datetime.datetime.now().strftime('%H%M%S')
+    additional_data = f'Appointment for {appointment.patient_name}'
+    callback_url = request.build_absolute_uri(reverse('booking:verify_payment'))
+    if settings.BEH_PARDAKHT_FORCE_HTTPS_CALLBACK:
+        callback_url = callback_url.replace("http://", "https://")
+    payer_id = 0
+    
+    try:
+        async with gateways.http_client() as http:
+            client = await gateways.get_payment_client(http)
+            result = await _gateway_call(
+                client, 'bpPayRequest',
+                terminalId=terminal_id,
+                userName=user_name,
+                userPassword=user_password,
+                orderId=order_id,
+                amount=amount,
+                localDate=local_date,
+                localTime=local_time,
+                additionalData=additional_data,
+                callBackUrl=callback_url,
+                payerId=payer_id
+            )
+        
+        # ⭐️ خطوط ۴۰-۵۸: اصلاح حیاتی برای مدیریت خطای unpack
+        if ',' in result:
+            res_code, ref_id = result.split(',')
+            if res_code == '0' and ref_id:
+                context = {
+                    'ref_id': ref_id,
+                    'post_url': settings.BEH_PARDAKHT_START_PAY_URL,
+                    'appointment': appointment,
+                    'payment_amount': amount,
+                    'page_title': 'صفحه پرداخت',
+                    'error_message': None,
+                    'verified_phone': verified_phone
+                }
+                return await arender(request, 'booking/payment_page.html', context)
+            else:
+                error_message = MELLAT_BANK_ERRORS.get(res_code, f"خطای نامشخص از بانک: {res_code}")
+        else:
+            # پاسخ فقط کد خطا است
+            res_code = result
+            error_message = MELLAT_BANK_ERRORS.get(res_code, f"خطای نامشخص از بانک: {res_code}")
+            
+    except Exception as e:
+        error_message = f"خطا در برقراری ارتباط با درگاه پرداخت: {e}"
+
+    context = {
+        'appointment': appointment,
+        'payment_amount': amount,
+        'page_title': 'صفحه پرداخت',
+        'error_message': error_message
+    }
+    return await arender(request, 'booking/payment_page.html', context)
+
+
+def _claim_paid_appointment(order_id):
+    """
+    Reserves the appointment of a verified payment, unless it is no longer
+    on hold (``expire_holds`` cancelled it) or another booking holds its
+    slot. Returns its id, or None if the payment must be reversed.
+    """
+    with transaction.atomic():
+        appointment = Appointment.objects.select_for_update().filter(payment_order_id=order_id).first()
+        if appointment is None or appointment.status != 4:
+            return None
+        if Appointment.objects.filter(
+            doctor_id=appointment.doctor_id, appointment_datetime=appointment.appointment_datetime,
+            status__in=schedule.BOOKED_STATUSES,
+        ).exclude(pk=appointment.pk).exists():
+            return None
+        appointment.status = 1
+        appointment.save(update_fields=['status'])
+        return appointment.pk
+
+
+def _unclaim(appointment_id):
+    """Puts an appointment reserved by ``_claim_paid_appointment`` back on hold."""
+    with transaction.atomic():
+        appointment = Appointment.objects.select_for_update().get(pk=appointment_id)
+        appointment.status = 4
+        appointment.save(update_fields=['status'])
+
+
+async def _reverse(client, params):
+    """Reverses a verified payment; returns the sentence telling the patient how it went."""
+    reversal_result = await _gateway_call(client, 'bpReversalRequest', **params)
+    if reversal_result == '0':
+        return " (مبلغ با موفقیت به حساب شما بازگردانده شد)."
+    return f" (خطا در بازگشت وجه: {MELLAT_BANK_ERRORS.get(reversal_result, reversal_result)})."
+
+
+@csrf_exempt
+async def verify_payment(request):
+    res_code = request.POST.get('ResCode')
+    # 🟢 خطوط ۷-۸: تغییر نام متغیرهای دریافتی برای تمایز با نسخه عددی
+    sale_order_id_str = request.POST.get('SaleOrderId') or request.POST.get('saleOrderId')
+    sale_reference_id_str = request.POST.get('SaleReferenceId') or request.POST.get('saleReferenceId')
+
+    payment_successful = False
+    message = ''
+
+    # 1. Check if the initial transaction was successful at the bank's end.
+    if res_code != '0':
+        message = MELLAT_BANK_ERRORS.get(res_code, f"تراکنش ناموفق بود. کد خطا: {res_code}")
+        return await arender(request, 'booking/payment_result.html', {
+            'payment_successful': False, 'message': message, 'page_title': 'نتیجه پرداخت'
+        })
+
+    # 2. If successful, proceed to verify and settle.
+    # 🟢 خطوط ۲۶-۲۹: تبدیل امن به عدد صحیح
+    try:
+        sale_order_id_int = int(sale_order_id_str)
+        sale_reference_id_int = int(sale_reference_id_str)
+    except (ValueError, TypeError):
+        message = "خطا: شناسه تراکنش نامعتبر است."
+        return await arender(request, 'booking/payment_result.html', {
+            'payment_successful': False, 'message': message, 'page_title': 'نتیجه پرداخت'
+        })
+
+    try:
+        async with gateways.http_client() as http:
+            client = await gateways.get_payment_client(http)
+
+            terminal_id = settings.BEH_PARDAKHT_TERMINAL_ID
+            user_name = settings.BEH_PARDAKHT_USERNAME
+            user_password = settings.BEH_PARDAKHT_PASSWORD
+        
+            # ⭐️ خطوط ۳۹-۴۱: استفاده از نسخه‌های عددی برای متد zeep
+            common_params = {
+                'terminalId': terminal_id, 'userName': user_name, 'userPassword': user_password,
+                'orderId': sale_order_id_int, 'saleOrderId': sale_order_id_int, 'saleReferenceId': sale_reference_id_int
+            }
+
+            verify_result = await _gateway_call(client, 'bpVerifyRequest', **common_params)
+
+            if verify_result == '0':
+                # 3. Payment is verified. Take the slot before settling: if the hold ran
+                # out while the patient was at the bank, it may be someone else's now.
+                appointment_id = await sync_to_async(_claim_paid_appointment)(sale_order_id_int)
+                if appointment_id is None:
+                    telemetry.bookings.inc(outcome='expired')
+                    payment_logger.warning('Order %s was paid after its hold ran out', sale_order_id_int)
+                    message = "مهلت پرداخت این نوبت پیش از تکمیل پرداخت به پایان رسیده و نوبت آزاد شده است"
+                    message += await _reverse(client, common_params)
+                    return await arender(request, 'booking/payment_result.html', {
+                        'payment_successful': False, 'message': message, 'page_title': 'نتیجه پرداخت'
+                    })
+                settle_result = await _gateway_call(client, 'bpSettleRequest', **common_params)
+                if settle_result == '0':
+                    # 4. All steps successful.
+                    appointment = await Appointment.objects.select_related('doctor__user', 'patient').aget(pk=appointment_id)
+                    telemetry.bookings.inc(outcome='confirmed')
+                    payment_logger.info('Appointment %s paid', appointment.id, extra={'order_id': sale_order_id_int})
+
+                    # --- Send SMS Confirmation ---
+                    try:
+                        # ✜ بخش ارسال پیامک تایید نوبت ✜
+
+                        appointment_datetime_local = jalali.localtime(appointment.appointment_datetime)
+                        formatted_time = jalali.format_date(appointment_datetime_local, '%Y/%m/%d ساعت %H:%M')
+                        bimar = appointment.patient_name
+                        dr = appointment.doctor.user.get_full_name()
+                        time = formatted_time
+                        adders = appointment.doctor.address
+                        tel = appointment.doctor.phone_number
+                        pattern_values = f"{bimar},{dr},{time},{adders},{tel}"
+                        await gateways.asend_sms(appointment.patient_phone, 4161, pattern_values, client=http)
+
+                    except gateways.SMSError as e:
+                        # حتی اگر پیامک ارسال نشود، نباید جلوی تکمیل فرآیند نوبت‌گیری را بگیرد
+                        sms_logger.error('Confirmation SMS for order %s could not be sent: %s', sale_order_id_int, e)
+                    except Exception:
+                        sms_logger.exception('Confirmation SMS for order %s failed unexpectedly', sale_order_id_int)
+
+
+                    await alogin(request, appointment.patient)
+                    await request.session.asave()
+                    messages.success(request, "پرداخت با موفقیت انجام شد و نوبت شما ثبت گردید.")
+                    return redirect('booking:patient_dashboard')
+                else:
+                    # 5. Settle failed: put the appointment back on hold and reverse the transaction.
+                    await sync_to_async(_unclaim)(appointment_id)
+                    message = f"خطا در تسویه حساب: {MELLAT_BANK_ERRORS.get(settle_result, settle_result)}"
+                    message += await _reverse(client, common_params)
+            else:
+                # 6. Verify failed, reverse the transaction.
+                message = f"خطا در تایید پرداخت: {MELLAT_BANK_ERRORS.get(verify_result, verify_result)}"
+                message += await _reverse(client, common_params)
+
+    except Exception as e:
+        message = f"خطا در ارتباط با وب سرویس به پرداخت: {e}. لطفاً با پشتیبانی تماس بگیرید."
+
+    return await arender(request, 'booking/payment_result.html', {
+        'payment_successful': payment_successful, 'message': message, 'page_title': 'نتیجه پرداخت'
+    })
+
+
+def initiate_payment(request, appointment_id):
+    """
+    شروع فرآیند پرداخت و هدایت به درگاه
+    """
+    appointment = get_object_or_404(Appointment, pk=appointment_id)
+
+    # ذخیره appointment_id در session
+    request.session['pending_appointment_id'] = appointment_id
+
+    return redirect('booking:payment_page')
+
+
+def confirm_payment(request):
+    """
+    پردازش پرداخت شبیه‌سازی شده و نهایی کردن نوبت با استفاده از session.
+    """
+    pending_appointment_id = request.session.get('pending_appointment_id')
+    if not pending_appointment_id:
+        return redirect('booking:doctor_list')
+
+    appointment = get_object_or_404(Appointment, pk=pending_appointment_id)
+
+    appointment.status = 1
+    appointment.save()
+
+    # Clear the session variable after successful booking
+    del request.session['pending_appointment_id']
+
+    context = {
+        'appointment': appointment,
+        'page_title': 'نوبت شما با موفقیت ثبت شد'
+    }
+    return render(request, 'booking/confirmation_page.html', context)
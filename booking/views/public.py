@@ -0,0 +1,141 @@
+"""
+Public pages: the doctor directory, doctor profiles and help, plus uploaded media.
+"""
+import datetime
+
+from django.conf import settings
+from django.db.models import Avg, OuterRef, Q, Subquery
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404, render
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils import timezone
+from django.views.decorators.cache import cache_control
+from django.views.static import serve
+
+from .. import jalali, schedule
+from ..decorators import public_page
+from ..models import DoctorProfile, Review, NextAvailableSlot
+from ..storage import is_content_addressed
+
+
+@public_page
+def doctor_list(request):
+    """
+    نمایش لیست تمام پزشکان با قابلیت جستجو.
+    """
+    next_slot = NextAvailableSlot.objects.filter(
+        doctor=OuterRef('pk'), slot_datetime__gte=timezone.now()
+    ).order_by('slot_datetime').values('slot_datetime')[:1]
+    queryset = DoctorProfile.objects.select_related('user', 'specialty').prefetch_related('availabilities').annotate(
+        average_rating=Avg('appointments__review__rating'),
+        next_available=Subquery(next_slot),
+    ).all()
+    query = request.GET.get('q')
+
+    if query:
+        # Split the search query into individual, non-empty words
+        search_terms = [term for term in query.split() if term]
+        for term in search_terms:
+            # For each term, filter the queryset cumulatively
+            queryset = queryset.filter(
+                Q(user__first_name__icontains=term) |
+                Q(user__last_name__icontains=term) |
+                Q(specialty__name__icontains=term) |
+                Q(address__icontains=term)
+            )
+
+    context = {
+        'doctors': queryset,
+        'page_title':'لیست پزشکان',
+        'public_page': True,
+    }
+    return render(request, 'booking/doctor_list.html', context)
+
+
+def earliest_slots(request):
+    """
+    اولین نوبت‌های آزاد همه پزشکان (یا پزشکان یک تخصص) به ترتیب زمان، به صورت JSON.
+    """
+    specialty_id = request.GET.get('specialty')
+    try:
+        specialty_id = int(specialty_id) if specialty_id else None
+        limit = min(max(int(request.GET.get('limit', 10)), 1), 50)
+    except ValueError:
+        return JsonResponse({'error': 'پارامترهای جستجو نامعتبر است.'}, status=400)
+
+    slots = []
+    for slot in schedule.earliest_slots(specialty_id=specialty_id, limit=limit):
+        local_time = timezone.localtime(slot.slot_datetime)
+        jalali_date = jalali.format_date(local_time, '%Y-%m-%d')
+        slots.append({
+            'doctor_id': slot.doctor_id,
+            'doctor_name': slot.doctor.user.get_full_name(),
+            'specialty': slot.specialty.name if slot.specialty else None,
+            'datetime': local_time.isoformat(),
+            'jalali_date': jalali_date,
+            'time': local_time.strftime('%H:%M'),
+            'booking_url': reverse('booking:book_appointment', kwargs={'pk': slot.doctor_id, 'date': jalali_date}),
+        })
+    return JsonResponse({'slots': slots})
+
+
+@public_page
+def doctor_detail(request, pk):
+    """
+    نمایش جزئیات یک پزشک خاص و تقویم نوبت‌دهی او بر اساس تاریخ شمسی.
+    """
+    doctor = get_object_or_404(DoctorProfile.objects.select_related('user', 'specialty'), pk=pk)
+    reviews = Review.objects.filter(appointment__doctor=doctor)
+    average_rating = reviews.aggregate(Avg('rating'))['rating__avg']
+
+    # محاسبه تقویم برای روزهای قابل رزرو
+    today = datetime.date.today()
+    days = schedule.day_summaries(doctor, today, today + datetime.timedelta(days=doctor.booking_days - 1))
+
+    available_days = [
+        {
+            'date': day['date'],
+            'jalali_day_name': jalali.DAY_NAMES[jalali.from_gregorian(day['date']).weekday],
+        }
+        for day in days if day['booked'] < day['capacity']
+    ]
+
+    context = {
+        'doctor': doctor,
+        'available_days': available_days,
+        'average_rating': average_rating,
+        'page_title': f'پروفایل دکتر {doctor.user.get_full_name()}',
+        'public_page': True,
+    }
+    return render(request, 'booking/doctor_detail.html', context)
+
+
+@cache_control(private=True, no_store=True)
+def session_status(request):
+    """
+    وضعیت ورود کاربر برای صفحات عمومی کش‌شده؛ منوی پزشک و منشی در مرورگر جایگزین منوی عمومی می‌شود.
+    """
+    user = request.user
+    data = {'authenticated': user.is_authenticated, 'user_type': getattr(user, 'user_type', None), 'nav': None}
+    if user.is_authenticated and user.user_type in ('DOCTOR', 'SECRETARY'):
+        data['nav'] = render_to_string('booking/_staff_nav.html', request=request)
+    return JsonResponse(data)
+
+
+def help_guide(request):
+    return render(request, 'booking/help_guide.html')
+
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+def serve_media(request, path):
+    """
+    Serves uploaded media. Files named by their content hash never change,
+    so browsers may cache them for good.
+    """
+    response = serve(request, path, document_root=settings.MEDIA_ROOT)
+    if is_content_addressed(path):
+        response['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    return response
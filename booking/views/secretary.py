@@ -0,0 +1,465 @@
+"""
+The secretary's panel, calendar, daily patient list and payments, reservations and the waiting room.
+"""
+import datetime
+from itertools import groupby
+from operator import attrgetter
+
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.contrib.auth.decorators import login_required
+from django.db.models import Q, Sum
+from django.forms import modelformset_factory
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404, redirect, render
+from django.urls import reverse
+from django.utils import timezone
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_POST
+
+from .. import events, fees, jalali, schedule
+from ..forms import AppointmentUpdateForm, DailyExpenseForm
+from ..models import Appointment, DailyExpense
+
+
+@login_required
+def secretary_panel(request, date=None):
+    """
+    پنل مدیریت منشی (داشبورد).
+    """
+    doctor_profile = request.clinic.doctor
+    if not doctor_profile:
+        return redirect('booking:doctor_list')
+
+    current_date = datetime.date.today()
+    if date:
+        try:
+            current_date = datetime.datetime.strptime(date, '%Y-%m-%d').date()
+        except ValueError:
+            pass
+
+
+    end_date = current_date + datetime.timedelta(days=45)
+
+    # Get future available days for manual booking
+    future_days_info = []
+    for day in schedule.day_summaries(doctor_profile, current_date, end_date):
+        day_info = {'date': day['date'], 'booked_percentage': 0, 'closed': day['closed']}
+        if day['capacity'] > 0:
+            day_info['booked_percentage'] = min(day['booked'] / day['capacity'] * 100, 100)
+        future_days_info.append(day_info)
+
+    context = {
+        'today': current_date,
+        'future_days': future_days_info,
+        'page_title': 'تقویم نوبت‌دهی دستی توسط منشی'
+    }
+
+    if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+        return render(request, 'booking/secretary_panel_content.html', context)
+    return render(request, 'booking/secretary_panel.html', context)
+
+
+CALENDAR_DAYS = 46
+
+
+CALENDAR_MAX_DAYS = 120
+
+
+def _calendar_window(request):
+    """The ``(start, days)`` of a calendar request; raises ``ValueError`` for bad parameters."""
+    start = request.GET.get('start')
+    start = datetime.date.fromisoformat(start) if start else datetime.date.today()
+    days = int(request.GET.get('days', CALENDAR_DAYS))
+    if not 1 <= days <= CALENDAR_MAX_DAYS:
+        raise ValueError(days)
+    return start, days
+
+
+def _calendar_etag(request):
+    doctor_profile = request.clinic.doctor
+    if not doctor_profile:
+        return None
+    try:
+        start, days = _calendar_window(request)
+    except ValueError:
+        return None
+    # schedule_version changes with every booking, block, closure or schedule
+    # edit of the doctor (see signals), so it fully determines the response.
+    return f'{doctor_profile.pk}-{request.clinic.schedule_version}-{start.isoformat()}-{days}'
+
+
+@login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=_calendar_etag)
+def secretary_calendar(request):
+    """
+    ظرفیت و تعداد نوبت‌های رزروشده هر روز کاری در یک بازه، به صورت JSON، برای تقویم پنل منشی.
+    پاسخ ETag دارد و اگر برنامه پزشک تغییری نکرده باشد 304 برمی‌گردد.
+    """
+    doctor_profile = request.clinic.doctor
+    if not doctor_profile:
+        return JsonResponse({'error': 'دسترسی غیرمجاز'}, status=403)
+    try:
+        start, days = _calendar_window(request)
+    except ValueError:
+        return JsonResponse({'error': 'پارامترهای تقویم نامعتبر است.'}, status=400)
+
+    calendar_days = []
+    for day in schedule.day_summaries(doctor_profile, start, start + datetime.timedelta(days=days - 1)):
+        jalali_date = jalali.format_date(day['date'], '%Y-%m-%d')
+        calendar_days.append({
+            'date': day['date'].isoformat(),
+            'jalali_date': jalali_date,
+            'label': jalali.format_date(day['date'], '%d %B'),
+            'weekday': jalali.format_date(day['date'], '%A'),
+            'capacity': day['capacity'],
+            'booked': day['booked'],
+            'closed': day['closed'],
+            'booked_percentage': min(day['booked'] / day['capacity'] * 100, 100) if day['capacity'] else 0,
+            'manage_url': reverse('booking:manage_day', kwargs={'date': jalali_date}),
+        })
+    return JsonResponse({
+        'start': start.isoformat(),
+        'start_display': jalali.format_date(start, '%A, %d %B %Y'),
+        'days': calendar_days,
+    })
+
+
+@login_required
+def patient_list(request):
+    """
+    نمایش لیست تمام بیماران با قابلیت جستجو.
+    """
+    doctor_profile = request.clinic.doctor
+    if not doctor_profile:
+        return redirect('booking:doctor_list')
+
+    queryset = Appointment.objects.filter(
+        doctor=doctor_profile, status__in=[1, 2,4]
+    ).order_by('-appointment_datetime')
+
+    query = request.GET.get('q')
+    if query:
+        queryset = queryset.filter(
+            Q(patient_name__icontains=query) |
+            Q(patient_national_id__icontains=query) |
+            Q(patient_phone__icontains=query) |
+            Q(service_description__icontains=query)
+        )
+
+    context = {
+        'appointments': queryset,
+        'page_title': 'لیست تمام بیماران',
+        'search_query': query or ''
+    }
+    return render(request, 'booking/patient_list.html', context)
+
+
+@login_required
+def daily_patients(request, date=None):
+    """
+    نمایش و مدیریت لیست بیماران امروز.
+    """
+    doctor_profile = request.clinic.doctor
+    if not doctor_profile:
+        return redirect('booking:doctor_list')
+
+    if date:
+        try:
+            current_date = datetime.datetime.strptime(date, '%Y-%m-%d').date()
+        except ValueError:
+            current_date = datetime.date.today()
+    else:
+        current_date = datetime.date.today()
+
+    can_edit = request.user.user_type == 'DOCTOR' or current_date >= datetime.date.today()
+
+    AppointmentFormSet = modelformset_factory(Appointment, form=AppointmentUpdateForm, extra=0)
+
+    queryset = Appointment.objects.filter(
+        doctor=doctor_profile, appointment_datetime__date=current_date,   status__in=[1, 2]
+    ).order_by('appointment_datetime')
+
+    if request.method == 'POST':
+        if not can_edit:
+            if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+                return JsonResponse({'success': False, 'errors': 'Unauthorized'}, status=403)
+            return redirect('booking:daily_patients', date=date)
+
+        formset = AppointmentFormSet(request.POST, queryset=queryset)
+        if formset.is_valid():
+            appointments = formset.save(commit=False)
+            paid_fees = {}
+            for appointment in appointments:
+                # Update status based on payment method
+                if appointment.payment_method and appointment.payment_method >= 1:
+                    appointment.status = 2
+                else:
+                    appointment.status = 1
+                appointment.save()
+
+                # The fee paid becomes the fee of the insurance type
+                if appointment.visit_fee_paid is not None:
+                    paid_fees[appointment.insurance_type] = appointment.visit_fee_paid
+            fees.set_fees(doctor_profile.pk, paid_fees)
+
+            if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+                return JsonResponse({'success': True})
+            return redirect('booking:daily_patients', date=date)
+        else: # Note the 'else' instead of 'elif'
+            if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+                # Handle formset errors for AJAX requests
+                return JsonResponse({'success': False, 'errors': formset.errors})
+    else:
+        # Pre-fill visit fee based on insurance
+        insurance_fees = request.clinic.insurance_fees
+        for appointment in queryset:
+            if not appointment.visit_fee_paid:
+                appointment.visit_fee_paid = insurance_fees.get(appointment.insurance_type)
+
+            # Fetch history only for doctors
+            if request.user.user_type == 'DOCTOR' and appointment.patient_national_id:
+                appointment.history = Appointment.objects.filter(
+                    doctor=doctor_profile,
+                    patient_national_id=appointment.patient_national_id,
+                    appointment_datetime__lt=appointment.appointment_datetime,
+                    status=2  # Only completed visits
+                ).order_by('-appointment_datetime').values(
+                    'appointment_datetime',
+                    'problem_description'
+                )[:10]
+            else:
+                appointment.history = []
+
+        formset = AppointmentFormSet(queryset=queryset)
+        if not can_edit:
+            for form in formset:
+                form.fields['insurance_type'].widget.attrs['disabled'] = True
+                form.fields['visit_fee_paid'].widget.attrs['disabled'] = True
+                form.fields['service_description'].widget.attrs['disabled'] = True
+                form.fields['payment_method'].widget.attrs['disabled'] = True
+
+    context = {
+        'formset': formset,
+        'today': current_date,
+        'page_title': 'لیست بیماران امروز',
+        'can_edit': can_edit
+    }
+
+    if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+        return render(request, 'booking/daily_patients_content.html', context)
+    return render(request, 'booking/daily_patients.html', context)
+
+
+@login_required
+def secretary_payments(request, date=None):
+    """
+    نمایش و ثبت هزینه‌های روزانه منشی.
+    """
+    doctor_profile = request.clinic.doctor
+    if not doctor_profile:
+        return redirect('booking:doctor_list')
+
+    if date:
+        try:
+            current_date = datetime.datetime.strptime(date, '%Y-%m-%d').date()
+        except ValueError:
+            current_date = datetime.date.today()
+    else:
+        current_date = datetime.date.today()
+
+    can_edit = request.user.user_type == 'DOCTOR' or current_date >= datetime.date.today()
+
+    if request.method == 'POST':
+        if not can_edit:
+            if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+                return JsonResponse({'success': False, 'errors': 'Unauthorized'}, status=403)
+            return redirect('booking:secretary_payments', date=date)
+
+        expense_form = DailyExpenseForm(request.POST)
+        if expense_form.is_valid():
+            expense = expense_form.save(commit=False)
+            expense.doctor = doctor_profile
+            expense.date = current_date
+            expense.save()
+            if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+                return JsonResponse({
+                    'success': True,
+                    'description': expense.description,
+                    'amount': expense.amount
+                })
+            return redirect('booking:secretary_payments', date=date)
+        elif request.headers.get('x-requested-with') == 'XMLHttpRequest':
+            return JsonResponse({'success': False, 'errors': expense_form.errors})
+
+    expense_form = DailyExpenseForm()
+    daily_expenses = DailyExpense.objects.filter(doctor=doctor_profile, date=current_date)
+
+    # Calculate previous day's balance
+    yesterday = current_date - datetime.timedelta(days=1)
+    previous_cash_income = Appointment.objects.filter(
+        doctor=doctor_profile,
+        appointment_datetime__date__lte=yesterday,
+        payment_method=2,  # نقدی
+        visit_fee_paid__isnull=False
+    ).aggregate(total=Sum('visit_fee_paid'))['total'] or 0
+    previous_expenses_and_payments = DailyExpense.objects.filter(
+        doctor=doctor_profile,
+        date__lte=yesterday
+    ).aggregate(total=Sum('amount'))['total'] or 0
+    previous_day_balance = previous_cash_income - previous_expenses_and_payments
+
+  # Calculate today's cash income
+    todays_cash_income = Appointment.objects.filter(
+        doctor=doctor_profile,
+        appointment_datetime__date=current_date,
+        payment_method=2,  # نقدی
+        visit_fee_paid__isnull=False
+    ).aggregate(total=Sum('visit_fee_paid'))['total'] or 0
+
+    # Calculate current secretary cash box balance
+    total_cash_income_lte = Appointment.objects.filter(
+        doctor=doctor_profile,
+        appointment_datetime__date__lte=current_date,
+        payment_method=2,  # نقدی
+        visit_fee_paid__isnull=False
+    ).aggregate(total=Sum('visit_fee_paid'))['total'] or 0
+
+    total_expenses_and_payments = DailyExpense.objects.filter(
+        doctor=doctor_profile,
+        date__lte=current_date
+    ).aggregate(total=Sum('amount'))['total'] or 0
+
+    cash_box_balance = total_cash_income_lte - total_expenses_and_payments
+
+    context = {
+        'expense_form': expense_form,
+        'daily_expenses': daily_expenses,
+        'today': current_date,
+        'page_title': 'پرداخت‌های منشی',
+        'cash_box_balance': cash_box_balance,
+        'previous_day_balance': previous_day_balance,
+        'todays_cash_income':todays_cash_income,
+        'can_edit': can_edit,
+    }
+
+    if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+        return render(request, 'booking/secretary_payments_content.html', context)
+    return render(request, 'booking/secretary_payments.html', context)
+
+
+@login_required
+def reservation_list(request):
+    """
+    Displays a list of all future reserved appointments for the doctor/secretary.
+    """
+    doctor_profile = request.clinic.doctor
+    if not doctor_profile:
+        return redirect('booking:doctor_list')
+
+    today = datetime.date.today()
+    reservations_qs = Appointment.objects.filter(
+        doctor=doctor_profile,
+        status=1,
+        appointment_datetime__gte=today
+    ).order_by('appointment_datetime')
+
+    colors = ["#E0FFFF", "#FFFACD", "#FFE4E1", "#F0FFF0", "#F0F8FF", "#E6E6FA", "#FAFAD2"]
+    grouped_reservations = []
+
+    # Pre-process to add a 'date' attribute for grouping
+    reservations_list = []
+    for r in reservations_qs:
+        r.date = r.appointment_datetime.date()
+        reservations_list.append(r)
+
+    for i, (date, group) in enumerate(groupby(reservations_list, key=attrgetter('date'))):
+        group_list = list(group)
+        color = colors[i % len(colors)]
+        grouped_reservations.append({
+            'date': date,
+            'reservations': group_list,
+            'color': color
+        })
+
+    context = {
+        'grouped_reservations': grouped_reservations,
+        'page_title': 'لیست رزروها'
+    }
+    return render(request, 'booking/reservation_list.html', context)
+
+
+async def clinic_events(request):
+    """
+    رویدادهای نوبت‌های پزشک (نوبت جدید، پرداخت، لغو، ویزیت) به صورت server-sent events
+    برای لیست روزانه، لیست رزروها و صفحه سالن انتظار.
+    """
+    user = await request.auser()
+    if not user.is_authenticated:
+        return HttpResponse(status=401)
+    doctor_profile = await sync_to_async(lambda: request.clinic.doctor)()
+    if not doctor_profile:
+        return HttpResponse(status=403)
+
+    last_id = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+    try:
+        last_id = int(last_id)
+    except (TypeError, ValueError):
+        last_id = await sync_to_async(events.latest_id)(doctor_profile.pk)
+
+    if settings.ASGI_SERVER:
+        response = StreamingHttpResponse(events.stream(doctor_profile.pk, last_id), content_type='text/event-stream')
+    else:
+        # Under WSGI the stream would hold a worker for minutes: answer with
+        # what is pending and let EventSource reconnect to poll.
+        response = HttpResponse(await sync_to_async(events.pending)(doctor_profile.pk, last_id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@login_required
+def waiting_room(request):
+    """
+    صفحه نمایش سالن انتظار: نوبت‌های امروز و بیمار بعدی، که با رویدادهای مطب به‌روز می‌شود.
+    """
+    doctor_profile = request.clinic.doctor
+    if not doctor_profile:
+        return redirect('booking:doctor_list')
+
+    today = timezone.localdate()
+    appointments = list(Appointment.objects.filter(
+        doctor=doctor_profile, appointment_datetime__date=today, status__in=[1, 2],
+    ).order_by('appointment_datetime'))
+    for appointment in appointments:
+        # Only the first name is shown on the public screen.
+        appointment.display_name = appointment.patient_name.split()[0] if appointment.patient_name.strip() else ''
+    next_appointment = next((appointment for appointment in appointments if appointment.status == 1), None)
+
+    context = {
+        'appointments': appointments,
+        'next_appointment': next_appointment,
+        'today': today,
+        'page_title': 'سالن انتظار',
+    }
+    if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+        return render(request, 'booking/waiting_room_content.html', context)
+    return render(request, 'booking/waiting_room.html', context)
+
+
+@login_required
+@require_POST
+def cancel_reservation(request, pk):
+    """
+    Cancels a reservation.
+    """
+    doctor_profile = request.clinic.doctor
+    if not doctor_profile:
+        return redirect('booking:doctor_list')
+
+    reservation = get_object_or_404(Appointment, pk=pk, doctor=doctor_profile)
+    reservation.delete()
+
+    return redirect('booking:reservation_list')
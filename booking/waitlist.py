@@ -0,0 +1,192 @@
+"""
+Waitlist.
+
+When a future slot is freed (an appointment is cancelled or deleted, or an
+unpaid hold expires) ``release`` offers it to the waiting entry of the
+doctor that covers its date and shift and has waited longest. The offer
+holds the slot as an appointment awaiting payment. ``manage.py
+expire_holds`` texts the patients their links to pay, in one batch off the
+request that freed the slot, and from then on holds the slot for
+``WAITLIST_OFFER_MINUTES``; it also expires the offers and unpaid holds
+that have run out, which frees their slots for the next entry. Without
+``AMOOT_WAITLIST_PATTERN_ID`` no offer could be texted, so none is made.
+
+The match is one query over a partial index of the waiting entries of the
+doctor in the order they joined, so it stays cheap however long the list
+of a popular doctor grows; the finished entries are left out of the index.
+"""
+import datetime
+import logging
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.sites.models import Site
+from django.core import signing
+from django.db import transaction
+from django.db.models import Q
+from django.urls import reverse
+from django.utils import timezone
+
+from . import gateways, jalali, schedule
+from .models import Appointment, DoctorProfile, WaitlistEntry
+
+OFFER_SALT = 'booking.waitlist.offer'
+
+logger = logging.getLogger('booking')
+sms_logger = logging.getLogger('booking.sms')
+
+
+def next_entry(doctor_id, day, shift):
+    """The entry that has waited longest for a slot of ``doctor_id`` on ``day`` in ``shift``."""
+    return WaitlistEntry.objects.filter(
+        doctor_id=doctor_id, status='waiting', date_from__lte=day, date_to__gte=day, shift__in=[shift, ''],
+    ).order_by('created_at').first()
+
+
+def free_shift(doctor, slot):
+    """The shift ``slot`` belongs to if it is a free appointment time of ``doctor``, else None."""
+    day = timezone.localtime(slot).date()
+    shifts, slots = schedule.day_slots(doctor, day)
+    if not any(item['time'] == slot and item['status'] == 'available' for item in slots):
+        return None
+    for shift in shifts:
+        if slot in schedule.shift_slots(shift, day):
+            return shift.shift
+    return None
+
+
+def release(doctor_id, slot):
+    """
+    Offers a freed slot to the waitlist of the doctor; ``send_offers`` texts
+    the offer. Returns the entry it was offered to, or None if the slot is
+    past or taken, nobody waits for it or offers cannot be texted.
+    """
+    if slot <= timezone.now() or not settings.AMOOT_WAITLIST_PATTERN_ID:
+        return None
+    # Most doctors have no waitlist; this is answered from the index alone.
+    if not WaitlistEntry.objects.filter(doctor_id=doctor_id, status='waiting').exists():
+        return None
+    doctor = DoctorProfile.objects.filter(pk=doctor_id).first()
+    shift = free_shift(doctor, slot) if doctor is not None else None
+    if shift is None:
+        return None
+
+    with transaction.atomic():
+        entry = next_entry(doctor_id, timezone.localtime(slot).date(), shift)
+        if entry is None:
+            return None
+        # Taken by the same check as a booking; another release of the slot may have won.
+        if Appointment.objects.filter(doctor_id=doctor_id, appointment_datetime=slot, status__in=schedule.BOOKED_STATUSES).exists():
+            return None
+        claimed = WaitlistEntry.objects.filter(pk=entry.pk, status='waiting').update(status='offered')
+        if not claimed:
+            return None
+        entry.appointment = Appointment.objects.create(
+            doctor=doctor, patient=entry.patient, appointment_datetime=slot, patient_name=entry.patient_name,
+            patient_phone=entry.patient_phone, insurance_type=entry.insurance_type, status=4,
+        )
+        entry.status = 'offered'
+        # The offer runs out only once it has been texted, see send_offers.
+        entry.save(update_fields=['appointment'])
+    logger.info('Slot offered to waitlist entry %s', entry.pk, extra={'doctor_id': doctor_id, 'appointment_id': entry.appointment.pk})
+    return entry
+
+
+def queue_release(doctor_id, slot):
+    """Offers a freed slot to the waitlist once the current transaction commits."""
+    if slot > timezone.now():
+        # An SMS failure must not fail the cancellation that freed the slot.
+        transaction.on_commit(lambda: release(doctor_id, slot), robust=True)
+
+
+def offer_token(entry):
+    return signing.dumps(entry.pk, salt=OFFER_SALT, compress=True)
+
+
+def offer_from_token(token):
+    """The entry of an offer link if the offer still stands, else None."""
+    try:
+        pk = signing.loads(token, salt=OFFER_SALT, max_age=settings.WAITLIST_OFFER_MINUTES * 60)
+    except signing.BadSignature:
+        return None
+    return WaitlistEntry.objects.filter(
+        pk=pk, status='offered', offer_expires_at__gt=timezone.now(), appointment__status=4,
+    ).select_related('appointment').first()
+
+
+def _offer_values(entry, domain):
+    link = f"https://{domain}{reverse('booking:waitlist_offer', args=[offer_token(entry)])}"
+    formatted_time = jalali.format_date(jalali.localtime(entry.appointment.appointment_datetime), '%Y/%m/%d ساعت %H:%M')
+    return f"{entry.patient_name},{entry.doctor.user.get_full_name()},{formatted_time},{settings.WAITLIST_OFFER_MINUTES},{link}"
+
+
+def send_offers():
+    """
+    Texts the offers not sent yet, in one batch over the pooled HTTP client.
+    The offer window starts when its text goes out; offers that could not be
+    sent are tried again on the next run. Returns ``(sent, failed)``.
+    """
+    entries = list(WaitlistEntry.objects.filter(
+        status='offered', offer_sent_at__isnull=True,
+    ).select_related('doctor__user', 'appointment'))
+    if not entries:
+        return 0, 0
+    pattern_code = settings.AMOOT_WAITLIST_PATTERN_ID
+    if not pattern_code:
+        sms_logger.warning('AMOOT_WAITLIST_PATTERN_ID is not set; %s waitlist offers were not texted', len(entries))
+        return 0, 0
+
+    domain = Site.objects.get_current().domain
+    outcomes = async_to_sync(gateways.asend_sms_batch)(
+        [(entry.patient_phone, _offer_values(entry, domain)) for entry in entries], pattern_code,
+    )
+    sent = []
+    for entry, (outcome, detail) in zip(entries, outcomes):
+        if outcome == 'sent':
+            sent.append(entry.pk)
+        else:
+            sms_logger.error('Waitlist offer %s could not be sent: %s %s', entry.pk, outcome, detail)
+    now = timezone.now()
+    WaitlistEntry.objects.filter(pk__in=sent, status='offered').update(
+        offer_sent_at=now, offer_expires_at=now + datetime.timedelta(minutes=settings.WAITLIST_OFFER_MINUTES),
+    )
+    return len(sent), len(entries) - len(sent)
+
+
+def mark_booked(appointment):
+    """
+    Closes the offer an appointment was made for once it is paid, also if the
+    offer ran out while its payment was under way.
+    """
+    WaitlistEntry.objects.filter(appointment=appointment, status__in=['offered', 'expired']).update(status='booked')
+
+
+def expire_holds(now=None):
+    """
+    Expires the waiting entries whose window has passed, the offers that
+    have run out and the holds left unpaid for ``PAYMENT_HOLD_MINUTES``;
+    cancelling a hold offers its slot on. Returns how many of each. An
+    offer not texted yet has no expiry and is left for ``send_offers``.
+
+    A hold is counted from its latest payment order, not from the booking,
+    and one whose payment started within ``PAYMENT_HOLD_MINUTES`` is left
+    alone even if its offer ran out: the patient may be at the bank.
+    """
+    now = now or timezone.now()
+    stale = WaitlistEntry.objects.filter(status='waiting', date_to__lt=timezone.localdate(now)).update(status='expired')
+
+    offers = dict(WaitlistEntry.objects.filter(status='offered', offer_expires_at__lte=now).values_list('pk', 'appointment_id'))
+    WaitlistEntry.objects.filter(pk__in=offers, status='offered').update(status='expired')
+
+    cutoff = now - datetime.timedelta(minutes=settings.PAYMENT_HOLD_MINUTES)
+    paying = Q(payment_started_at__gte=cutoff)
+    holds = Appointment.objects.filter(status=4, created_at__lt=cutoff).exclude(paying).exclude(waitlist_offers__status='offered')
+    expired_offers = Appointment.objects.filter(status=4, pk__in=[pk for pk in offers.values() if pk]).exclude(paying)
+    count = 0
+    with transaction.atomic():
+        # Saved one by one so the signals refresh the slot index and release the slots.
+        for appointment in (holds | expired_offers).select_for_update():
+            appointment.status = 3
+            appointment.save(update_fields=['status'])
+            count += 1
+    return {'stale': stale, 'offers': len(offers), 'holds': count}
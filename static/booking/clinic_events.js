@@ -0,0 +1,26 @@
+// Subscribes the page to the clinic event stream (server-sent events) of the
+// doctor. Pages register handlers with window.onClinicEvent; each receives the
+// event data ({kind, appointment_id, date, time, patient_name, status}).
+// EventSource reconnects on its own and resumes after the last event it got.
+(function() {
+    const url = document.currentScript.dataset.eventsUrl;
+    const handlers = [];
+    window.onClinicEvent = function(handler) {
+        handlers.push(handler);
+    };
+    if (!url || !window.EventSource) return;
+
+    const source = new EventSource(url);
+    ['booked', 'paid', 'canceled', 'visited'].forEach(function(kind) {
+        source.addEventListener(kind, function(e) {
+            const data = JSON.parse(e.data);
+            handlers.forEach(function(handler) {
+                try {
+                    handler(data);
+                } catch (error) {
+                    console.error('Clinic event handler error:', error);
+                }
+            });
+        });
+    });
+})();
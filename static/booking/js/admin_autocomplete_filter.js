@@ -0,0 +1,17 @@
+// Applies the autocomplete filters of the admin changelists (see
+// booking.admin.AutocompleteFilter) as soon as an option is picked or cleared.
+'use strict';
+{
+    const $ = django.jQuery;
+
+    $(document).on('change', 'select.admin-autocomplete-filter', function() {
+        const url = new URL(window.location.href);
+        url.searchParams.delete('p');
+        if (this.value) {
+            url.searchParams.set(this.dataset.parameter, this.value);
+        } else {
+            url.searchParams.delete(this.dataset.parameter);
+        }
+        window.location.href = url.toString();
+    });
+}
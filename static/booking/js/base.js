@@ -0,0 +1,169 @@
+// Date navigation of the staff pages (daily patients, payments, financial
+// report, secretary calendar): loads the content of another day over AJAX.
+// The page URLs come from the data attributes of the script tag in base.html.
+const pageUrls = document.currentScript.dataset;
+
+document.addEventListener('DOMContentLoaded', function() {
+    window.userDate = null;
+    let pageConfig = {};
+
+    function getActivePage() {
+        if (document.getElementById('daily-patients-container')) {
+            return {
+                name: 'daily_patients',
+                containerId: 'daily-patients-container',
+                url: pageUrls.dailyPatientsUrl
+            };
+        }
+        if (document.getElementById('secretary-payments-container')) {
+            return {
+                name: 'secretary_payments',
+                containerId: 'secretary-payments-container',
+                url: pageUrls.secretaryPaymentsUrl
+            };
+        }
+        if (document.getElementById('financial-report-container')) {
+            return {
+                name: 'financial_report',
+                containerId: 'financial-report-container',
+                url: "/financial-report/__period__/0000-00-00/"
+            };
+        }
+        if (document.getElementById('secretary-panel-container')) {
+            return {
+                name: 'secretary_panel',
+                containerId: 'secretary-panel-container',
+                url: pageUrls.secretaryPanelUrl
+            };
+        }
+        return null;
+    }
+
+    function initializeDate() {
+        const activePage = getActivePage();
+        if (!activePage) return;
+
+        const container = document.getElementById(activePage.containerId);
+        const initialDateEl = container.querySelector('#dynamic-content');
+        const initialDateStr = initialDateEl ? initialDateEl.getAttribute('data-current-date') : null;
+
+        let initialDate;
+        const dateRegex = /^\d{4}-\d{2}-\d{2}$/;
+
+        if (initialDateStr && dateRegex.test(initialDateStr)) {
+            // Server has rendered a specific, valid-looking date. This is the source of truth.
+            const parts = initialDateStr.split('-');
+            initialDate = new Date(parts[0], parts[1] - 1, parts[2]);
+            window.userDate = initialDate;
+            localStorage.setItem('userDate', initialDateStr);
+            // The crucial part: DO NOT re-fetch. The content is already correct.
+        } else {
+            // No specific/valid date from server. Try localStorage, then default to now.
+            const savedDate = localStorage.getItem('userDate');
+            initialDate = savedDate ? new Date(savedDate) : new Date();
+            window.userDate = initialDate;
+            // The server rendered a default view, so we fetch the content for our target date.
+            updateContentForDate(userDate, false);
+        }
+    }
+
+    window.updateContentForDate = async function(date, pushState = true) {
+        const activePage = getActivePage();
+        if (!activePage) return;
+
+        if (activePage.name === 'daily_patients' && typeof window.saveDailyPatientsForm === 'function') {
+            try {
+                await window.saveDailyPatientsForm();
+            } catch (error) {
+                console.error("Failed to save before navigating:", error);
+                // Optional: ask user for confirmation to navigate without saving
+                if (!confirm("تغییرات ذخیره نشد. آیا میخواهید ادامه دهید؟")) {
+                    return; // Stop navigation
+                }
+            }
+        }
+
+        const urlDate = date.toISOString().split('T')[0];
+        localStorage.setItem('userDate', urlDate);
+
+        let targetUrl = activePage.url.replace('0000-00-00', urlDate);
+        const container = document.getElementById(activePage.containerId);
+
+        if (activePage.name === 'financial_report') {
+            const dynamicContent = container.querySelector('#dynamic-content');
+            const period = dynamicContent ? dynamicContent.getAttribute('data-current-period') : 'daily';
+            targetUrl = targetUrl.replace('__period__', period);
+        }
+
+        if (activePage.name === 'secretary_panel' && typeof window.loadSecretaryCalendar === 'function') {
+            try {
+                await window.loadSecretaryCalendar(urlDate);
+                if (pushState) {
+                    history.pushState({ path: targetUrl }, '', targetUrl);
+                }
+                return;
+            } catch (error) {
+                console.error('Calendar fetch error:', error);
+            }
+        }
+
+        try {
+            container.style.opacity = '0.5';
+            const response = await fetch(targetUrl, {
+                headers: { 'X-Requested-With': 'XMLHttpRequest' }
+            });
+            if (!response.ok) throw new Error('Server response not OK');
+            const html = await response.text();
+            if (pushState) {
+                history.pushState({ path: targetUrl }, '', targetUrl);
+            }
+            container.innerHTML = html;
+            if (activePage.name === 'daily_patients' && typeof initializeDailyPatientsListeners === 'function') {
+                initializeDailyPatientsListeners();
+            }
+        } catch (error) {
+            console.error('Fetch error:', error);
+            window.location.href = targetUrl;
+        } finally {
+            container.style.opacity = '1';
+        }
+    }
+
+    document.body.addEventListener('click', async function(e) {
+        const activePage = getActivePage();
+        if (!activePage) return;
+
+        const isPrev = e.target.closest('#prev-day-btn');
+        const isNext = e.target.closest('#next-day-btn');
+
+        if (isPrev || isNext) {
+            if (activePage.name === 'daily_patients' && typeof window.saveDailyPatientsForm === 'function') {
+                try {
+                    await window.saveDailyPatientsForm();
+                } catch (error) {
+                    console.error("Form save failed, but navigating anyway:", error);
+                }
+            }
+
+            if (isPrev) {
+                userDate.setDate(userDate.getDate() - 1);
+            } else {
+                userDate.setDate(userDate.getDate() + 1);
+            }
+            updateContentForDate(userDate);
+        }
+    });
+
+    window.addEventListener('popstate', (event) => {
+        if (event.state && event.state.path) {
+            const url = new URL(event.state.path, window.location.origin);
+            const dateFromPath = url.pathname.split('/').filter(Boolean).pop();
+            if (dateFromPath) {
+                userDate = new Date(dateFromPath);
+                updateContentForDate(userDate, false);
+            }
+        }
+    });
+
+    initializeDate();
+});
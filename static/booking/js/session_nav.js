@@ -0,0 +1,18 @@
+// Public pages are cached and served to everyone with the visitor nav. Once
+// the page has loaded, the login state is asked for separately and doctors and
+// secretaries get their own nav swapped in.
+(function() {
+    const nav = document.getElementById('site-nav');
+    if (!nav || !nav.dataset.sessionUrl) return;
+
+    fetch(nav.dataset.sessionUrl, { credentials: 'same-origin', headers: { 'Accept': 'application/json' } })
+        .then(function(response) { return response.ok ? response.json() : null; })
+        .then(function(status) {
+            if (status && status.nav) {
+                nav.innerHTML = status.nav;
+            }
+        })
+        .catch(function(error) {
+            console.error('Could not load the login state:', error);
+        });
+})();
@@ -0,0 +1,64 @@
+// Renders the secretary calendar grid from the JSON calendar endpoint.
+// Responses are kept per URL with their ETag, so revisiting a window the
+// server reports unchanged (304) redraws from memory without a new payload.
+(function() {
+    const calendarCache = new Map();
+
+    function dayCell(day) {
+        const cell = document.createElement('a');
+        cell.href = day.manage_url;
+        cell.className = 'day-cell ' + (day.closed ? 'closed' : 'available');
+        cell.style.cssText = 'border-radius: 5px; padding: 20px; text-align: center; flex: 1 1 150px; min-width: 150px;';
+        if (day.closed) {
+            cell.style.background = '#e9ecef';
+            cell.style.border = '2px solid #adb5bd';
+        } else {
+            const percentage = day.booked_percentage;
+            cell.style.background = `linear-gradient(to top, #f8d7da ${percentage}%, white ${percentage}%)`;
+            cell.style.border = '2px solid #007bff';
+        }
+
+        const name = document.createElement('span');
+        name.className = 'day-name';
+        name.textContent = day.weekday;
+        const date = document.createElement('span');
+        date.className = 'jalali-date';
+        date.textContent = day.label;
+        cell.append(name, document.createElement('br'), date);
+        if (day.closed) {
+            const closed = document.createElement('span');
+            closed.className = 'day-closed';
+            closed.textContent = 'تعطیل';
+            cell.append(document.createElement('br'), closed);
+        }
+        return cell;
+    }
+
+    function render(data) {
+        const grid = document.getElementById('calendar-grid');
+        grid.replaceChildren(...data.days.map(dayCell));
+        document.getElementById('date-display').textContent = data.start_display;
+        document.getElementById('dynamic-content').setAttribute('data-current-date', data.start);
+    }
+
+    window.loadSecretaryCalendar = async function(isoDate) {
+        const grid = document.getElementById('calendar-grid');
+        if (!grid) throw new Error('Calendar grid not found');
+
+        const url = `${grid.dataset.calendarUrl}?start=${isoDate}`;
+        const cached = calendarCache.get(url);
+        const headers = { 'X-Requested-With': 'XMLHttpRequest' };
+        if (cached) headers['If-None-Match'] = cached.etag;
+
+        const response = await fetch(url, { headers: headers, cache: 'no-store' });
+        if (response.status === 304 && cached) {
+            render(cached.data);
+            return;
+        }
+        if (!response.ok) throw new Error('Server response not OK');
+        const data = await response.json();
+        const etag = response.headers.get('ETag');
+        if (etag) calendarCache.set(url, { etag: etag, data: data });
+        render(data);
+    };
+})();